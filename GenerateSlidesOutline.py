@@ -1,14 +1,18 @@
 import os
 import re
+import io
 import base64
+import asyncio
+import hashlib
 import argparse
 from pathlib import Path
 import pptx
 from pptx.util import Inches
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 import logging
 import dotenv
-from typing import List, Dict, Any, Optional
+from PIL import Image
+from typing import List, Dict, Any, Optional, Tuple
 
 # Load environment variables
 dotenv.load_dotenv()
@@ -35,6 +39,24 @@ def parse_arguments():
                         help='Output PowerPoint file name (default: Generated_Slides.pptx)')
     parser.add_argument('--api-key', type=str, 
                         help='API key (default: read from environment variables)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Re-parse the PDF instead of reusing a cached MinerU result')
+    parser.add_argument('--llm-model', type=str, default=os.environ.get("LLM_MODEL", "gpt-4.1"),
+                        help='Name of the chat model (default: LLM_MODEL environment variable or gpt-4.1)')
+    parser.add_argument('--base-url', type=str, default=os.environ.get("OPENAI_BASE_URL"),
+                        help='Base URL of an OpenAI-compatible API, e.g. a local stub server '
+                             '(default: OPENAI_BASE_URL environment variable)')
+    parser.add_argument('--mode', type=str, default='single', choices=['single', 'map-reduce'],
+                        help='single: one request with the whole paper; map-reduce: draft the slides of '
+                             'each section concurrently, then merge them (default: single)')
+    parser.add_argument('--max-concurrency', type=int, default=4,
+                        help='Maximum number of concurrent LLM requests in map-reduce mode (default: 4)')
+    parser.add_argument('--max-section-chars', type=int, default=12000,
+                        help='Maximum characters of paper text per request in map-reduce mode (default: 12000)')
+    parser.add_argument('--image-max-side', type=int, default=1024,
+                        help='Images sent to the LLM are downscaled to this longest side in pixels (default: 1024)')
+    parser.add_argument('--image-format', type=str, default='jpeg', choices=['jpeg', 'webp'],
+                        help='Format the images are re-encoded to before upload (default: jpeg)')
     return parser.parse_args()
 
 def setup_api_keys(args):
@@ -42,6 +64,9 @@ def setup_api_keys(args):
     # If API key is provided via command line, use it
     if args.api_key:
         os.environ["OPENAI_API_KEY"] = args.api_key
+    # A local OpenAI-compatible server usually does not check the key
+    elif args.base_url and not os.environ.get("OPENAI_API_KEY"):
+        os.environ["OPENAI_API_KEY"] = "local"
     # Otherwise check environment variables
     elif not os.environ.get("OPENAI_API_KEY"):
         # Loading from .env file is already done
@@ -76,43 +101,103 @@ def extract_image_paths(md_text: str) -> List[str]:
     """
     return re.findall(r'!\[.*?\]\((.*?)\)', md_text)
 
-def encode_image(image_path: str) -> str:
+IMAGE_CACHE_DIR = Path("output") / ".image_cache"
+IMAGE_QUALITY = 85
+
+def dedupe_image_paths(image_paths: List[str], pdf_base_name: str) -> Tuple[List[str], Dict[str, int]]:
     """
-    Encode image to base64
+    Remove the images whose content is the same as an earlier one, e.g. a figure repeated on several pages
+    
+    Args:
+        image_paths: List of image paths, in the order of the Markdown text
+        pdf_base_name: PDF file base name
+        
+    Returns:
+        The unique image paths, and the number n of "[Image n]" of every image path, duplicates share
+        the number of the first one
+    """
+    unique_paths = []
+    numbers = {}
+    number_by_digest = {}
+    for image_path in image_paths:
+        if image_path in numbers:
+            continue
+        full_image_path = Path("output") / pdf_base_name / "auto" / image_path
+        try:
+            digest = hashlib.sha256(full_image_path.read_bytes()).hexdigest()
+        except OSError as e:
+            logger.error(f"Error reading image {full_image_path}: {e}")
+            digest = image_path
+        if digest not in number_by_digest:
+            unique_paths.append(image_path)
+            number_by_digest[digest] = len(unique_paths)
+        numbers[image_path] = number_by_digest[digest]
+    return unique_paths, numbers
+
+def encode_image_for_llm(image_path: str, max_side: int = 1024, image_format: str = "jpeg") -> Tuple[str, str]:
+    """
+    Downscale and re-encode an image to a compact form, the result is cached on disk by content hash
     
     Args:
         image_path: Path to the image
+        max_side: Longest side of the encoded image in pixels
+        image_format: jpeg or webp
         
     Returns:
-        Base64-encoded image
+        MIME type and base64-encoded image, empty strings on error
     """
     try:
         with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+            data = image_file.read()
+        key = hashlib.sha256(data).hexdigest()
+        cache_path = IMAGE_CACHE_DIR / f"{key}_{max_side}_{IMAGE_QUALITY}.{image_format}"
+        if cache_path.exists():
+            encoded = cache_path.read_bytes()
+        else:
+            with Image.open(io.BytesIO(data)) as image:
+                image.load()
+                if image_format == "jpeg" and image.mode != "RGB":
+                    image = image.convert("RGB")
+                elif image.mode not in ("RGB", "RGBA"):
+                    image = image.convert("RGBA")
+                image.thumbnail((max_side, max_side))
+                buffer = io.BytesIO()
+                image.save(buffer, format=image_format.upper(), quality=IMAGE_QUALITY)
+            encoded = buffer.getvalue()
+            IMAGE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            cache_path.write_bytes(encoded)
+        return f"image/{image_format}", base64.b64encode(encoded).decode('utf-8')
     except Exception as e:
         logger.error(f"Error encoding image {image_path}: {e}")
-        return ""
+        return "", ""
 
-def prepare_image_messages(image_paths: List[str], pdf_base_name: str) -> List[Dict[str, Any]]:
+def prepare_image_messages(image_paths: List[str], pdf_base_name: str, numbers: Optional[List[int]] = None,
+                           max_side: int = 1024, image_format: str = "jpeg") -> List[Dict[str, Any]]:
     """
-    Prepare messages with base64-encoded images
+    Prepare messages with base64-encoded images, each preceded by its label "[Image n]"
     
     Args:
         image_paths: List of image paths
         pdf_base_name: PDF file base name
+        numbers: The number n of each image, defaults to its position from 1
+        max_side: Longest side of the images in pixels
+        image_format: Format the images are re-encoded to, jpeg or webp
         
     Returns:
         List of messages with images
     """
+    if numbers is None:
+        numbers = list(range(1, len(image_paths) + 1))
     image_messages = []
-    for image_path in image_paths:
+    for image_path, number in zip(image_paths, numbers):
         full_image_path = str(Path("output") / pdf_base_name / "auto" / image_path)
-        base64_image = encode_image(full_image_path)
+        mime_type, base64_image = encode_image_for_llm(full_image_path, max_side, image_format)
         if base64_image:
+            image_messages.append({"type": "text", "text": f"[Image {number}]"})
             image_messages.append({
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/jpeg;base64,{base64_image}",
+                    "url": f"data:{mime_type};base64,{base64_image}",
                 }
             })
     return image_messages
@@ -134,18 +219,25 @@ def load_prompt_template(template_path: str) -> str:
         logger.error(f"Error loading prompt template {template_path}: {e}")
         raise
 
-def get_openai_client(model_name: str, api_key: str) -> Any:
+def get_openai_client(model_name: str, api_key: str, base_url: Optional[str] = None) -> Any:
     """
     Get LLM client
     
     Args:
         model_name: Model name
         api_key: API key
+        base_url: Base URL of an OpenAI-compatible API, None for OpenAI
         
     Returns:
         LLM client
     """
-    return OpenAI(api_key=api_key)
+    return OpenAI(api_key=api_key, base_url=base_url)
+
+def get_async_openai_client(model_name: str, api_key: str, base_url: Optional[str] = None) -> Any:
+    """
+    Get asyncio LLM client, used by the map-reduce generation
+    """
+    return AsyncOpenAI(api_key=api_key, base_url=base_url)
 
 def get_gemini_client(model_name: str, api_key: str) -> Any:
     """
@@ -189,11 +281,143 @@ def generate_outline(client: Any, md_text: str, image_messages: List[Dict[str, A
     
 
     response = client.chat.completions.create(
-        model="gpt-4.1",
+        model=model_name,
         messages=messages
     )
     return response.choices[0].message.content
 
+def split_markdown_sections(md_text: str, max_chars: int = 12000) -> List[str]:
+    """
+    Split Markdown text into parts of whole sections, each at most max_chars long when possible
+    
+    Args:
+        md_text: Markdown text
+        max_chars: Maximum length of a part; a longer section is split between its paragraphs
+        
+    Returns:
+        List of parts, in the order of the text
+    """
+    # Split at the headings
+    sections = []
+    current = []
+    for line in md_text.splitlines(keepends=True):
+        if re.match(r'#{1,6}\s', line) and any(l.strip() for l in current):
+            sections.append(''.join(current))
+            current = []
+        current.append(line)
+    if any(l.strip() for l in current):
+        sections.append(''.join(current))
+
+    # Split the sections which are too long between their paragraphs
+    pieces = []
+    for section in sections:
+        if len(section) <= max_chars:
+            pieces.append(section)
+            continue
+        piece = ''
+        for paragraph in re.split(r'(?<=\n\n)', section):
+            if piece and len(piece) + len(paragraph) > max_chars:
+                pieces.append(piece)
+                piece = ''
+            piece += paragraph
+        if piece:
+            pieces.append(piece)
+
+    # Merge the short sections, so that the number of requests stays small
+    parts = []
+    for piece in pieces:
+        if parts and len(parts[-1]) + len(piece) <= max_chars:
+            parts[-1] += piece
+        else:
+            parts.append(piece)
+    return parts
+
+async def draft_section_slides(client: Any, part: str, index: int, total: int,
+                               image_messages: List[Dict[str, Any]], model_name: str,
+                               semaphore: asyncio.Semaphore) -> str:
+    """
+    Draft the slides of one part of the paper using LLM
+    
+    Args:
+        client: asyncio LLM client
+        part: Markdown text of the part
+        index: Index of the part, from 1
+        total: Number of parts
+        image_messages: Messages with the images referenced by the part, each preceded by its label
+        model_name: Model name
+        semaphore: Bounds the number of concurrent requests
+        
+    Returns:
+        Drafted slides of the part
+    """
+    prompt_template = load_prompt_template("GenerateSectionSlidesPrompt.md")
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": prompt_template.format(content=part, index=index, total=total),
+                },
+            ] + image_messages,
+        }
+    ]
+    async with semaphore:
+        logger.info(f"Drafting slides of part {index}/{total}")
+        response = await client.chat.completions.create(
+            model=model_name,
+            messages=messages
+        )
+    return response.choices[0].message.content
+
+async def generate_outline_map_reduce(client: Any, md_text: str, pdf_base_name: str, model_name: str,
+                                      max_concurrency: int = 4, max_section_chars: int = 12000,
+                                      image_numbers: Optional[Dict[str, int]] = None,
+                                      max_side: int = 1024, image_format: str = "jpeg") -> str:
+    """
+    Generate presentation outline by drafting the slides of each part of the paper concurrently (map),
+    then merging the drafts into one outline (reduce). No request holds the whole paper and all its images,
+    so long papers stay within the context length.
+    
+    Args:
+        client: asyncio LLM client
+        md_text: Markdown text
+        pdf_base_name: PDF file base name
+        model_name: Model name
+        max_concurrency: Maximum number of concurrent requests
+        max_section_chars: Maximum characters of paper text per request
+        image_numbers: The number n of "[Image n]" of every image path, see dedupe_image_paths
+        max_side: Longest side of the images in pixels
+        image_format: Format the images are re-encoded to, jpeg or webp
+        
+    Returns:
+        Generated presentation outline
+    """
+    if image_numbers is None:
+        image_numbers = dedupe_image_paths(extract_image_paths(md_text), pdf_base_name)[1]
+    parts = split_markdown_sections(md_text, max_section_chars)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    tasks = []
+    for index, part in enumerate(parts, start=1):
+        # Each part is sent the images it references only, numbered as in the whole paper
+        part_images = {}
+        for image_path in extract_image_paths(part):
+            part_images.setdefault(image_numbers[image_path], image_path)
+        image_messages = prepare_image_messages(list(part_images.values()), pdf_base_name, list(part_images),
+                                                max_side, image_format)
+        tasks.append(draft_section_slides(client, part, index, len(parts), image_messages, model_name, semaphore))
+    drafts = await asyncio.gather(*tasks)
+
+    prompt_template = load_prompt_template("MergeSlidesOutlinePrompt.md")
+    content = '\n\n'.join(f"## Part {index}\n\n{draft.strip()}" for index, draft in enumerate(drafts, start=1))
+    logger.info(f"Merging the slides of {len(drafts)} parts")
+    response = await client.chat.completions.create(
+        model=model_name,
+        messages=[{"role": "user", "content": prompt_template.format(content=content)}]
+    )
+    return response.choices[0].message.content
+
 def create_ppt_from_outline(outline: str, output_file: str, image_paths: List[str], pdf_base_name: str) -> None:
     """
     Create PowerPoint presentation from outline
@@ -264,6 +488,10 @@ def display_usage_instructions():
     print("    python GenerateSlidesOutline.py --output MyPresentation.pptx")
     print("\n  Combine options:")
     print("    python GenerateSlidesOutline.py --pdf path/to/paper.pdf --output MyPresentation.pptx")
+    print("\n  Draft the slides section by section, for long papers:")
+    print("    python GenerateSlidesOutline.py --mode map-reduce --max-concurrency 4")
+    print("\n  Use a local OpenAI-compatible server:")
+    print("    python GenerateSlidesOutline.py --base-url http://127.0.0.1:8000/v1 --llm-model my-model")
     print("\nNote: Currently only the OpenAI model is implemented. To use other models,")
     print("you'll need to modify the code to include the appropriate API calls.")
     print("="*80)
@@ -288,15 +516,10 @@ def main():
     md_file_path = get_markdown_file_path(pdf_file_path, local_md_dir)
     pdf_base_name = Path(pdf_file_path).stem
     
-    # Check if Markdown file already exists
-    if os.path.exists(md_file_path):
-        logger.info(f"Markdown file already exists: {md_file_path}, skipping PDF parsing")
-    else:
-        # If not, extract PDF content using function from MinerU.py
-        logger.info(f"Markdown file does not exist, parsing PDF content...")
-        md_file_path = extract_pdf_to_markdown(pdf_file_path, local_md_dir)
-        # logger.error("PDF parsing functionality is disabled. Please uncomment the relevant code line or manually create the Markdown file.")
-        # return
+    # Parse the PDF into the directory the images are read from; results are served
+    # from the content-addressed parse cache when the same PDF and model config were seen before
+    md_file_path = extract_pdf_to_markdown(pdf_file_path, str(Path(md_file_path).parent),
+                                           use_cache=not args.no_cache)
     
     # Load the extracted markdown content
     try:
@@ -306,17 +529,27 @@ def main():
         logger.error(f"Error reading Markdown file {md_file_path}: {e}")
         return
     
-    # Extract image paths from Markdown
-    image_paths = extract_image_paths(md_text)
-    
-    # Prepare image messages
-    image_messages = prepare_image_messages(image_paths, pdf_base_name)
+    # Extract image paths from Markdown, the images with the same content are sent once
+    image_paths, image_numbers = dedupe_image_paths(extract_image_paths(md_text), pdf_base_name)
     
-    # Get LLM client, if you want to use Gemini, change to get_gemini_client(), set the model name to gemini-2.5-pro and add GEMINI_API_KEY to .env file
-    client = get_openai_client(args.model, api_key)
-    
-    # Generate PowerPoint outline
-    ppt_outline = generate_outline(client, md_text, image_messages, args.model)
+    if args.mode == 'map-reduce':
+        # Draft the slides of each section concurrently, then merge them
+        client = get_async_openai_client(args.model, api_key, args.base_url)
+        ppt_outline = asyncio.run(generate_outline_map_reduce(
+            client, md_text, pdf_base_name, args.llm_model,
+            max_concurrency=args.max_concurrency, max_section_chars=args.max_section_chars,
+            image_numbers=image_numbers, max_side=args.image_max_side, image_format=args.image_format,
+        ))
+    else:
+        # Prepare image messages, downscaled and re-encoded
+        image_messages = prepare_image_messages(image_paths, pdf_base_name, max_side=args.image_max_side,
+                                                image_format=args.image_format)
+        
+        # Get LLM client, if you want to use Gemini, change to get_gemini_client(), set the model name to gemini-2.5-pro and add GEMINI_API_KEY to .env file
+        client = get_openai_client(args.model, api_key, args.base_url)
+        
+        # Generate PowerPoint outline
+        ppt_outline = generate_outline(client, md_text, image_messages, args.llm_model)
     
     # Print formatted outline
     print(ppt_outline)
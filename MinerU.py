@@ -1,112 +1,306 @@
 import os
+import json
+import shutil
+import time
+import uuid
 
+import magic_pdf.model as model_config
 from magic_pdf.data.data_reader_writer import FileBasedDataWriter, FileBasedDataReader
 from magic_pdf.data.dataset import PymuDocDataset
 from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze
 from magic_pdf.config.enums import SupportedPdfParseMethod
+from magic_pdf.libs.config_reader import (get_formula_config, get_latex_delimiter_config,
+                                          get_layout_config, get_llm_aided_config,
+                                          get_local_models_dir, get_table_recog_config)
+from magic_pdf.libs.hash_utils import compute_md5, compute_sha256
+from magic_pdf.libs.version import __version__
+from magic_pdf.tools.model_server import get_model_server_client
+from loguru import logger
 
 
-## args
-pdf_file_name = "data/Example.pdf"  # replace with the real pdf path
-name_without_suff = os.path.splitext(os.path.basename(pdf_file_name))[0]
+# Bump when the layout of a cache entry changes, so stale entries are never reused
+PARSE_CACHE_FORMAT_VERSION = 1
+PARSE_CACHE_DIR = os.environ.get("PAPERTOSLIDES_PARSE_CACHE_DIR", os.path.join("output", ".parse_cache"))
+PARSE_CACHE_MAX_MB = int(os.environ.get("PAPERTOSLIDES_PARSE_CACHE_MAX_MB", 2048))
 
-## prepare env
-local_image_dir, local_md_dir = "output/images", "output"
-image_dir = os.path.basename(local_image_dir)
 
-os.makedirs(local_image_dir, exist_ok=True)
+class RecordingDataWriter(FileBasedDataWriter):
+    """
+    FileBasedDataWriter that remembers which files were written through it
+    """
+
+    def __init__(self, parent_dir: str = '') -> None:
+        super().__init__(parent_dir)
+        self.written_paths = []
+
+    def write(self, path: str, data: bytes) -> None:
+        super().write(path, data)
+        self.written_paths.append(path)
 
-image_writer, md_writer = FileBasedDataWriter(local_image_dir), FileBasedDataWriter(
-    local_md_dir
-)
 
-# read bytes
-reader = FileBasedDataReader("")
-pdf_bytes = reader.read(pdf_file_name)  # read the pdf content
+def get_model_fingerprint():
+    """
+    计算模型与解析配置的指纹，任何会影响解析结果的配置变化都会使缓存失效
+    """
+    fingerprint = {
+        "cache_format": PARSE_CACHE_FORMAT_VERSION,
+        "magic_pdf_version": __version__,
+        "model_mode": model_config.__model_mode__,
+        "models_dir": get_local_models_dir(),
+        "layout_config": get_layout_config(),
+        "formula_config": get_formula_config(),
+        "table_config": get_table_recog_config(),
+        "latex_delimiter_config": get_latex_delimiter_config(),
+        "llm_aided_config": get_llm_aided_config(),
+    }
+    return compute_sha256(json.dumps(fingerprint, sort_keys=True, ensure_ascii=False))
 
-# proc
-## Create Dataset Instance
-ds = PymuDocDataset(pdf_bytes)
 
-## inference
-if ds.classify() == SupportedPdfParseMethod.OCR:
-    infer_result = ds.apply(doc_analyze, ocr=True)
+class ParseCache:
+    """
+    以PDF内容哈希和模型指纹为键的解析结果缓存，按最近使用时间淘汰
 
-    ## pipeline
-    pipe_result = infer_result.pipe_ocr_mode(image_writer)
-else:
-    infer_result = ds.apply(doc_analyze, ocr=False)
+    Each entry is a directory holding the markdown, the middle json, the content
+    list and the extracted images. The mtime of the entry directory records the
+    last access and drives the LRU eviction.
+    """
 
-    ## pipeline
-    pipe_result = infer_result.pipe_txt_mode(image_writer)
+    MD_FILE = "content.md"
+    MIDDLE_JSON_FILE = "middle.json"
+    CONTENT_LIST_FILE = "content_list.json"
+    IMAGE_DIR = "images"
 
-### draw model result on each page
-infer_result.draw_model(os.path.join(local_md_dir, f"{name_without_suff}_model.pdf"))
+    def __init__(self, cache_dir: str = PARSE_CACHE_DIR, max_bytes: int = PARSE_CACHE_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
 
-### get model inference result
-model_inference_result = infer_result.get_infer_res()
+    @staticmethod
+    def make_key(pdf_bytes: bytes, fingerprint: str) -> str:
+        return f"{compute_md5(pdf_bytes)}_{fingerprint[:16]}"
 
-### draw layout result on each page
-pipe_result.draw_layout(os.path.join(local_md_dir, f"{name_without_suff}_layout.pdf"))
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
 
-### draw spans result on each page
-pipe_result.draw_span(os.path.join(local_md_dir, f"{name_without_suff}_spans.pdf"))
+    def restore(self, key: str, output_dir: str, name_without_suff: str):
+        """
+        将缓存条目恢复到输出目录，未命中时返回None
 
-### get markdown content
-md_content = pipe_result.get_markdown(image_dir)
+        Returns:
+            Markdown file path, or None on a cache miss
+        """
+        entry_dir = self._entry_dir(key)
+        if not os.path.isfile(os.path.join(entry_dir, self.MD_FILE)):
+            return None
 
-### dump markdown
-pipe_result.dump_md(md_writer, f"{name_without_suff}.md", image_dir)
+        local_image_dir = os.path.join(output_dir, "images")
+        os.makedirs(local_image_dir, exist_ok=True)
+        shutil.copytree(os.path.join(entry_dir, self.IMAGE_DIR), local_image_dir, dirs_exist_ok=True)
 
-### get content list content
-content_list_content = pipe_result.get_content_list(image_dir)
+        md_file_path = os.path.join(output_dir, f"{name_without_suff}.md")
+        shutil.copyfile(os.path.join(entry_dir, self.MD_FILE), md_file_path)
+        shutil.copyfile(os.path.join(entry_dir, self.MIDDLE_JSON_FILE),
+                        os.path.join(output_dir, f"{name_without_suff}_middle.json"))
+        shutil.copyfile(os.path.join(entry_dir, self.CONTENT_LIST_FILE),
+                        os.path.join(output_dir, f"{name_without_suff}_content_list.json"))
 
-### dump content list
-pipe_result.dump_content_list(md_writer, f"{name_without_suff}_content_list.json", image_dir)
+        # 更新访问时间，用于LRU淘汰
+        os.utime(entry_dir)
+        return md_file_path
 
-### get middle json
-middle_json_content = pipe_result.get_middle_json()
+    def store(self, key: str, md_content: str, middle_json: str, content_list_json: str,
+              local_image_dir: str, image_names: list):
+        """
+        写入缓存条目，先写入临时目录再原子重命名，避免并发读到半写入的条目
+        """
+        entry_dir = self._entry_dir(key)
+        tmp_dir = os.path.join(self.cache_dir, f".tmp_{key}_{uuid.uuid4().hex}")
+        os.makedirs(os.path.join(tmp_dir, self.IMAGE_DIR))
+        try:
+            for image_name in image_names:
+                shutil.copyfile(os.path.join(local_image_dir, image_name),
+                                os.path.join(tmp_dir, self.IMAGE_DIR, image_name))
+            with open(os.path.join(tmp_dir, self.MIDDLE_JSON_FILE), "w", encoding="utf-8") as f:
+                f.write(middle_json)
+            with open(os.path.join(tmp_dir, self.CONTENT_LIST_FILE), "w", encoding="utf-8") as f:
+                f.write(content_list_json)
+            # markdown最后写入，restore以它是否存在判断条目是否完整
+            with open(os.path.join(tmp_dir, self.MD_FILE), "w", encoding="utf-8") as f:
+                f.write(md_content)
 
-### dump middle json
-pipe_result.dump_middle_json(md_writer, f'{name_without_suff}_middle.json')
+            if os.path.exists(entry_dir):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+        except Exception as e:
+            logger.warning(f"Failed to store parse cache entry {key}: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
 
+        self.evict()
 
-def extract_pdf_to_markdown(pdf_file_name, output_dir):
+    @staticmethod
+    def _dir_size(path: str) -> int:
+        total = 0
+        for root, _, files in os.walk(path):
+            for file_name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, file_name))
+                except OSError:
+                    pass
+        return total
+
+    def evict(self):
+        """
+        按最近访问时间从旧到新删除条目，直到缓存总大小不超过上限
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            if name.startswith(".tmp_") or not os.path.isdir(entry_dir):
+                continue
+            entries.append((os.path.getmtime(entry_dir), self._dir_size(entry_dir), entry_dir))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_bytes -= size
+            logger.info(f"Evicted parse cache entry {os.path.basename(entry_dir)}")
+
+
+def extract_pdf_to_markdown(pdf_file_name, output_dir, use_cache=True):
     """
     提取PDF文件内容并转换为Markdown格式
+
+    When use_cache is enabled, results are looked up by the md5 of the pdf bytes
+    plus the model fingerprint, so re-runs and renamed copies of the same paper
+    skip model inference entirely.
     """
     local_image_dir = os.path.join(output_dir, "images")
     os.makedirs(local_image_dir, exist_ok=True)
-    
-    image_writer = FileBasedDataWriter(local_image_dir)
+
+    image_writer = RecordingDataWriter(local_image_dir)
     md_writer = FileBasedDataWriter(output_dir)
     image_dir = os.path.basename(local_image_dir)
-    
+
     reader = FileBasedDataReader("")
     pdf_bytes = reader.read(pdf_file_name)
-    
+
     name_without_suff = os.path.splitext(os.path.basename(pdf_file_name))[0]
     md_file_path = os.path.join(output_dir, f"{name_without_suff}.md")
-    
+
+    parse_cache = None
+    cache_key = None
+    if use_cache:
+        parse_cache = ParseCache()
+        cache_key = ParseCache.make_key(pdf_bytes, get_model_fingerprint())
+        restore_start = time.time()
+        cached_md_file_path = parse_cache.restore(cache_key, output_dir, name_without_suff)
+        if cached_md_file_path is not None:
+            logger.info(f"Parse cache hit for {pdf_file_name} ({cache_key}), "
+                        f"restored in {round(time.time() - restore_start, 3)}s")
+            return cached_md_file_path
+        logger.info(f"Parse cache miss for {pdf_file_name} ({cache_key})")
+
     # 创建数据集实例
     ds = PymuDocDataset(pdf_bytes)
-    
-    # 根据PDF类型进行不同处理
-    if ds.classify() == SupportedPdfParseMethod.OCR:
+
+    # 根据PDF类型进行不同处理, 有常驻的模型服务进程时交给它推理, 省去加载模型的时间
+    model_server = get_model_server_client()
+    if model_server is not None:
+        logger.info(f"Parsing {pdf_file_name} with the model server at {model_server.socket_path}")
+        infer_result, pipe_result = model_server.analyze(
+            ds, image_writer, ocr=ds.classify() == SupportedPdfParseMethod.OCR
+        )
+    elif ds.classify() == SupportedPdfParseMethod.OCR:
         infer_result = ds.apply(doc_analyze, ocr=True)
         pipe_result = infer_result.pipe_ocr_mode(image_writer)
     else:
         infer_result = ds.apply(doc_analyze, ocr=False)
         pipe_result = infer_result.pipe_txt_mode(image_writer)
-    
+
     # 导出Markdown
-    pipe_result.dump_md(md_writer, f"{name_without_suff}.md", image_dir)
-    
+    md_content = pipe_result.get_markdown(image_dir)
+    md_writer.write_string(f"{name_without_suff}.md", md_content)
+
     # 导出其他可选结果
     infer_result.draw_model(os.path.join(output_dir, f"{name_without_suff}_model.pdf"))
     pipe_result.draw_layout(os.path.join(output_dir, f"{name_without_suff}_layout.pdf"))
     pipe_result.draw_span(os.path.join(output_dir, f"{name_without_suff}_spans.pdf"))
+    content_list_json = json.dumps(pipe_result.get_content_list(image_dir), ensure_ascii=False, indent=4)
+    md_writer.write_string(f"{name_without_suff}_content_list.json", content_list_json)
+    middle_json = pipe_result.get_middle_json()
+    md_writer.write_string(f'{name_without_suff}_middle.json', middle_json)
+
+    if parse_cache is not None:
+        parse_cache.store(cache_key, md_content, middle_json, content_list_json,
+                          local_image_dir, image_writer.written_paths)
+
+    return md_file_path
+
+
+if __name__ == "__main__":
+    ## args
+    pdf_file_name = "data/Example.pdf"  # replace with the real pdf path
+    name_without_suff = os.path.splitext(os.path.basename(pdf_file_name))[0]
+
+    ## prepare env
+    local_image_dir, local_md_dir = "output/images", "output"
+    image_dir = os.path.basename(local_image_dir)
+
+    os.makedirs(local_image_dir, exist_ok=True)
+
+    image_writer, md_writer = FileBasedDataWriter(local_image_dir), FileBasedDataWriter(
+        local_md_dir
+    )
+
+    # read bytes
+    reader = FileBasedDataReader("")
+    pdf_bytes = reader.read(pdf_file_name)  # read the pdf content
+
+    # proc
+    ## Create Dataset Instance
+    ds = PymuDocDataset(pdf_bytes)
+
+    ## inference
+    if ds.classify() == SupportedPdfParseMethod.OCR:
+        infer_result = ds.apply(doc_analyze, ocr=True)
+
+        ## pipeline
+        pipe_result = infer_result.pipe_ocr_mode(image_writer)
+    else:
+        infer_result = ds.apply(doc_analyze, ocr=False)
+
+        ## pipeline
+        pipe_result = infer_result.pipe_txt_mode(image_writer)
+
+    ### draw model result on each page
+    infer_result.draw_model(os.path.join(local_md_dir, f"{name_without_suff}_model.pdf"))
+
+    ### get model inference result
+    model_inference_result = infer_result.get_infer_res()
+
+    ### draw layout result on each page
+    pipe_result.draw_layout(os.path.join(local_md_dir, f"{name_without_suff}_layout.pdf"))
+
+    ### draw spans result on each page
+    pipe_result.draw_span(os.path.join(local_md_dir, f"{name_without_suff}_spans.pdf"))
+
+    ### get markdown content
+    md_content = pipe_result.get_markdown(image_dir)
+
+    ### dump markdown
+    pipe_result.dump_md(md_writer, f"{name_without_suff}.md", image_dir)
+
+    ### get content list content
+    content_list_content = pipe_result.get_content_list(image_dir)
+
+    ### dump content list
     pipe_result.dump_content_list(md_writer, f"{name_without_suff}_content_list.json", image_dir)
+
+    ### get middle json
+    middle_json_content = pipe_result.get_middle_json()
+
+    ### dump middle json
     pipe_result.dump_middle_json(md_writer, f'{name_without_suff}_middle.json')
-    
-    return md_file_path
\ No newline at end of file
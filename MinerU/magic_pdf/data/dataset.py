@@ -6,6 +6,8 @@ import fitz
 from loguru import logger
 
 from magic_pdf.config.enums import SupportedPdfParseMethod
+from magic_pdf.data.page_image_store import PageImageStore
+from magic_pdf.data.page_text_store import PageTextStore
 from magic_pdf.data.schemas import PageInfo
 from magic_pdf.data.utils import fitz_doc_to_image
 from magic_pdf.filter import classify
@@ -140,7 +142,9 @@ class PymuDocDataset(Dataset):
             bits (bytes): the bytes of the pdf
         """
         self._raw_fitz = fitz.open('pdf', bits)
-        self._records = [Doc(v) for v in self._raw_fitz]
+        self._image_store = PageImageStore.from_env()
+        self._text_store = PageTextStore.from_env()
+        self._records = [Doc(v, self._image_store, self._text_store) for v in self._raw_fitz]
         self._data_bits = bits
         self._raw_data = bits
         self._classify_result = None
@@ -150,7 +154,7 @@ class PymuDocDataset(Dataset):
         elif lang == 'auto':
             from magic_pdf.model.sub_modules.language_detection.utils import \
                 auto_detect_lang
-            self._lang = auto_detect_lang(self._data_bits)
+            self._lang = auto_detect_lang(self._data_bits, self)
             logger.info(f'lang: {lang}, detect_lang: {self._lang}')
         else:
             self._lang = lang
@@ -220,7 +224,7 @@ class PymuDocDataset(Dataset):
             SupportedPdfParseMethod: _description_
         """
         if self._classify_result is None:
-            self._classify_result = classify(self._data_bits)
+            self._classify_result = classify(self._data_bits, self._raw_fitz, self._records)
         return self._classify_result
 
     def clone(self):
@@ -240,7 +244,8 @@ class ImageDataset(Dataset):
         """
         pdf_bytes = fitz.open(stream=bits).convert_to_pdf()
         self._raw_fitz = fitz.open('pdf', pdf_bytes)
-        self._records = [Doc(v) for v in self._raw_fitz]
+        self._image_store = PageImageStore.from_env()
+        self._records = [Doc(v, self._image_store) for v in self._raw_fitz]
         self._raw_data = bits
         self._data_bits = pdf_bytes
 
@@ -249,7 +254,7 @@ class ImageDataset(Dataset):
         elif lang == 'auto':
             from magic_pdf.model.sub_modules.language_detection.utils import \
                 auto_detect_lang
-            self._lang = auto_detect_lang(self._data_bits)
+            self._lang = auto_detect_lang(self._data_bits, self)
             logger.info(f'lang: {lang}, detect_lang: {self._lang}')
         else:
             self._lang = lang
@@ -328,12 +333,23 @@ class ImageDataset(Dataset):
 class Doc(PageableData):
     """Initialized with pymudoc object."""
 
-    def __init__(self, doc: fitz.Page):
+    def __init__(self, doc: fitz.Page, image_store: PageImageStore = None, text_store: PageTextStore = None):
+        """
+        Args:
+            doc (fitz.Page): the pymudoc page
+            image_store (PageImageStore, optional): the store shared by the pages of a dataset which keeps the
+                rendered images. Defaults to an unbounded store of this page only.
+            text_store (PageTextStore, optional): the store shared by the pages of a dataset which keeps the
+                extracted text pages. Defaults to a store of this page only.
+        """
         self._doc = doc
-        self._img = None
+        self._page_id = doc.number
+        self._image_store = image_store if image_store is not None else PageImageStore()
+        self._text_store = text_store if text_store is not None else PageTextStore(max_pages=1)
 
     def get_image(self):
-        """Return the image info.
+        """Return the image info, the image is rendered again if it has been
+        evicted from the image store.
 
         Returns:
             dict: {
@@ -342,17 +358,36 @@ class Doc(PageableData):
                 height: int
             }
         """
-        if self._img is None:
-            self._img = fitz_doc_to_image(self._doc)
-        return self._img
+        return self._image_store.get(self._page_id, lambda: fitz_doc_to_image(self._doc))
+
+    def has_image(self) -> bool:
+        """Whether the image of this page is held by the image store."""
+        return self._page_id in self._image_store
 
     def set_image(self, img):
         """
         Args:
             img (np.ndarray): the image
         """
-        if self._img is None:
-            self._img = img
+        if self._page_id not in self._image_store:
+            self._image_store.put(self._page_id, img)
+
+    def get_textpage(self) -> fitz.TextPage:
+        """Return the text page of TEXTFLAGS_TEXT, it is extracted again if it
+        has been evicted from the text store."""
+        return self._text_store.get(self._page_id, lambda: self._doc.get_textpage(flags=fitz.TEXTFLAGS_TEXT))
+
+    def get_text(self, option='text', flags=None, **kwargs):
+        """Extract the text as fitz.Page.get_text, the extractions with
+        TEXTFLAGS_TEXT share the text page of get_textpage.
+
+        Args:
+            option (str, optional): text, dict, rawdict... Defaults to 'text'.
+            flags (int, optional): Defaults to the flags of fitz for option.
+        """
+        if not kwargs and (flags == fitz.TEXTFLAGS_TEXT or (flags is None and option == 'text')):
+            return self._doc.get_text(option, textpage=self.get_textpage())
+        return self._doc.get_text(option, flags=flags, **kwargs)
 
     def get_doc(self) -> fitz.Page:
         """Get the pymudoc object.
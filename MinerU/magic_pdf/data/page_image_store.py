@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+from loguru import logger
+
+
+class PageImageStore:
+    def __init__(self, max_memory_mb: float | None = None, spill_dir: str | None = None):
+        """Keep rendered page images under a memory budget, evicting the least
+        recently used pages.
+
+        Evicted pages are rendered again on the next access, or, when spill_dir is set,
+        written to disk once and served as memory-mapped arrays afterwards.
+
+        Args:
+            max_memory_mb (float | None, optional): memory budget of the in-memory page images. Defaults to None, which means unbounded.
+            spill_dir (str | None, optional): the directory evicted pages are spilled to. Defaults to None, which disables spilling.
+        """
+        self._max_bytes = None if max_memory_mb is None else int(max_memory_mb * 1024 * 1024)
+        self._spill_root = spill_dir
+        self._spill_dir = None
+        self._images = OrderedDict()
+        self._spilled = {}
+        self._memory_bytes = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_env(cls):
+        """Build the store from MINERU_PAGE_IMAGE_CACHE_MB and MINERU_PAGE_IMAGE_SPILL_DIR."""
+        max_memory_mb = os.environ.get('MINERU_PAGE_IMAGE_CACHE_MB')
+        spill_dir = os.environ.get('MINERU_PAGE_IMAGE_SPILL_DIR')
+        return cls(
+            max_memory_mb=float(max_memory_mb) if max_memory_mb else None,
+            spill_dir=spill_dir if spill_dir else None,
+        )
+
+    @property
+    def memory_bytes(self) -> int:
+        """The bytes held by the in-memory page images."""
+        return self._memory_bytes
+
+    def can_hold(self, nbytes: int) -> bool:
+        """Whether nbytes more of page images can be stored without dropping a page: the store is unbounded,
+        spills the evicted pages, or has nbytes left in its budget."""
+        if self._max_bytes is None or self._spill_root is not None:
+            return True
+        return self._memory_bytes + nbytes <= self._max_bytes
+
+    def __contains__(self, page_id: int) -> bool:
+        with self._lock:
+            return page_id in self._images or page_id in self._spilled
+
+    def get(self, page_id: int, render: Callable[[], dict]) -> dict:
+        """Get the image of page, render it with render() if it is not stored.
+
+        Args:
+            page_id (int): the index of the page
+            render (Callable[[], dict]): returns {'img': np.ndarray, 'width': int, 'height': int}
+
+        Returns:
+            dict: {'img': np.ndarray, 'width': int, 'height': int}
+        """
+        with self._lock:
+            if page_id in self._images:
+                self._images.move_to_end(page_id)
+                return self._images[page_id]
+            if page_id in self._spilled:
+                return self._load_spilled(page_id)
+
+        img_dict = render()
+        self.put(page_id, img_dict)
+        return img_dict
+
+    def put(self, page_id: int, img_dict: dict):
+        """Store the image of page.
+
+        Args:
+            page_id (int): the index of the page
+            img_dict (dict): {'img': np.ndarray, 'width': int, 'height': int}
+        """
+        with self._lock:
+            self._discard(page_id)
+            self._images[page_id] = img_dict
+            self._memory_bytes += self._nbytes(img_dict)
+            self._evict()
+
+    def clear(self):
+        """Drop all stored images, including the spilled ones."""
+        with self._lock:
+            self._images.clear()
+            self._spilled.clear()
+            self._memory_bytes = 0
+            if self._spill_dir is not None:
+                shutil.rmtree(self._spill_dir, ignore_errors=True)
+                self._spill_dir = None
+
+    @staticmethod
+    def _nbytes(img_dict: dict) -> int:
+        return getattr(img_dict['img'], 'nbytes', 0)
+
+    def _discard(self, page_id: int):
+        if page_id in self._images:
+            self._memory_bytes -= self._nbytes(self._images.pop(page_id))
+        if page_id in self._spilled:
+            path = self._spilled.pop(page_id)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _evict(self):
+        # the most recently stored page is always kept, even if it alone exceeds the budget
+        while self._max_bytes is not None and self._memory_bytes > self._max_bytes and len(self._images) > 1:
+            page_id, img_dict = self._images.popitem(last=False)
+            self._memory_bytes -= self._nbytes(img_dict)
+            if self._spill_root is not None and isinstance(img_dict['img'], np.ndarray):
+                self._spill(page_id, img_dict)
+
+    def _get_spill_dir(self) -> str:
+        if self._spill_dir is None:
+            os.makedirs(self._spill_root, exist_ok=True)
+            self._spill_dir = tempfile.mkdtemp(prefix='mineru_pages_', dir=self._spill_root)
+            weakref.finalize(self, shutil.rmtree, self._spill_dir, True)
+        return self._spill_dir
+
+    def _spill(self, page_id: int, img_dict: dict):
+        path = os.path.join(self._get_spill_dir(), f'{page_id}.npy')
+        try:
+            np.save(path, img_dict['img'])
+        except OSError as e:
+            logger.warning(f'spill page {page_id} failed, it will be rendered again on demand: {e}')
+            return
+        self._spilled[page_id] = path
+
+    def _load_spilled(self, page_id: int) -> dict:
+        img = np.load(self._spilled[page_id], mmap_mode='r')
+        return {'img': img, 'width': img.shape[1], 'height': img.shape[0]}
@@ -0,0 +1,56 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+import fitz
+
+
+class PageTextStore:
+    def __init__(self, max_pages: int = 64):
+        """Keep the text pages extracted from the pages of a document, so that the stages reading the text of
+        the same page (classification, span extraction) interpret its content stream once.
+
+        Args:
+            max_pages (int, optional): the least recently used text pages are dropped above max_pages, 0 disables
+                the store. Defaults to 64.
+        """
+        self.max_pages = max_pages
+        self._text_pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build the store from MINERU_PAGE_TEXT_CACHE_PAGES."""
+        return cls(max_pages=max(0, int(os.environ.get('MINERU_PAGE_TEXT_CACHE_PAGES', 64))))
+
+    def __contains__(self, page_id: int) -> bool:
+        with self._lock:
+            return page_id in self._text_pages
+
+    def get(self, page_id: int, extract: Callable[[], fitz.TextPage]) -> fitz.TextPage:
+        """Get the text page of page, extract it with extract() if it is not stored.
+
+        Args:
+            page_id (int): the index of the page
+            extract (Callable[[], fitz.TextPage]): returns the text page
+
+        Returns:
+            fitz.TextPage: the text page
+        """
+        with self._lock:
+            if page_id in self._text_pages:
+                self._text_pages.move_to_end(page_id)
+                return self._text_pages[page_id]
+
+        text_page = extract()
+        if self.max_pages > 0:
+            with self._lock:
+                self._text_pages[page_id] = text_page
+                while len(self._text_pages) > self.max_pages:
+                    self._text_pages.popitem(last=False)
+        return text_page
+
+    def clear(self):
+        with self._lock:
+            self._text_pages.clear()
@@ -1,8 +1,10 @@
 
 import multiprocessing as mp
+import os
 import threading
 from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
                                 as_completed)
+from multiprocessing import resource_tracker, shared_memory
 
 import fitz
 import numpy as np
@@ -133,6 +135,251 @@ def threaded_process_pdf(pdf_path, num_threads=4, **kwargs):
     # Close the document
     doc.close()
 
+def partition_array_greedy(arr, k):
+    """Partition an array into k parts using a simple greedy approach.
+
+    Parameters:
+    -----------
+    arr : list
+        The input array of (item, weight) tuples
+    k : int
+        Number of partitions to create
+
+    Returns:
+    --------
+    partitions : list of lists
+        The k partitions of the array
+    """
+    # Handle edge cases
+    if k <= 0:
+        raise ValueError('k must be a positive integer')
+    if k > len(arr):
+        k = len(arr)  # Adjust k if it's too large
+    if k == 1:
+        return [list(range(len(arr)))]
+    if k == len(arr):
+        return [[i] for i in range(len(arr))]
+
+    # Sort the array in descending order
+    sorted_indices = sorted(range(len(arr)), key=lambda i: arr[i][1], reverse=True)
+
+    # Initialize k empty partitions
+    partitions = [[] for _ in range(k)]
+    partition_sums = [0] * k
+
+    # Assign each element to the partition with the smallest current sum
+    for idx in sorted_indices:
+        # Find the partition with the smallest sum
+        min_sum_idx = partition_sums.index(min(partition_sums))
+
+        # Add the element to this partition
+        partitions[min_sum_idx].append(idx)  # Store the original index
+        partition_sums[min_sum_idx] += arr[idx][1]
+
+    return partitions
+
+
+def get_render_worker_num(default=1) -> int:
+    """The number of processes used to rasterize pages, read from
+    MINERU_RENDER_WORKER_NUM. 1 means rendering in the calling process."""
+    return max(1, int(os.environ.get('MINERU_RENDER_WORKER_NUM', default)))
+
+
+# On Windows a shared memory block is destroyed as soon as the creating process closes it,
+# so the pixels are pickled back there instead.
+_SHARED_MEMORY_HANDOFF = os.name != 'nt'
+
+
+def _render_pages_to_shared_memory(jobs, dpi):
+    """Render pages in a worker process, the pixels are handed back through
+    shared memory blocks instead of being pickled.
+
+    Args:
+        jobs (list): list of (doc_idx, pdf_bytes, page_ids)
+        dpi (int): the dpi used to render
+
+    Returns:
+        list: list of (doc_idx, page_id, payload, width, height), payload is (shm_name, shape)
+            or the image itself when shared memory handoff is not available
+    """
+    results = []
+    try:
+        for doc_idx, pdf_bytes, page_ids in jobs:
+            with fitz.open('pdf', pdf_bytes) as doc:
+                for page_id in page_ids:
+                    img_dict = fitz_doc_to_image(doc[page_id], dpi=dpi)
+                    img = img_dict['img']
+                    if _SHARED_MEMORY_HANDOFF:
+                        shm = shared_memory.SharedMemory(create=True, size=max(img.nbytes, 1))
+                        np.ndarray(img.shape, dtype=np.uint8, buffer=shm.buf)[:] = img
+                        # the parent process owns the block from now on, keep the resource tracker from unlinking it
+                        resource_tracker.unregister(shm._name, 'shared_memory')  # noqa
+                        shm.close()
+                        payload = (shm.name, img.shape)
+                    else:
+                        payload = img
+                    results.append((doc_idx, page_id, payload, img_dict['width'], img_dict['height']))
+    except BaseException:
+        # the parent never sees the blocks of a failed job
+        _release_shared_memory(results)
+        raise
+    return results
+
+
+def _take_from_shared_memory(shm_name, shape) -> np.ndarray:
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        img = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    return img
+
+
+def _release_shared_memory(results):
+    """Unlink the shared memory blocks of rendered pages which are not collected."""
+    for _, _, payload, _, _ in results:
+        if not isinstance(payload, tuple):
+            continue
+        try:
+            shm = shared_memory.SharedMemory(name=payload[0])
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def parallel_render_pages(pdf_bytes_list, page_ids_list=None, num_workers=None, dpi=200, pages_per_job=8) -> list:
+    """Rasterize the pages of several pdfs with a process pool.
+
+    Pages are cut into jobs of at most pages_per_job pages, and the jobs are balanced across
+    the workers by page count with partition_array_greedy, so one large pdf is spread over
+    all workers as well.
+
+    Args:
+        pdf_bytes_list (list[bytes]): the pdfs
+        page_ids_list (list[list[int]] | None, optional): the pages to render of each pdf. Defaults to all pages.
+        num_workers (int | None, optional): the number of processes. Defaults to get_render_worker_num().
+        dpi (int, optional): Defaults to 200.
+        pages_per_job (int, optional): Defaults to 8.
+
+    Returns:
+        list[list[dict]]: the image dicts of each pdf, aligned with page_ids_list
+    """
+    if page_ids_list is None:
+        page_ids_list = []
+        for pdf_bytes in pdf_bytes_list:
+            with fitz.open('pdf', pdf_bytes) as doc:
+                page_ids_list.append(list(range(doc.page_count)))
+    if num_workers is None:
+        num_workers = get_render_worker_num()
+
+    jobs = []
+    for doc_idx, page_ids in enumerate(page_ids_list):
+        for i in range(0, len(page_ids), pages_per_job):
+            chunk = page_ids[i:i + pages_per_job]
+            jobs.append(((doc_idx, chunk), len(chunk)))
+
+    images_list = [[None] * len(page_ids) for page_ids in page_ids_list]
+    positions = [{page_id: pos for pos, page_id in enumerate(page_ids)} for page_ids in page_ids_list]
+    if len(jobs) == 0:
+        return images_list
+
+    if num_workers <= 1:
+        for doc_idx, page_ids in enumerate(page_ids_list):
+            if not page_ids:
+                continue
+            with fitz.open('pdf', pdf_bytes_list[doc_idx]) as doc:
+                for pos, page_id in enumerate(page_ids):
+                    images_list[doc_idx][pos] = fitz_doc_to_image(doc[page_id], dpi=dpi)
+        return images_list
+
+    partitions = partition_array_greedy(jobs, num_workers)
+    with ProcessPoolExecutor(max_workers=len(partitions)) as executor:
+        futures = []
+        for partition in partitions:
+            worker_jobs = [
+                (doc_idx, pdf_bytes_list[doc_idx], page_ids)
+                for doc_idx, page_ids in (jobs[idx][0] for idx in partition)
+            ]
+            futures.append(executor.submit(_render_pages_to_shared_memory, worker_jobs, dpi))
+
+        pending = []
+        collected = set()
+        try:
+            for future in as_completed(futures):
+                collected.add(future)
+                pending.extend(future.result())
+                while pending:
+                    doc_idx, page_id, payload, width, height = pending.pop()
+                    img = _take_from_shared_memory(*payload) if isinstance(payload, tuple) else payload
+                    images_list[doc_idx][positions[doc_idx][page_id]] = {'img': img, 'width': width, 'height': height}
+        except BaseException:
+            # release the blocks of the pages not collected because of an error, including the ones of the
+            # workers still running
+            for future in futures:
+                if future in collected or future.cancel():
+                    continue
+                try:
+                    pending.extend(future.result())
+                except BaseException:
+                    pass
+            _release_shared_memory(pending)
+            raise
+
+    return images_list
+
+
+def parallel_set_images(datasets, page_ids_list=None, num_workers=None, pages_per_job=8):
+    """Render the pages of datasets with parallel_render_pages and store the
+    images on the pages, pages which already hold an image are skipped.
+
+    The pages are rendered in windows of num_workers * pages_per_job pages, each window is stored
+    before the next one is rendered, so a bounded PageImageStore bounds the memory as well. Once the
+    store of a dataset can not hold another window, its remaining pages are left to be rendered on access.
+
+    Args:
+        datasets (list[Dataset]): the datasets
+        page_ids_list (list[list[int]] | None, optional): the pages of each dataset. Defaults to all pages.
+        num_workers (int | None, optional): Defaults to get_render_worker_num().
+        pages_per_job (int, optional): Defaults to 8.
+    """
+    if page_ids_list is None:
+        page_ids_list = [list(range(len(dataset))) for dataset in datasets]
+    if num_workers is None:
+        num_workers = get_render_worker_num()
+    pages = [
+        (dataset_idx, page_id)
+        for dataset_idx, (dataset, page_ids) in enumerate(zip(datasets, page_ids_list))
+        for page_id in page_ids
+        if not dataset.get_page(page_id).has_image()
+    ]
+
+    window_size = max(1, num_workers) * pages_per_job
+    full = set()
+    for beg in range(0, len(pages), window_size):
+        window_page_ids_list = [[] for _ in datasets]
+        for dataset_idx, page_id in pages[beg:beg + window_size]:
+            if dataset_idx not in full:
+                window_page_ids_list[dataset_idx].append(page_id)
+        if not any(window_page_ids_list):
+            break
+
+        images_list = parallel_render_pages(
+            [dataset.data_bits() if page_ids else b'' for dataset, page_ids in zip(datasets, window_page_ids_list)],
+            window_page_ids_list, num_workers=num_workers, pages_per_job=pages_per_job,
+        )
+        for dataset_idx, (dataset, page_ids, images) in enumerate(zip(datasets, window_page_ids_list, images_list)):
+            if not page_ids:
+                continue
+            for page_id, img_dict in zip(page_ids, images):
+                dataset.get_page(page_id).set_image(img_dict)
+            image_store = getattr(dataset, '_image_store', None)
+            if image_store is not None and not image_store.can_hold(sum(img['img'].nbytes for img in images)):
+                full.add(dataset_idx)
+        del images_list
+
+
 if __name__ == '__main__':
     pdf = fitz.open('/tmp/[MS-DOC].pdf')
 
@@ -1,12 +1,62 @@
+import threading
+from collections import OrderedDict
+
+import fitz
 
 from magic_pdf.config.drop_reason import DropReason
 from magic_pdf.config.enums import SupportedPdfParseMethod
 from magic_pdf.filter.pdf_classify_by_type import classify as do_classify
+from magic_pdf.filter.pdf_classify_by_type import classify_sampled
 from magic_pdf.filter.pdf_meta_scan import pdf_meta_scan
+from magic_pdf.libs.hash_utils import compute_md5
+
+CLASSIFY_CACHE_MAX_ITEMS = 1024
+# pdf 的 md5 -> 分类结果, 同一份 pdf 多次创建 dataset 时不再重新分类
+_classify_cache = OrderedDict()
+_classify_cache_lock = threading.Lock()
+
+
+def classify(pdf_bytes: bytes, doc: fitz.Document = None, pages: list = None) -> SupportedPdfParseMethod:
+    """根据pdf的元数据，判断是文本pdf，还是ocr pdf.
+
+    传入doc时使用抽样、提前退出的 classify_sampled, 否则使用完整的 pdf_meta_scan. 结果按pdf的md5缓存.
+
+    Args:
+        pdf_bytes (bytes): pdf的二进制数据
+        doc (fitz.Document, optional): 已经打开的pdf_bytes, 例如 PymuDocDataset 持有的文档. Defaults to None.
+        pages (list, optional): doc 的各页, 例如 PymuDocDataset 的 Doc, 提取的文字与解析阶段共用. Defaults to the pages of doc.
+    """
+    key = compute_md5(pdf_bytes)
+    with _classify_cache_lock:
+        if key in _classify_cache:
+            _classify_cache.move_to_end(key)
+            return _classify_cache[key]
+
+    if doc is not None:
+        result = classify_doc(pdf_bytes, doc, pages)
+    else:
+        result = classify_by_meta_scan(pdf_bytes)
+
+    with _classify_cache_lock:
+        _classify_cache[key] = result
+        while len(_classify_cache) > CLASSIFY_CACHE_MAX_ITEMS:
+            _classify_cache.popitem(last=False)
+    return result
+
+
+def classify_doc(pdf_bytes: bytes, doc: fitz.Document, pages: list = None) -> SupportedPdfParseMethod:
+    if len(doc) == 0:
+        raise Exception(f'pdf meta_scan need_drop,reason is {DropReason.EMPTY_PDF}')
+    if doc.is_encrypted or doc.needs_pass:  # 加密的，需要密码的，没有页面的，都不处理
+        raise Exception(f'pdf meta_scan need_drop,reason is {DropReason.ENCRYPTED}')
+    is_text_pdf, results = classify_sampled(doc, pdf_bytes, pages)
+    if is_text_pdf:
+        return SupportedPdfParseMethod.TXT
+    else:
+        return SupportedPdfParseMethod.OCR
 
 
-def classify(pdf_bytes: bytes) -> SupportedPdfParseMethod:
-    """根据pdf的元数据，判断是文本pdf，还是ocr pdf."""
+def classify_by_meta_scan(pdf_bytes: bytes) -> SupportedPdfParseMethod:
     pdf_meta = pdf_meta_scan(pdf_bytes)
     if pdf_meta.get('_need_drop', False):  # 如果返回了需要丢弃的标志，则抛出异常
         raise Exception(f"pdf meta_scan need_drop,reason is {pdf_meta['_drop_reason']}")
@@ -14,11 +14,14 @@ import sys
 from collections import Counter
 
 import click
+import fitz
 import numpy as np
 from loguru import logger
 
 from magic_pdf.libs.commons import mymax, get_top_percent_list
-from magic_pdf.filter.pdf_meta_scan import scan_max_page, junk_limit_min
+from magic_pdf.libs.pdf_check import calculate_text_sample_count
+from magic_pdf.filter.pdf_meta_scan import (scan_max_page, junk_limit_min, check_invalid_chars, get_image_info,
+                                            get_imgs_per_page, get_pdf_page_size_pts)
 
 TEXT_LEN_THRESHOLD = 100
 AVG_TEXT_LEN_THRESHOLD = 100
@@ -342,6 +345,57 @@ def classify(total_page: int, page_width, page_height, img_sz_list: list, text_l
         return False, results
 
 
+def sample_text_page_ids(total_page: int) -> list:
+    """等间距抽取 calculate_text_sample_count 个页面, 覆盖整个文档且结果固定"""
+    sample_cnt = calculate_text_sample_count(total_page)
+    return np.linspace(0, total_page - 1, sample_cnt).round().astype(int).tolist()
+
+
+def classify_sampled(doc: fitz.Document, pdf_bytes: bytes = None, pages: list = None):
+    """
+    classify 的快速版本, 直接使用已打开的doc, 不做完整的 meta scan:
+    文字长度只统计 sample_text_page_ids 抽样的页面,
+    规则按开销从小到大依次判断, 任何一条判定为扫描版就提前返回,
+    扫描书籍只需要读取抽样页面的文字。不超过50页的pdf统计全部页面。
+    :param doc: 打开的pdf
+    :param pdf_bytes: doc的二进制数据, 乱码检测使用
+    :param pages: 读取文字使用的页面, 例如 PymuDocDataset 的 Doc, 默认为doc的页面
+    :return: (是否为文字版pdf, 已判断的各条规则的结果)
+    """
+    results = {}
+
+    def ocr_needed(rule, is_text_pdf):
+        results[rule] = is_text_pdf
+        if not is_text_pdf:
+            logger.info(f'OCR needed based on {rule}, rules checked: {list(results)}')
+        return not is_text_pdf
+
+    total_page = len(doc)
+    pages = pages if pages is not None else doc
+    text_len_list = [len(pages[page_id].get_text('text')) for page_id in sample_text_page_ids(total_page)]
+    if ocr_needed('by_text_len', any([text_len > TEXT_LEN_THRESHOLD for text_len in text_len_list])):
+        return False, results
+    if ocr_needed('by_avg_words', classify_by_avg_words(text_len_list)):
+        return False, results
+
+    # 图片信息只扫描前 scan_max_page 页
+    page_width, page_height = get_pdf_page_size_pts(doc)
+    img_num_list = get_imgs_per_page(doc)
+    img_sz_list, _ = get_image_info(doc, page_width, page_height)
+    page_width, page_height = int(page_width), int(page_height)
+    if ocr_needed('by_img_num', classify_by_img_num(img_sz_list, img_num_list)):
+        return False, results
+    if ocr_needed('by_image_area', classify_by_area(total_page, page_width, page_height, img_sz_list, text_len_list)):
+        return False, results
+    if ocr_needed('by_img_narrow_strips', classify_by_img_narrow_strips(page_width, page_height, img_sz_list)):
+        return False, results
+
+    # pdfminer 最慢, 放在最后
+    if ocr_needed('by_invalid_chars', check_invalid_chars(pdf_bytes, doc)):
+        return False, results
+    return True, results
+
+
 @click.command()
 @click.option("--json-file", type=str, help="pdf信息")
 def main(json_file):
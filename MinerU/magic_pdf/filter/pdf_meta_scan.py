@@ -321,10 +321,10 @@ def get_language(doc: fitz.Document):
     return language
 
 
-def check_invalid_chars(pdf_bytes):
+def check_invalid_chars(pdf_bytes, doc: fitz.Document = None):
     """乱码检测."""
     # return detect_invalid_chars_by_pymupdf(pdf_bytes)
-    return detect_invalid_chars(pdf_bytes)
+    return detect_invalid_chars(pdf_bytes, doc)
 
 
 def pdf_meta_scan(pdf_bytes: bytes):
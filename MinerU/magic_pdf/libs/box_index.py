@@ -0,0 +1,67 @@
+import math
+from collections import defaultdict
+
+
+class BboxIndex:
+    def __init__(self, items: list, bbox_fn=lambda item: item[0:4], cell_size: float = None):
+        """A uniform grid over the bboxes of a page, to find the items which may
+        overlap a bbox without scanning all of them.
+
+        Args:
+            items (list): the indexed items, e.g. blocks or spans
+            bbox_fn (optional): returns the [x0, y0, x1, y1] of an item. Defaults to item[0:4].
+            cell_size (float, optional): the size of the grid cells. Defaults to the extent of the items divided by
+                the square root of their number, about one item per cell.
+        """
+        self.items = items
+        self.bboxes = [bbox_fn(item) for item in items]
+        self._cells = defaultdict(list)
+        self._positions = None  # id(item) -> position, built on demand
+        if not self.bboxes:
+            self.cell_size = 1
+            return
+
+        if cell_size is None:
+            width = max(bbox[2] for bbox in self.bboxes) - min(bbox[0] for bbox in self.bboxes)
+            height = max(bbox[3] for bbox in self.bboxes) - min(bbox[1] for bbox in self.bboxes)
+            cell_size = max(width, height) / math.ceil(math.sqrt(len(self.bboxes)))
+        self.cell_size = max(cell_size, 1)
+        # the cells covered by the items, queries are clipped to them
+        self._cell_bounds = self._cell_range([
+            min(bbox[0] for bbox in self.bboxes), min(bbox[1] for bbox in self.bboxes),
+            max(bbox[2] for bbox in self.bboxes), max(bbox[3] for bbox in self.bboxes),
+        ])
+
+        for position, bbox in enumerate(self.bboxes):
+            for cell in self._bbox_cells(bbox):
+                self._cells[cell].append(position)
+
+    def _cell_range(self, bbox):
+        return (math.floor(bbox[0] / self.cell_size), math.floor(bbox[1] / self.cell_size),
+                math.floor(bbox[2] / self.cell_size), math.floor(bbox[3] / self.cell_size))
+
+    def _bbox_cells(self, bbox):
+        x0, y0, x1, y1 = self._cell_range(bbox)
+        bx0, by0, bx1, by1 = self._cell_bounds
+        return ((x, y) for x in range(max(x0, bx0), min(x1, bx1) + 1) for y in range(max(y0, by0), min(y1, by1) + 1))
+
+    def query(self, bbox) -> list:
+        """The positions of the items whose bbox overlaps or touches bbox, in the order of items."""
+        if not self.bboxes:
+            return []
+        candidates = set()
+        for cell in self._bbox_cells(bbox):
+            candidates.update(self._cells.get(cell, ()))
+        return sorted(
+            position for position in candidates
+            if not (self.bboxes[position][2] < bbox[0] or self.bboxes[position][0] > bbox[2]
+                    or self.bboxes[position][3] < bbox[1] or self.bboxes[position][1] > bbox[3])
+        )
+
+    def position_map(self, items: list) -> dict:
+        """Map the positions in the index to the indices in items, items being the indexed items or a subset of
+        them, e.g. the discarded blocks of a page indexed together with the other blocks. Items which are not
+        indexed are left out."""
+        if self._positions is None:
+            self._positions = {id(item): position for position, item in enumerate(self.items)}
+        return {self._positions[id(item)]: i for i, item in enumerate(items) if id(item) in self._positions}
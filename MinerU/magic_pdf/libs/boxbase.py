@@ -1,5 +1,7 @@
 import math
 
+import numpy as np
+
 
 def _is_in_or_part_overlap(box1, box2) -> bool:
     """两个bbox是否有部分重叠或者包含."""
@@ -195,6 +197,35 @@ def calculate_iou(bbox1, bbox2):
     return iou
 
 
+def calculate_iou_matrix(bboxes1, bboxes2=None):
+    """批量计算边界框两两之间的交并比(IOU), 与calculate_iou的结果一致.
+
+    Args:
+        bboxes1 (list | np.ndarray): N个边界框, 格式为 [x1, y1, x2, y2]
+        bboxes2 (list | np.ndarray, optional): M个边界框. Defaults to None, 即bboxes1.
+
+    Returns:
+        np.ndarray: N*M的交并比矩阵
+    """
+    boxes1 = np.asarray(bboxes1, dtype=np.float64).reshape(-1, 4)
+    boxes2 = boxes1 if bboxes2 is None else np.asarray(bboxes2, dtype=np.float64).reshape(-1, 4)
+
+    x_left = np.maximum(boxes1[:, None, 0], boxes2[None, :, 0])
+    y_top = np.maximum(boxes1[:, None, 1], boxes2[None, :, 1])
+    x_right = np.minimum(boxes1[:, None, 2], boxes2[None, :, 2])
+    y_bottom = np.minimum(boxes1[:, None, 3], boxes2[None, :, 3])
+    intersection_area = np.clip(x_right - x_left, 0, None) * np.clip(y_bottom - y_top, 0, None)
+
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    union_area = area1[:, None] + area2[None, :] - intersection_area
+
+    valid = (area1[:, None] != 0) & (area2[None, :] != 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        iou = np.where(valid, intersection_area / np.where(valid, union_area, 1), 0.0)
+    return iou
+
+
 def calculate_overlap_area_2_minbox_area_ratio(bbox1, bbox2):
     """计算box1和box2的重叠面积占最小面积的box的比例."""
     # Determine the coordinates of the intersection rectangle
@@ -1,3 +1,5 @@
+import math
+
 import fitz
 import numpy as np
 from loguru import logger
@@ -15,8 +17,22 @@ def calculate_sample_count(total_page: int):
     return select_page_cnt
 
 
+def calculate_text_sample_count(total_page: int, margin: float = 0.1, z: float = 1.96):
+    """
+    统计文字长度时采样页面的数量。
+    至少取50页(不足50页时取全部页面),
+    页数更多时取以95%的置信度、误差不超过margin估计有文字页面的比例所需的样本量(有限总体修正)。
+    """
+    sample_cnt = z * z * 0.25 / (margin * margin)
+    sample_cnt = math.ceil(sample_cnt / (1 + (sample_cnt - 1) / max(1, total_page)))
+    return min(total_page, max(50, sample_cnt))
+
+
 def extract_pages(src_pdf_bytes: bytes) -> fitz.Document:
-    pdf_docs = fitz.open("pdf", src_pdf_bytes)
+    return sample_pages(fitz.open("pdf", src_pdf_bytes))
+
+
+def sample_pages(pdf_docs: fitz.Document) -> fitz.Document:
     total_page = len(pdf_docs)
     if total_page == 0:
         # 如果PDF没有页面，直接返回空文档
@@ -34,12 +50,13 @@ def extract_pages(src_pdf_bytes: bytes) -> fitz.Document:
     return sample_docs
 
 
-def detect_invalid_chars(src_pdf_bytes: bytes) -> bool:
+def detect_invalid_chars(src_pdf_bytes: bytes, pdf_docs: fitz.Document = None) -> bool:
     """"
     检测PDF中是否包含非法字符
+    pdf_docs: 已经打开的src_pdf_bytes, 传入时不再重新打开
     """
     '''pdfminer比较慢,需要先随机抽取10页左右的sample'''
-    sample_docs = extract_pages(src_pdf_bytes)
+    sample_docs = sample_pages(pdf_docs) if pdf_docs is not None else extract_pages(src_pdf_bytes)
     sample_pdf_bytes = sample_docs.tobytes()
     sample_pdf_file_like_object = BytesIO(sample_pdf_bytes)
     laparams = LAParams(
@@ -0,0 +1,328 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from loguru import logger
+
+from magic_pdf.libs.clean_memory import clean_memory
+from magic_pdf.libs.config_reader import get_device
+from magic_pdf.model.batch_analyze import (MFD_BASE_BATCH_SIZE,
+                                           MFR_BASE_BATCH_SIZE,
+                                           OCR_DET_BASE_BATCH_SIZE,
+                                           YOLO_LAYOUT_BASE_BATCH_SIZE,
+                                           BatchAnalyze)
+
+OCR_REC_BASE_BATCH_SIZE = 256
+
+STAGE_LAYOUT = 'layout'
+STAGE_MFD = 'mfd'
+STAGE_MFR = 'mfr'
+STAGE_OCR_DET = 'ocr_det'
+STAGE_TABLE = 'table'
+STAGE_OCR_REC = 'ocr_rec'
+
+
+def get_continuous_batching_enable() -> bool:
+    return os.getenv('MINERU_CONTINUOUS_BATCHING', 'false').lower() in ['1', 'true']
+
+
+def _get_env_batch_size(env_name: str, default: int | None) -> int | None:
+    batch_size = os.getenv(env_name)
+    if batch_size is None:
+        return default
+    return max(1, int(batch_size))
+
+
+class _Job:
+    def __init__(self, page_num: int):
+        self.future = Future()
+        self.layout_res_list = [None] * page_num
+        self.remaining = page_num
+
+
+class _PageTask:
+    def __init__(self, job: _Job, index: int, image, ocr_enable: bool, lang):
+        self.job = job
+        self.index = index
+        self.image = image
+        self.ocr_enable = ocr_enable
+        self.lang = lang
+        self.layout_res = None
+        self.ocr_res_list_dict = None
+        # the ocr det, table and ocr rec items of this page not yet processed
+        self.pending = 0
+
+
+class ContinuousBatchScheduler:
+    def __init__(self, batch_analyze: BatchAnalyze, max_wait: float = None):
+        """Run the models of BatchAnalyze with continuous batching across
+        documents.
+
+        Every model has its own queue and its own batch size. A single worker
+        thread runs one batch at a time, picking the queue which is the
+        fullest relative to its batch size, so pages submitted later join the
+        in-flight work as soon as a model has free slots instead of waiting
+        for a fixed chunk of pages to finish all the models.
+
+        A queue holding less than a batch is only run once its oldest item
+        waited max_wait seconds, or once no page in flight upstream of it can
+        still join it; until then the worker waits for more pages.
+
+        Args:
+            batch_analyze (BatchAnalyze): the models and the per-stage predict functions
+            max_wait (float, optional): seconds a queued item may wait for its batch to fill up, 0 runs partial
+                batches at once. Defaults to MINERU_BATCH_MAX_WAIT_S or 1.0.
+        """
+        self.batch_analyze = batch_analyze
+        batch_ratio = batch_analyze.batch_ratio
+        self.batch_sizes = {
+            # None means the batch size of the model, resolved when the worker starts
+            STAGE_LAYOUT: _get_env_batch_size('MINERU_LAYOUT_BATCH_SIZE', None),
+            STAGE_MFD: _get_env_batch_size('MINERU_MFD_BATCH_SIZE', None),
+            # mfr is counted in formulas, ocr rec in text lines, the others in pages or tables
+            STAGE_MFR: _get_env_batch_size('MINERU_MFR_BATCH_SIZE', batch_ratio * MFR_BASE_BATCH_SIZE),
+            STAGE_OCR_DET: _get_env_batch_size('MINERU_OCR_DET_BATCH_SIZE', OCR_DET_BASE_BATCH_SIZE),
+            STAGE_TABLE: _get_env_batch_size('MINERU_TABLE_BATCH_SIZE', 1),
+            STAGE_OCR_REC: _get_env_batch_size('MINERU_OCR_REC_BATCH_SIZE', OCR_REC_BASE_BATCH_SIZE),
+        }
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv('MINERU_BATCH_MAX_WAIT_S', 1.0))
+
+        # stage key -> deque of (enqueue_time, weight, item), ordered upstream to downstream
+        self._queues = OrderedDict(
+            (stage, deque()) for stage in [STAGE_LAYOUT, STAGE_MFD, STAGE_MFR, STAGE_OCR_DET, STAGE_TABLE]
+        )
+        self._queue_weights = {stage: 0 for stage in self._queues}
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name='mineru-batch-scheduler', daemon=True)
+        self._worker.start()
+
+    def submit(self, images_with_extra_info: list) -> Future:
+        """Submit the pages of a document.
+
+        Args:
+            images_with_extra_info (list): [(np.ndarray, ocr_enable, lang), ...]
+
+        Returns:
+            Future: resolves to the layout_res of each page, the same as BatchAnalyze returns
+        """
+        job = _Job(len(images_with_extra_info))
+        if len(images_with_extra_info) == 0:
+            job.future.set_result([])
+            return job.future
+
+        with self._cond:
+            for index, (image, ocr_enable, lang) in enumerate(images_with_extra_info):
+                self._push(STAGE_LAYOUT, _PageTask(job, index, image, ocr_enable, lang))
+            self._cond.notify()
+        return job.future
+
+    def _push(self, stage: str, item, weight: int = 1):
+        if stage not in self._queues:
+            self._queues[stage] = deque()
+            self._queue_weights[stage] = 0
+        self._queues[stage].append((time.time(), weight, item))
+        self._queue_weights[stage] += weight
+
+    def _batch_size(self, stage: str) -> int:
+        return self.batch_sizes[stage.split(':')[0]]
+
+    def _select_stage(self):
+        """Pick the fullest ready queue relative to its batch size, ties go to
+        the downstream stage so that pages in flight are finished first.
+
+        A queue is ready when it holds a full batch, when its head waited
+        longer than max_wait (it then counts as full), or when the stages
+        upstream of it are empty, so nothing in flight can join its batch.
+        The layout queue is only fed by new documents and has to fill up or
+        time out.
+
+        Returns:
+            tuple: (the stage to run or None, the seconds until a partial queue times out or None)
+        """
+        now = time.time()
+        best_stage, best_fill = None, 0
+        timeout = None
+        upstream_busy = False
+        for stage, queue in self._queues.items():
+            if not queue:
+                continue
+            fill = min(self._queue_weights[stage] / self._batch_size(stage), 1.0)
+            waited = now - queue[0][0]
+            if waited >= self.max_wait:
+                fill = 1.0
+            ready = fill >= 1.0 or (stage != STAGE_LAYOUT and not upstream_busy)
+            upstream_busy = True
+            if not ready:
+                remaining = self.max_wait - waited
+                timeout = remaining if timeout is None else min(timeout, remaining)
+                continue
+            if fill >= best_fill:
+                best_stage, best_fill = stage, fill
+        return best_stage, timeout
+
+    def _pop_batch(self, stage: str) -> list:
+        queue = self._queues[stage]
+        batch_size = self._batch_size(stage)
+        batch, weight = [], 0
+        while queue and (not batch or weight + queue[0][1] <= batch_size):
+            _, item_weight, item = queue.popleft()
+            self._queue_weights[stage] -= item_weight
+            weight += item_weight
+            batch.append(item)
+        return batch
+
+    def _resolve_batch_sizes(self):
+        try:
+            if self.batch_sizes[STAGE_LAYOUT] is None:
+                self.batch_sizes[STAGE_LAYOUT] = self.batch_analyze.layout_batch_size()
+            if self.batch_sizes[STAGE_MFD] is None:
+                self.batch_sizes[STAGE_MFD] = (
+                    self.batch_analyze.mfd_batch_size() if self.batch_analyze.model.apply_formula else MFD_BASE_BATCH_SIZE
+                )
+        except Exception:
+            logger.exception('failed to get the batch size of the models, use the base batch size')
+            if self.batch_sizes[STAGE_LAYOUT] is None:
+                self.batch_sizes[STAGE_LAYOUT] = YOLO_LAYOUT_BASE_BATCH_SIZE
+            if self.batch_sizes[STAGE_MFD] is None:
+                self.batch_sizes[STAGE_MFD] = MFD_BASE_BATCH_SIZE
+
+    def _run(self):
+        self._resolve_batch_sizes()
+        while True:
+            with self._cond:
+                stage, timeout = self._select_stage()
+                if stage is None:
+                    # woken up by a new document, or when a partial batch times out
+                    self._cond.wait(timeout)
+                    continue
+                batch = self._pop_batch(stage)
+
+            pages = self._pages_of(stage, batch)
+            batch = [item for item, page in zip(batch, pages) if not page.job.future.done()]
+            if not batch:
+                continue
+            try:
+                self._run_stage(stage, batch)
+            except Exception as e:
+                logger.exception(f'{stage} failed on a batch of {len(batch)}')
+                for page in self._pages_of(stage, batch):
+                    if not page.job.future.done():
+                        page.job.future.set_exception(e)
+
+            with self._cond:
+                idle = not any(self._queues.values())
+            if idle:
+                clean_memory(get_device())
+
+    @staticmethod
+    def _pages_of(stage: str, batch: list) -> list:
+        if stage in [STAGE_LAYOUT, STAGE_MFD, STAGE_OCR_DET]:
+            return batch
+        # the mfr, table and ocr rec items are (page, item) pairs
+        return [page for page, _ in batch]
+
+    def _run_stage(self, stage: str, batch: list):
+        model = self.batch_analyze.model
+        if stage == STAGE_LAYOUT:
+            images_layout_res = self.batch_analyze.layout_predict(
+                [page.image for page in batch], self.batch_sizes[STAGE_LAYOUT]
+            )
+            for page, layout_res in zip(batch, images_layout_res):
+                page.layout_res = layout_res
+                if model.apply_formula:
+                    self._enqueue(STAGE_MFD, page)
+                else:
+                    self._collect(page)
+        elif stage == STAGE_MFD:
+            images_mfd_res = self.batch_analyze.mfd_predict(
+                [page.image for page in batch], self.batch_sizes[STAGE_MFD]
+            )
+            for page, mfd_res in zip(batch, images_mfd_res):
+                if len(mfd_res.boxes) > 0:
+                    self._enqueue(STAGE_MFR, (page, mfd_res), weight=len(mfd_res.boxes))
+                else:
+                    self._collect(page)
+        elif stage == STAGE_MFR:
+            images_formula_list = self.batch_analyze.mfr_predict(
+                [mfd_res for _, mfd_res in batch],
+                [page.image for page, _ in batch],
+                batch_size=self.batch_sizes[STAGE_MFR],
+            )
+            for (page, _), formula_list in zip(batch, images_formula_list):
+                page.layout_res += formula_list
+                self._collect(page)
+        elif stage == STAGE_OCR_DET:
+            self.batch_analyze.ocr_det_predict([page.ocr_res_list_dict for page in batch])
+            for page in batch:
+                page.ocr_res_list_dict = None
+                need_ocr_lists_by_lang = {}
+                for layout_res_item in page.layout_res:
+                    if layout_res_item['category_id'] in [15]:
+                        if 'np_img' in layout_res_item and 'lang' in layout_res_item:
+                            need_ocr_lists_by_lang.setdefault(layout_res_item['lang'], []).append(layout_res_item)
+                for lang, need_ocr_list in need_ocr_lists_by_lang.items():
+                    for layout_res_item in need_ocr_list:
+                        self._enqueue(f'{STAGE_OCR_REC}:{lang}', (page, layout_res_item))
+                page.pending += sum(len(need_ocr_list) for need_ocr_list in need_ocr_lists_by_lang.values())
+                self._release(page)
+        elif stage == STAGE_TABLE:
+            for page, table_res_dict in batch:
+                self.batch_analyze.table_predict(table_res_dict)
+                self._release(page)
+        elif stage.startswith(STAGE_OCR_REC):
+            lang = stage.split(':', 1)[1]
+            self.batch_analyze.ocr_rec_predict([layout_res_item for _, layout_res_item in batch], lang)
+            for page, _ in batch:
+                self._release(page)
+
+    def _enqueue(self, stage: str, item, weight: int = 1):
+        with self._cond:
+            self._push(stage, item, weight)
+
+    def _collect(self, page: _PageTask):
+        """Split the layout result into the ocr regions and the tables, and
+        queue them for the ocr and table models."""
+        ocr_res_list_dict, table_res_list = self.batch_analyze.get_ocr_and_table_res(
+            page.layout_res, page.image, page.ocr_enable, page.lang
+        )
+        page.ocr_res_list_dict = ocr_res_list_dict
+        if self.batch_analyze.model.apply_table:
+            page.pending += len(table_res_list)
+            for table_res_dict in table_res_list:
+                self._enqueue(STAGE_TABLE, (page, table_res_dict))
+        # the ocr det stage holds one pending count until the ocr rec items are queued
+        page.pending += 1
+        self._enqueue(STAGE_OCR_DET, page)
+
+    @staticmethod
+    def _release(page: _PageTask):
+        """Mark one pending item of the page as done, the page is finished when
+        nothing is pending."""
+        page.pending -= 1
+        if page.pending > 0:
+            return
+        page.image = None
+        job = page.job
+        job.layout_res_list[page.index] = page.layout_res
+        job.remaining -= 1
+        if job.remaining == 0 and not job.future.done():
+            job.future.set_result(job.layout_res_list)
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_batch_scheduler(show_log=False, layout_model=None, formula_enable=None, table_enable=None) -> ContinuousBatchScheduler:
+    """Get the scheduler shared by all the documents analyzed with the same model settings."""
+    key = (show_log, layout_model, formula_enable, table_enable)
+    with _schedulers_lock:
+        if key not in _schedulers:
+            from magic_pdf.model.doc_analyze_by_custom_model import (
+                ModelSingleton, get_batch_ratio)
+            batch_ratio = get_batch_ratio(get_device())
+            batch_analyze = BatchAnalyze(ModelSingleton(), batch_ratio, show_log, layout_model, formula_enable, table_enable)
+            _schedulers[key] = ContinuousBatchScheduler(batch_analyze)
+        return _schedulers[key]
@@ -1,5 +1,8 @@
+import copy
 import os
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import torch
@@ -16,12 +19,15 @@ from magic_pdf.model.sub_modules.model_utils import get_vram
 from magic_pdf.config.enums import SupportedPdfParseMethod
 import magic_pdf.model as model_config
 from magic_pdf.data.dataset import Dataset
+from magic_pdf.data.utils import (fitz_doc_to_image, get_render_worker_num,
+                                  parallel_set_images)
 from magic_pdf.libs.clean_memory import clean_memory
 from magic_pdf.libs.config_reader import (get_device, get_formula_config,
                                           get_layout_config,
                                           get_local_models_dir,
                                           get_table_recog_config)
 from magic_pdf.model.model_list import MODEL
+from magic_pdf.model.page_result_cache import PageResultCache
 
 class ModelSingleton:
     _instance = None
@@ -138,6 +144,12 @@ def doc_analyze(
     )
 
     MIN_BATCH_INFERENCE_SIZE = int(os.environ.get('MINERU_MIN_BATCH_INFERENCE_SIZE', 200))
+
+    render_worker_num = get_render_worker_num()
+    if render_worker_num > 1:
+        page_ids = [index for index in range(len(dataset)) if start_page_id <= index <= end_page_id]
+        parallel_set_images([dataset], [page_ids], num_workers=render_worker_num)
+
     images = []
     page_wh_list = []
     for index in range(len(dataset)):
@@ -149,16 +161,30 @@ def doc_analyze(
 
     images_with_extra_info = [(images[index], ocr, dataset._lang) for index in range(len(images))]
 
-    if len(images) >= MIN_BATCH_INFERENCE_SIZE:
-        batch_size = MIN_BATCH_INFERENCE_SIZE
-        batch_images = [images_with_extra_info[i:i+batch_size] for i in range(0, len(images_with_extra_info), batch_size)]
-    else:
-        batch_images = [images_with_extra_info]
+    from magic_pdf.model.batch_scheduler import (
+        get_batch_scheduler, get_continuous_batching_enable)
 
-    results = []
-    for batch_image in batch_images:
-        result = may_batch_image_analyze(batch_image, ocr, show_log,layout_model, formula_enable, table_enable)
-        results.extend(result)
+    def infer(images_with_extra_info):
+        if get_continuous_batching_enable():
+            scheduler = get_batch_scheduler(show_log, layout_model, formula_enable, table_enable)
+            return scheduler.submit(images_with_extra_info).result()
+
+        if len(images_with_extra_info) >= MIN_BATCH_INFERENCE_SIZE:
+            batch_size = MIN_BATCH_INFERENCE_SIZE
+            batch_images = [images_with_extra_info[i:i+batch_size] for i in range(0, len(images_with_extra_info), batch_size)]
+        else:
+            batch_images = [images_with_extra_info]
+
+        results = []
+        for batch_image in batch_images:
+            result = may_batch_image_analyze(batch_image, ocr, show_log,layout_model, formula_enable, table_enable)
+            results.extend(result)
+        return results
+
+    # 只有页面缓存中没有的页面需要推理
+    results = PageResultCache.from_env().analyze(
+        images_with_extra_info, infer, layout_model, formula_enable, table_enable
+    )
 
     model_json = []
     for index in range(len(dataset)):
@@ -177,6 +203,142 @@ def doc_analyze(
     from magic_pdf.operators.models import InferenceResult
     return InferenceResult(model_json, dataset)
 
+def iter_doc_analyze(
+    dataset: Dataset,
+    ocr: bool = False,
+    show_log: bool = False,
+    start_page_id=0,
+    end_page_id=None,
+    layout_model=None,
+    formula_enable=None,
+    table_enable=None,
+):
+    """Run model inference as a bounded page pipeline and yield results window by window.
+
+    Pages are rendered in the calling thread while a single inference worker runs the models on
+    the previously submitted window. At most MINERU_STREAMING_MAX_INFLIGHT_WINDOWS windows of
+    MINERU_STREAMING_WINDOW_SIZE page images are alive at a time, and the images are not cached
+    on the dataset, so peak memory no longer grows with the page count.
+
+    Yields:
+        list[dict]: the page dicts of one window, in page order, each shaped like an element of model_list
+    """
+    end_page_id = (
+        end_page_id
+        if end_page_id is not None and end_page_id >= 0
+        else len(dataset) - 1
+    )
+    window_size = int(os.environ.get('MINERU_STREAMING_WINDOW_SIZE', 16))
+    max_inflight_windows = max(1, int(os.environ.get('MINERU_STREAMING_MAX_INFLIGHT_WINDOWS', 2)))
+
+    page_ids = [index for index in range(len(dataset)) if start_page_id <= index <= end_page_id]
+    windows = [page_ids[i:i + window_size] for i in range(0, len(page_ids), window_size)]
+    page_cache = PageResultCache.from_env()
+
+    def infer(images_with_extra_info):
+        return may_batch_image_analyze(
+            images_with_extra_info, ocr, show_log, layout_model, formula_enable, table_enable,
+        )
+
+    def collect(window, page_wh_list, future):
+        results = future.result()
+        page_dicts = []
+        for page_id, result, (page_width, page_height) in zip(window, results, page_wh_list):
+            page_info = {'page_no': page_id, 'width': page_width, 'height': page_height}
+            page_dicts.append({'layout_dets': result, 'page_info': page_info})
+        return page_dicts
+
+    # fitz is not thread safe, so rendering stays in the calling thread and only inference is offloaded
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='mineru-infer') as executor:
+        inflight = deque()
+        for window in windows:
+            images_with_extra_info = []
+            page_wh_list = []
+            for index in window:
+                page_data = dataset.get_page(index)
+                # 语言检测等已经渲染过的页面直接复用
+                img_dict = page_data.get_image() if page_data.has_image() else fitz_doc_to_image(page_data.get_doc())
+                images_with_extra_info.append((img_dict['img'], ocr, dataset._lang))
+                page_wh_list.append((img_dict['width'], img_dict['height']))
+
+            future = executor.submit(
+                page_cache.analyze,
+                images_with_extra_info, infer, layout_model, formula_enable, table_enable,
+            )
+            inflight.append((window, page_wh_list, future))
+            del images_with_extra_info
+
+            if len(inflight) >= max_inflight_windows:
+                yield collect(*inflight.popleft())
+
+        while inflight:
+            yield collect(*inflight.popleft())
+
+
+def doc_analyze_streaming(
+    dataset: Dataset,
+    imageWriter,
+    ocr: bool = False,
+    show_log: bool = False,
+    start_page_id=0,
+    end_page_id=None,
+    lang=None,
+    layout_model=None,
+    formula_enable=None,
+    table_enable=None,
+    debug_mode=False,
+    on_window_parsed=None,
+):
+    """Inference and post-processing in one pipelined pass.
+
+    parse_page_core runs on each window as soon as its inference finishes, while the inference
+    worker already processes the next window. The cross-page stages (batched ocr rec, para_split,
+    llm aided) run once all pages are parsed. on_window_parsed, if given, receives the page infos
+    of each parsed window, see pdf_parse_union_streaming.
+
+    Returns:
+        tuple[InferenceResult, PipeResult]: the same results as doc_analyze followed by pipe_txt_mode or pipe_ocr_mode
+    """
+    from magic_pdf.config.constants import PARSE_TYPE_OCR, PARSE_TYPE_TXT
+    from magic_pdf.libs.version import __version__
+    from magic_pdf.operators.models import InferenceResult
+    from magic_pdf.operators.pipes import PipeResult
+    from magic_pdf.pdf_parse_union_core_v2 import pdf_parse_union_streaming
+
+    model_json = [
+        {'layout_dets': [], 'page_info': {'page_no': index, 'width': 0, 'height': 0}}
+        for index in range(len(dataset))
+    ]
+
+    def model_windows():
+        for window in iter_doc_analyze(
+            dataset, ocr, show_log, start_page_id, end_page_id, layout_model, formula_enable, table_enable
+        ):
+            for page_dict in window:
+                model_json[page_dict['page_info']['page_no']] = page_dict
+            # magic_model会修改传入的结果, 保持model_json为原始推理结果
+            yield copy.deepcopy(window)
+
+    parse_mode = SupportedPdfParseMethod.OCR if ocr else SupportedPdfParseMethod.TXT
+    pipe_res = pdf_parse_union_streaming(
+        model_windows(),
+        dataset,
+        imageWriter,
+        parse_mode,
+        start_page_id=start_page_id,
+        end_page_id=end_page_id,
+        debug_mode=debug_mode,
+        lang=lang,
+        on_window_parsed=on_window_parsed,
+    )
+    pipe_res['_parse_type'] = PARSE_TYPE_OCR if ocr else PARSE_TYPE_TXT
+    pipe_res['_version_name'] = __version__
+    if lang is not None:
+        pipe_res['lang'] = lang
+
+    return InferenceResult(model_json, dataset), PipeResult(pipe_res, dataset)
+
+
 def batch_doc_analyze(
     datasets: list[Dataset],
     parse_method: str = 'auto',
@@ -190,8 +352,21 @@ def batch_doc_analyze(
     batch_size = MIN_BATCH_INFERENCE_SIZE
     page_wh_list = []
 
+    render_worker_num = get_render_worker_num()
+    if render_worker_num > 1:
+        parallel_set_images(datasets, num_workers=render_worker_num)
+
+    from magic_pdf.model.batch_scheduler import (
+        get_batch_scheduler, get_continuous_batching_enable)
+    continuous_batching = get_continuous_batching_enable()
+    page_cache = PageResultCache.from_env()
+    if continuous_batching:
+        scheduler = get_batch_scheduler(show_log, layout_model, formula_enable, table_enable)
+        futures = []
+
     images_with_extra_info = []
     for dataset in datasets:
+        dataset_start = len(images_with_extra_info)
 
         ocr = False
         if parse_method == 'auto':
@@ -212,14 +387,30 @@ def batch_doc_analyze(
             page_wh_list.append((img_dict['width'], img_dict['height']))
             images_with_extra_info.append((img_dict['img'], ocr, _lang))
 
-    batch_images = [images_with_extra_info[i:i+batch_size] for i in range(0, len(images_with_extra_info), batch_size)]
+        if continuous_batching:
+            # 每个文档渲染完立即提交，与前面文档的推理重叠
+            futures.append(page_cache.submit(
+                images_with_extra_info[dataset_start:], scheduler.submit, layout_model, formula_enable, table_enable
+            ))
+
     results = []
-    processed_images_count = 0
-    for index, batch_image in enumerate(batch_images):
-        processed_images_count += len(batch_image)
-        logger.info(f'Batch {index + 1}/{len(batch_images)}: {processed_images_count} pages/{len(images_with_extra_info)} pages')
-        result = may_batch_image_analyze(batch_image, True, show_log, layout_model, formula_enable, table_enable)
-        results.extend(result)
+    if continuous_batching:
+        for index, future in enumerate(futures):
+            results.extend(future.result())
+            logger.info(f'Document {index + 1}/{len(futures)}: {len(results)} pages/{len(images_with_extra_info)} pages')
+    else:
+        def infer(images_with_extra_info):
+            infer_results = []
+            batch_images = [images_with_extra_info[i:i+batch_size] for i in range(0, len(images_with_extra_info), batch_size)]
+            processed_images_count = 0
+            for index, batch_image in enumerate(batch_images):
+                processed_images_count += len(batch_image)
+                logger.info(f'Batch {index + 1}/{len(batch_images)}: {processed_images_count} pages/{len(images_with_extra_info)} pages')
+                result = may_batch_image_analyze(batch_image, True, show_log, layout_model, formula_enable, table_enable)
+                infer_results.extend(result)
+            return infer_results
+
+        results = page_cache.analyze(images_with_extra_info, infer, layout_model, formula_enable, table_enable)
 
     infer_results = []
     from magic_pdf.operators.models import InferenceResult
@@ -236,22 +427,9 @@ def batch_doc_analyze(
     return infer_results
 
 
-def may_batch_image_analyze(
-        images_with_extra_info: list[(np.ndarray, bool, str)],
-        ocr: bool,
-        show_log: bool = False,
-        layout_model=None,
-        formula_enable=None,
-        table_enable=None):
-    # os.environ['CUDA_VISIBLE_DEVICES'] = str(idx)
-
-    from magic_pdf.model.batch_analyze import BatchAnalyze
-
-    model_manager = ModelSingleton()
-
-    # images = [image for image, _, _ in images_with_extra_info]
+def get_batch_ratio(device) -> int:
+    """Batch ratio of the models on device, scaled with the available VRAM."""
     batch_ratio = 1
-    device = get_device()
 
     if str(device).startswith('npu'):
         import torch_npu
@@ -277,7 +455,24 @@ def may_batch_image_analyze(
             # Default batch_ratio when VRAM can't be determined
             batch_ratio = 1
             logger.info(f'Could not determine GPU memory, using default batch_ratio: {batch_ratio}')
+    return batch_ratio
+
+
+def may_batch_image_analyze(
+        images_with_extra_info: list[(np.ndarray, bool, str)],
+        ocr: bool,
+        show_log: bool = False,
+        layout_model=None,
+        formula_enable=None,
+        table_enable=None):
+    # os.environ['CUDA_VISIBLE_DEVICES'] = str(idx)
 
+    from magic_pdf.model.batch_analyze import BatchAnalyze
+
+    model_manager = ModelSingleton()
+
+    # images = [image for image, _, _ in images_with_extra_info]
+    batch_ratio = get_batch_ratio(get_device())
 
     # doc_analyze_start = time.time()
 
@@ -1,10 +1,12 @@
 import enum
 
+import numpy as np
+
 from magic_pdf.config.model_block_type import ModelBlockTypeEnum
 from magic_pdf.config.ocr_content_type import CategoryId, ContentType
 from magic_pdf.data.dataset import Dataset
 from magic_pdf.libs.boxbase import (_is_in, bbox_distance, bbox_relative_pos,
-                                    calculate_iou)
+                                    calculate_iou_matrix)
 from magic_pdf.libs.coordinate_transform import get_scale_ratio
 from magic_pdf.pre_proc.remove_bbox_overlap import _remove_overlap_between_bbox
 
@@ -26,11 +28,14 @@ class MagicModel:
     def __fix_axis(self):
         for model_page_info in self.__model_list:
             need_remove_list = []
+            layout_dets = model_page_info['layout_dets']
+            if len(layout_dets) == 0:
+                # 没有检测结果的页(如流式解析中尚未推理的页)无需渲染页面计算缩放比例
+                continue
             page_no = model_page_info['page_info']['page_no']
             horizontal_scale_ratio, vertical_scale_ratio = get_scale_ratio(
                 model_page_info, self.__docs.get_page(page_no)
             )
-            layout_dets = model_page_info['layout_dets']
             for layout_det in layout_dets:
 
                 if layout_det.get('bbox') is not None:
@@ -67,41 +72,31 @@ class MagicModel:
 
     def __fix_by_remove_high_iou_and_low_confidence(self):
         for model_page_info in self.__model_list:
-            need_remove_list = []
             layout_dets = model_page_info['layout_dets']
-            for layout_det1 in layout_dets:
-                for layout_det2 in layout_dets:
-                    if layout_det1 == layout_det2:
-                        continue
-                    if layout_det1['category_id'] in [
-                        0,
-                        1,
-                        2,
-                        3,
-                        4,
-                        5,
-                        6,
-                        7,
-                        8,
-                        9,
-                    ] and layout_det2['category_id'] in [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]:
-                        if (
-                            calculate_iou(layout_det1['bbox'], layout_det2['bbox'])
-                            > 0.9
-                        ):
-                            if layout_det1['score'] < layout_det2['score']:
-                                layout_det_need_remove = layout_det1
-                            else:
-                                layout_det_need_remove = layout_det2
-
-                            if layout_det_need_remove not in need_remove_list:
-                                need_remove_list.append(layout_det_need_remove)
-                        else:
-                            continue
-                    else:
-                        continue
-            for need_remove in need_remove_list:
-                layout_dets.remove(need_remove)
+            # 只在layout类别(0-9)之间比较, 一次算出所有box两两之间的iou
+            layout_idx = [idx for idx, layout_det in enumerate(layout_dets) if layout_det['category_id'] in range(10)]
+            if len(layout_idx) < 2:
+                continue
+            iou = calculate_iou_matrix([layout_dets[idx]['bbox'] for idx in layout_idx])
+            scores = np.array([layout_dets[idx]['score'] for idx in layout_idx], dtype=np.float64)
+            np.fill_diagonal(iou, 0)
+
+            # 与另一个高iou的box相比置信度不高于它的需要删除, 置信度相同时两个都删除
+            need_remove = set()
+            for i, j in zip(*np.nonzero((iou > 0.9) & (scores[:, None] <= scores[None, :]))):
+                layout_det1, layout_det2 = layout_dets[layout_idx[i]], layout_dets[layout_idx[j]]
+                # 内容完全相同的两个box不互相比较
+                if layout_det1 != layout_det2:
+                    need_remove.add(layout_idx[i])
+
+            # 内容完全相同的多个box只删除第一个
+            removed = []
+            for idx in sorted(need_remove):
+                if not any(layout_dets[idx] == layout_dets[removed_idx] for removed_idx in removed
+                           if layout_dets[idx]['bbox'] == layout_dets[removed_idx]['bbox']):
+                    removed.append(idx)
+            removed = set(removed)
+            layout_dets[:] = [layout_det for idx, layout_det in enumerate(layout_dets) if idx not in removed]
 
     def __init__(self, model_list: list, docs: Dataset):
         self.__model_list = model_list
@@ -693,8 +688,12 @@ class MagicModel:
 
         def remove_duplicate_spans(spans):
             new_spans = []
+            # 相同的span的bbox一定相同, 只和bbox相同的span比较
+            spans_by_bbox = {}
             for span in spans:
-                if not any(span == existing_span for existing_span in new_spans):
+                same_bbox_spans = spans_by_bbox.setdefault(tuple(span['bbox']), [])
+                if not any(span == existing_span for existing_span in same_bbox_spans):
+                    same_bbox_spans.append(span)
                     new_spans.append(span)
             return new_spans
 
@@ -0,0 +1,131 @@
+import json
+import os
+import uuid
+
+from loguru import logger
+
+import magic_pdf.model as model_config
+from magic_pdf.libs.config_reader import (get_formula_config, get_layout_config, get_local_models_dir,
+                                          get_table_recog_config)
+from magic_pdf.libs.hash_utils import compute_md5, compute_sha256
+
+# Bump when the output of doc_analyze changes for the same models and settings, so stale results are never
+# reused. The version of magic_pdf is not part of the fingerprint: post-processing upgrades keep the cache.
+MODEL_JSON_CACHE_FORMAT_VERSION = 1
+
+
+def get_inference_fingerprint(ocr: bool, lang=None, layout_model=None, formula_enable=None, table_enable=None) -> str:
+    """The fingerprint of the models and settings doc_analyze depends on, the post-processing settings
+    (make mode, latex delimiters, llm aided...) are left out."""
+    fingerprint = {
+        'format': MODEL_JSON_CACHE_FORMAT_VERSION,
+        'ocr': ocr,
+        'lang': lang,
+        'layout_model': layout_model,
+        'formula_enable': formula_enable,
+        'table_enable': table_enable,
+        'model_mode': model_config.__model_mode__,
+        'models_dir': get_local_models_dir(),
+        'layout_config': get_layout_config(),
+        'formula_config': get_formula_config(),
+        'table_config': get_table_recog_config(),
+    }
+    return compute_sha256(json.dumps(fingerprint, sort_keys=True, ensure_ascii=False))
+
+
+class ModelJsonCache:
+    def __init__(self, cache_dir: str | None = None, max_bytes: int = 2048 * 1024 * 1024):
+        """Store the model json of the parsed documents, keyed by the document hash and the inference
+        fingerprint, so that re-parsing a document after changing only the post-processing skips doc_analyze.
+
+        Args:
+            cache_dir (str | None, optional): the directory of the cached model json. Defaults to None, which
+                disables the cache.
+            max_bytes (int, optional): the least recently used entries are evicted above this size. Defaults to 2GB.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """Build the cache from MINERU_MODEL_JSON_CACHE_DIR and MINERU_MODEL_JSON_CACHE_MAX_MB."""
+        return cls(
+            cache_dir=os.getenv('MINERU_MODEL_JSON_CACHE_DIR') or None,
+            max_bytes=max(1, int(os.getenv('MINERU_MODEL_JSON_CACHE_MAX_MB', 2048))) * 1024 * 1024,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.cache_dir is not None
+
+    @staticmethod
+    def make_key(pdf_bytes: bytes, ocr: bool, lang=None, layout_model=None, formula_enable=None,
+                 table_enable=None, start_page_id=0, end_page_id=None) -> str:
+        """The key of the model json of the pages start_page_id to end_page_id of pdf_bytes.
+
+        pdf_bytes must be the bytes given by the user: the pdf written again by pymupdf for a page range differs
+        at each run.
+        """
+        fingerprint = get_inference_fingerprint(ocr, lang, layout_model, formula_enable, table_enable)
+        page_range = f'{start_page_id}-{end_page_id if end_page_id is not None and end_page_id >= 0 else ""}'
+        return f'{compute_md5(pdf_bytes)}_{compute_sha256(f"{fingerprint}_{page_range}")[:16]}'
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}_model.json')
+
+    def get(self, key: str):
+        """The cached model list of key, or None."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                model_list = json.load(f)
+            # the mtime records the last access, for the eviction
+            os.utime(path)
+            return model_list
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f'model json cache entry {key} is unreadable: {e}')
+            return None
+
+    def put(self, key: str, model_list: list):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(model_list, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f'failed to store model json cache entry {key}: {e}')
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('_model.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+            logger.info(f'evicted model json cache entry {name}')
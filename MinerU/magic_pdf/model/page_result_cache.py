@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import numpy as np
+from loguru import logger
+
+from magic_pdf.model.model_json_cache import get_inference_fingerprint
+
+
+class PageResultCache:
+    def __init__(self, cache_dir: str | None = None, max_items: int = 100000):
+        """Cache the layout_dets of each page, keyed by the hash of the rendered page image and the inference
+        fingerprint, so that the unchanged pages of a re-uploaded, split or merged document skip the inference.
+
+        The results are kept in a sqlite database shared by all the processes using the same directory.
+
+        Args:
+            cache_dir (str | None, optional): the directory of the sqlite database. Defaults to None, which
+                disables the cache.
+            max_items (int, optional): the number of pages kept, the least recently used are evicted.
+                Defaults to 100000.
+        """
+        self.max_items = max_items
+        self._db_path = None
+        if cache_dir and max_items > 0:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._db_path = os.path.join(cache_dir, 'page_result_cache.sqlite3')
+            with self._connect() as conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS page (key TEXT PRIMARY KEY, result TEXT, atime REAL)')
+                conn.execute('CREATE INDEX IF NOT EXISTS page_atime ON page (atime)')
+
+    @classmethod
+    def from_env(cls):
+        """Build the cache from MINERU_PAGE_CACHE_DIR and MINERU_PAGE_CACHE_MAX_ITEMS."""
+        return cls(
+            cache_dir=os.getenv('MINERU_PAGE_CACHE_DIR') or None,
+            max_items=int(os.getenv('MINERU_PAGE_CACHE_MAX_ITEMS', 100000)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self._db_path is not None
+
+    @staticmethod
+    def make_key(image: np.ndarray, namespace: str) -> str:
+        """The exact hash of a rendered page image."""
+        array = np.ascontiguousarray(image)
+        hasher = hashlib.sha1(namespace.encode('utf-8'))
+        hasher.update(f'{array.shape}{array.dtype}'.encode('utf-8'))
+        hasher.update(array.tobytes())
+        return hasher.hexdigest()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self._db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, keys: list) -> dict:
+        """Get the cached results of keys.
+
+        Returns:
+            dict: key -> the json of the layout_dets of the keys found in the cache
+        """
+        if not self.enabled or not keys:
+            return {}
+        found = {}
+        unique_keys = list(set(keys))
+        try:
+            with self._connect() as conn:
+                for beg in range(0, len(unique_keys), 500):
+                    chunk = unique_keys[beg:beg + 500]
+                    rows = conn.execute(
+                        f'SELECT key, result FROM page WHERE key IN ({",".join("?" * len(chunk))})', chunk
+                    ).fetchall()
+                    found.update(rows)
+                    if rows:
+                        conn.executemany('UPDATE page SET atime = ? WHERE key = ?',
+                                         [(time.time(), key) for key, _ in rows])
+        except sqlite3.Error as e:
+            logger.warning(f'page result cache read failed: {e}')
+        return found
+
+    def put_many(self, results: dict):
+        """Store the results of keys.
+
+        Args:
+            results (dict): key -> the json of the layout_dets
+        """
+        if not self.enabled or not results:
+            return
+        try:
+            with self._connect() as conn:
+                now = time.time()
+                conn.executemany('INSERT OR REPLACE INTO page (key, result, atime) VALUES (?, ?, ?)',
+                                 [(key, result, now) for key, result in results.items()])
+                count = conn.execute('SELECT COUNT(*) FROM page').fetchone()[0]
+                if count > self.max_items:
+                    conn.execute('DELETE FROM page WHERE key IN (SELECT key FROM page ORDER BY atime LIMIT ?)',
+                                 (count - self.max_items,))
+        except sqlite3.Error as e:
+            logger.warning(f'page result cache write failed: {e}')
+
+    def _lookup(self, images_with_extra_info, layout_model, formula_enable, table_enable):
+        namespaces = {}
+        keys = []
+        for image, ocr, lang in images_with_extra_info:
+            if (ocr, lang) not in namespaces:
+                namespaces[(ocr, lang)] = get_inference_fingerprint(ocr, lang, layout_model, formula_enable,
+                                                                    table_enable)
+            keys.append(self.make_key(image, namespaces[(ocr, lang)]))
+        found = self.get_many(keys)
+        # the same page twice in a batch is inferred once
+        missing = {}
+        for index, key in enumerate(keys):
+            if key not in found and key not in missing:
+                missing[key] = index
+        logger.info(f'page result cache: {len(keys) - len(missing)}/{len(keys)} pages skip the inference')
+        return keys, found, missing
+
+    def _complete(self, keys, found, missing, missing_results):
+        new = {key: json.dumps(result, ensure_ascii=False) for key, result in zip(missing, missing_results)}
+        self.put_many(new)
+        first_results = dict(zip(missing.values(), missing_results))
+        # every page gets its own copy, magic_model modifies the results in place
+        return [
+            first_results[index] if index in first_results else json.loads(found.get(key) or new[key])
+            for index, key in enumerate(keys)
+        ]
+
+    def analyze(self, images_with_extra_info, infer_fn, layout_model=None, formula_enable=None,
+                table_enable=None) -> list:
+        """Run infer_fn on the pages missing from the cache only.
+
+        Args:
+            images_with_extra_info (list): (image, ocr, lang) of the pages
+            infer_fn: returns the layout_dets of a list of (image, ocr, lang)
+
+        Returns:
+            list: the layout_dets of each page
+        """
+        if not self.enabled:
+            return infer_fn(images_with_extra_info)
+        keys, found, missing = self._lookup(images_with_extra_info, layout_model, formula_enable, table_enable)
+        missing_results = infer_fn([images_with_extra_info[index] for index in missing.values()]) if missing else []
+        return self._complete(keys, found, missing, missing_results)
+
+    def submit(self, images_with_extra_info, submit_fn, layout_model=None, formula_enable=None,
+               table_enable=None) -> Future:
+        """As analyze, for a submit_fn which returns a future of the layout_dets, e.g. BatchScheduler.submit."""
+        if not self.enabled:
+            return submit_fn(images_with_extra_info)
+        keys, found, missing = self._lookup(images_with_extra_info, layout_model, formula_enable, table_enable)
+        future = Future()
+        if not missing:
+            future.set_result(self._complete(keys, found, missing, []))
+            return future
+
+        def done(missing_future):
+            try:
+                future.set_result(self._complete(keys, found, missing, missing_future.result()))
+            except Exception as e:
+                future.set_exception(e)
+
+        submit_fn([images_with_extra_info[index] for index in missing.values()]).add_done_callback(done)
+        return future
@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+import uuid
+from typing import Callable
+
+import numpy as np
+import torch
+from loguru import logger
+from tqdm import tqdm
+
+from magic_pdf.libs.clean_memory import clean_memory
+
+
+def get_auto_batch_size_enable() -> bool:
+    return os.getenv('MINERU_AUTO_BATCH_SIZE', 'false').lower() in ['1', 'true']
+
+
+def is_oom_error(e: Exception) -> bool:
+    if isinstance(e, torch.cuda.OutOfMemoryError):
+        return True
+    return isinstance(e, RuntimeError) and 'out of memory' in str(e).lower()
+
+
+def batch_predict_with_oom_fallback(predict_fn: Callable[[list], list], images: list, batch_size: int,
+                                    device='cpu', desc: str = 'Predict') -> tuple[list, int]:
+    """Run predict_fn over images in batches, halving the batch size whenever a
+    batch runs out of memory.
+
+    Args:
+        predict_fn (Callable[[list], list]): predicts a batch of images, returns one result per image
+        images (list): the images
+        batch_size (int): the batch size to start with
+        device (optional): the device of the model, its cache is cleaned after an OOM. Defaults to 'cpu'.
+        desc (str, optional): the description of the progress bar. Defaults to 'Predict'.
+
+    Returns:
+        tuple[list, int]: the results of the images, and the batch size finally used
+    """
+    results = []
+    batch_size = max(1, batch_size)
+    index = 0
+    with tqdm(total=len(images), desc=desc) as pbar:
+        while index < len(images):
+            batch_images = images[index: index + batch_size]
+            try:
+                batch_results = predict_fn(batch_images)
+            except Exception as e:
+                if batch_size == 1 or not is_oom_error(e):
+                    raise
+                clean_memory(str(device))
+                batch_size = batch_size // 2
+                logger.warning(f'{desc} out of memory, retry with batch size {batch_size}')
+                continue
+            results.extend(batch_results)
+            index += len(batch_images)
+            pbar.update(len(batch_images))
+    return results, batch_size
+
+
+def get_probe_image(width: int = 1654, height: int = 2339) -> np.ndarray:
+    """A page sized noise image used to probe the batch size, A4 at 200 dpi by default."""
+    return np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+class BatchSizeTuner:
+    def __init__(self, cache_path: str = None, max_batch_size: int = None, memory_fraction: float = None):
+        """Probe the largest safe batch size of a model on a device, the results
+        are cached per device in a json file so that the probe runs only once.
+
+        Args:
+            cache_path (str, optional): the json file of the cached batch sizes. Defaults to
+                MINERU_BATCH_SIZE_CACHE_PATH or ~/.cache/magic_pdf/batch_size.json.
+            max_batch_size (int, optional): the upper bound of the probe. Defaults to MINERU_AUTO_BATCH_SIZE_MAX or 64.
+            memory_fraction (float, optional): the share of the device memory a batch may reserve. Defaults to
+                MINERU_AUTO_BATCH_SIZE_MEMORY_FRACTION or 0.6.
+        """
+        self.cache_path = cache_path or os.getenv(
+            'MINERU_BATCH_SIZE_CACHE_PATH',
+            os.path.join(os.path.expanduser('~'), '.cache', 'magic_pdf', 'batch_size.json'),
+        )
+        self.max_batch_size = max_batch_size or int(os.getenv('MINERU_AUTO_BATCH_SIZE_MAX', 64))
+        self.memory_fraction = memory_fraction or float(os.getenv('MINERU_AUTO_BATCH_SIZE_MEMORY_FRACTION', 0.6))
+        self._batch_sizes = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _device_module(device):
+        device = str(device)
+        if device.startswith('cuda') and torch.cuda.is_available():
+            return torch.cuda
+        if device.startswith('npu'):
+            import torch_npu
+            if torch_npu.npu.is_available():
+                return torch_npu.npu
+        return None
+
+    def get_device_name(self, device) -> str | None:
+        """The name of device, None if batch sizes of the device are not tuned (cpu, mps)."""
+        device_module = self._device_module(device)
+        if device_module is None:
+            return None
+        total_memory_gb = round(device_module.get_device_properties(device).total_memory / (1024 ** 3))
+        return f'{device_module.get_device_name(device)}_{total_memory_gb}GB'
+
+    def get_peak_memory_fraction(self, device) -> float:
+        device_module = self._device_module(device)
+        return device_module.max_memory_reserved(device) / device_module.get_device_properties(device).total_memory
+
+    def reset_peak_memory(self, device):
+        self._device_module(device).reset_peak_memory_stats(device)
+
+    def _cache_key(self, model_name: str, device_name: str) -> str:
+        return f'{model_name}|{device_name}|{self.max_batch_size}|{self.memory_fraction}'
+
+    def _load(self) -> dict:
+        if self._batch_sizes is None:
+            self._batch_sizes = {}
+            if os.path.exists(self.cache_path):
+                try:
+                    with open(self.cache_path, 'r', encoding='utf-8') as f:
+                        self._batch_sizes = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f'failed to load batch size cache {self.cache_path}: {e}')
+        return self._batch_sizes
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = f'{self.cache_path}.{uuid.uuid4().hex}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._batch_sizes, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f'failed to save batch size cache {self.cache_path}: {e}')
+
+    def get(self, model_name: str, device, probe_fn: Callable[[int], None], default: int) -> int:
+        """Get the batch size of model on device, probe it on the first call.
+
+        Args:
+            model_name (str): the name of the model
+            device: the device of the model
+            probe_fn (Callable[[int], None]): runs one batch of the given size, without any oom fallback
+            default (int): the batch size on devices which are not tuned
+
+        Returns:
+            int: the batch size
+        """
+        device_name = self.get_device_name(device)
+        if device_name is None:
+            return default
+        key = self._cache_key(model_name, device_name)
+        with self._lock:
+            batch_sizes = self._load()
+            if key not in batch_sizes:
+                batch_sizes[key] = self.probe(probe_fn, device)
+                logger.info(f'auto batch size of {model_name} on {device_name}: {batch_sizes[key]}')
+                self._save()
+            return batch_sizes[key]
+
+    def update(self, model_name: str, device, batch_size: int):
+        """Lower the cached batch size of model on device, after it ran out of memory at runtime."""
+        device_name = self.get_device_name(device)
+        if device_name is None:
+            return
+        key = self._cache_key(model_name, device_name)
+        with self._lock:
+            batch_sizes = self._load()
+            if batch_sizes.get(key, batch_size + 1) > batch_size:
+                batch_sizes[key] = batch_size
+                self._save()
+
+    def probe(self, probe_fn: Callable[[int], None], device) -> int:
+        """Double the batch size until it runs out of memory, reserves more than
+        memory_fraction of the device memory, or reaches max_batch_size.
+
+        Returns:
+            int: the largest batch size which passed
+        """
+        best_batch_size = 1
+        batch_size = 1
+        while batch_size <= self.max_batch_size:
+            self.reset_peak_memory(device)
+            try:
+                probe_fn(batch_size)
+            except Exception as e:
+                if not is_oom_error(e):
+                    raise
+                break
+            finally:
+                clean_memory(str(device))
+            if self.get_peak_memory_fraction(device) > self.memory_fraction:
+                break
+            best_batch_size = batch_size
+            batch_size *= 2
+        return best_batch_size
+
+
+_tuner = None
+_tuner_lock = threading.Lock()
+
+
+def get_batch_size_tuner() -> BatchSizeTuner:
+    global _tuner
+    with _tuner_lock:
+        if _tuner is None:
+            _tuner = BatchSizeTuner()
+        return _tuner
@@ -2,13 +2,14 @@
 import os
 from pathlib import Path
 
+import numpy as np
 import yaml
 os.environ['NO_ALBUMENTATIONS_UPDATE'] = '1'  # 禁止albumentations检查更新
 
 from magic_pdf.config.constants import MODEL_NAME
 from magic_pdf.data.utils import load_images_from_pdf
 from magic_pdf.libs.config_reader import get_local_models_dir, get_device
-from magic_pdf.libs.pdf_check import extract_pages
+from magic_pdf.libs.pdf_check import calculate_sample_count, extract_pages
 from magic_pdf.model.model_list import AtomicModel
 from magic_pdf.model.sub_modules.model_init import AtomModelSingleton
 
@@ -25,23 +26,34 @@ def get_model_config():
     return root_dir, local_models_dir, device, configs
 
 
-def get_text_images(simple_images):
-    _, local_models_dir, device, configs = get_model_config()
-    atom_model_manager = AtomModelSingleton()
-    temp_layout_model = atom_model_manager.get_atom_model(
-        atom_model_name=AtomicModel.Layout,
-        layout_model_name=MODEL_NAME.DocLayout_YOLO,
-        doclayout_yolo_weights=str(
-            os.path.join(
-                local_models_dir, configs['weights'][MODEL_NAME.DocLayout_YOLO]
-            )
-        ),
-        device=device,
-    )
+def get_text_images(simple_images, images_layout_res=None):
+    """Crop the text blocks of the page images.
+
+    Args:
+        simple_images (list): the {'img': np.ndarray, ...} of the pages
+        images_layout_res (list, optional): the layout_dets of the pages when they are already known, e.g. from
+            doc_analyze. Defaults to None, which runs DocLayout-YOLO; the same model instance serves doc_analyze
+            and reuses these results for the same page images instead of a second layout pass.
+    """
+    if images_layout_res is None:
+        _, local_models_dir, device, configs = get_model_config()
+        atom_model_manager = AtomModelSingleton()
+        temp_layout_model = atom_model_manager.get_atom_model(
+            atom_model_name=AtomicModel.Layout,
+            layout_model_name=MODEL_NAME.DocLayout_YOLO,
+            doclayout_yolo_weights=str(
+                os.path.join(
+                    local_models_dir, configs['weights'][MODEL_NAME.DocLayout_YOLO]
+                )
+            ),
+            device=device,
+        )
+        images_layout_res = [
+            temp_layout_model.predict(simple_image['img'], remember=True) for simple_image in simple_images
+        ]
     text_images = []
-    for simple_image in simple_images:
+    for simple_image, layout_res in zip(simple_images, images_layout_res):
         image = simple_image['img']
-        layout_res = temp_layout_model.predict(image)
         # 给textblock截图
         for res in layout_res:
             if res['category_id'] in [1]:
@@ -53,11 +65,33 @@ def get_text_images(simple_images):
     return text_images
 
 
-def auto_detect_lang(pdf_bytes: bytes):
-    sample_docs = extract_pages(pdf_bytes)
-    sample_pdf_bytes = sample_docs.tobytes()
-    simple_images = load_images_from_pdf(sample_pdf_bytes, dpi=200)
-    text_images = get_text_images(simple_images)
+def auto_detect_lang(pdf_bytes: bytes, dataset=None):
+    """Detect the language of the text of a random sample of pages.
+
+    Args:
+        pdf_bytes (bytes): the pdf
+        dataset (Dataset, optional): the opened pdf_bytes, the sampled pages are rendered through its image store
+            and shared with doc_analyze. Defaults to None, which opens pdf_bytes again.
+    """
+    if dataset is not None:
+        total_page = len(dataset)
+        page_ids = np.random.choice(total_page, calculate_sample_count(total_page), replace=False)
+        simple_images = [dataset.get_page(int(page_id)).get_image() for page_id in page_ids]
+    else:
+        sample_docs = extract_pages(pdf_bytes)
+        sample_pdf_bytes = sample_docs.tobytes()
+        simple_images = load_images_from_pdf(sample_pdf_bytes, dpi=200)
+    return detect_lang(simple_images)
+
+
+def detect_lang(simple_images, images_layout_res=None):
+    """Detect the language of the text blocks of page images.
+
+    Args:
+        simple_images (list): the {'img': np.ndarray, ...} of the pages
+        images_layout_res (list, optional): the layout_dets of the pages, see get_text_images. Defaults to None.
+    """
+    text_images = get_text_images(simple_images, images_layout_res)
     langdetect_model = model_init(MODEL_NAME.YOLO_V11_LangDetect)
     lang = langdetect_model.do_detect(text_images)
     return lang
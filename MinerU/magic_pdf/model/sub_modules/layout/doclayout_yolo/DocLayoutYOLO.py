@@ -1,13 +1,64 @@
+import threading
+import weakref
+
 from doclayout_yolo import YOLOv10
-from tqdm import tqdm
+
+from magic_pdf.model.sub_modules.batch_size_tuner import (
+    batch_predict_with_oom_fallback, get_probe_image)
 
 
 class DocLayoutYOLOModel(object):
     def __init__(self, weight, device):
         self.model = YOLOv10(weight)
         self.device = device
+        # lowered when a batch runs out of memory
+        self.batch_size_limit = None
+        # id(image) -> (weakref of image, layout_res) of the images predicted with remember=True, e.g. the pages
+        # sampled by the language detection, so that batch_predict of the same page images does not run the model again
+        self._predicted = {}
+        self._predicted_lock = threading.Lock()
+
+    def _remember(self, image, layout_res):
+        key = id(image)
+
+        def forget(_, key=key):
+            with self._predicted_lock:
+                self._predicted.pop(key, None)
+
+        try:
+            image_ref = weakref.ref(image, forget)
+        except TypeError:
+            return
+        with self._predicted_lock:
+            self._predicted[key] = (image_ref, layout_res)
+
+    def _recall(self, image):
+        """The remembered layout_res of image, given out once."""
+        with self._predicted_lock:
+            entry = self._predicted.get(id(image))
+            if entry is None or entry[0]() is not image:
+                return None
+            del self._predicted[id(image)]
+            return entry[1]
+
+    def predict(self, image, remember=False):
+        """Predict the layout of one image.
 
-    def predict(self, image):
+        Args:
+            image: the page image
+            remember (bool, optional): keep the result for the next batch_predict of the same image object, e.g.
+                for the pages sampled by the language detection. The result comes from the single-image
+                preprocessing (letterbox with auto=True), which is the one of a batch whose images all share a
+                shape, so batch_predict only reuses it for such batches. Defaults to False.
+        """
+        layout_res = self._predict(image)
+        if not remember:
+            return layout_res
+        self._remember(image, layout_res)
+        # the caller gets its own copy, the remembered one is given to batch_predict
+        return [dict(item, poly=list(item['poly'])) for item in layout_res]
+
+    def _predict(self, image):
         layout_res = []
         doclayout_yolo_res = self.model.predict(
             image,
@@ -30,35 +81,56 @@ class DocLayoutYOLOModel(object):
             layout_res.append(new_item)
         return layout_res
 
-    def batch_predict(self, images: list, batch_size: int) -> list:
+    def _predict_batch(self, images: list) -> list:
         images_layout_res = []
-        # for index in range(0, len(images), batch_size):
-        for index in tqdm(range(0, len(images), batch_size), desc="Layout Predict"):
-            doclayout_yolo_res = [
-                image_res.cpu()
-                for image_res in self.model.predict(
-                    images[index : index + batch_size],
-                    imgsz=1280,
-                    conf=0.10,
-                    iou=0.45,
-                    verbose=False,
-                    device=self.device,
-                )
-            ]
-            for image_res in doclayout_yolo_res:
-                layout_res = []
-                for xyxy, conf, cla in zip(
-                    image_res.boxes.xyxy,
-                    image_res.boxes.conf,
-                    image_res.boxes.cls,
-                ):
-                    xmin, ymin, xmax, ymax = [int(p.item()) for p in xyxy]
-                    new_item = {
-                        "category_id": int(cla.item()),
-                        "poly": [xmin, ymin, xmax, ymin, xmax, ymax, xmin, ymax],
-                        "score": round(float(conf.item()), 3),
-                    }
-                    layout_res.append(new_item)
-                images_layout_res.append(layout_res)
+        doclayout_yolo_res = [
+            image_res.cpu()
+            for image_res in self.model.predict(
+                images,
+                imgsz=1280,
+                conf=0.10,
+                iou=0.45,
+                verbose=False,
+                device=self.device,
+            )
+        ]
+        for image_res in doclayout_yolo_res:
+            layout_res = []
+            for xyxy, conf, cla in zip(
+                image_res.boxes.xyxy,
+                image_res.boxes.conf,
+                image_res.boxes.cls,
+            ):
+                xmin, ymin, xmax, ymax = [int(p.item()) for p in xyxy]
+                new_item = {
+                    "category_id": int(cla.item()),
+                    "poly": [xmin, ymin, xmax, ymin, xmax, ymax, xmin, ymax],
+                    "score": round(float(conf.item()), 3),
+                }
+                layout_res.append(new_item)
+            images_layout_res.append(layout_res)
+        return images_layout_res
+
+    def probe_batch_size(self, batch_size: int):
+        self._predict_batch([get_probe_image()] * batch_size)
+
+    def batch_predict(self, images: list, batch_size: int) -> list:
+        # a batch of images of different shapes is letterboxed with auto=False, unlike the remembered results
+        if len({getattr(image, 'shape', None) for image in images}) == 1:
+            images_layout_res = [self._recall(image) for image in images]
+        else:
+            images_layout_res = [None] * len(images)
+        missing = [index for index, layout_res in enumerate(images_layout_res) if layout_res is None]
+        if not missing:
+            return images_layout_res
 
+        if self.batch_size_limit is not None:
+            batch_size = min(batch_size, self.batch_size_limit)
+        missing_layout_res, used_batch_size = batch_predict_with_oom_fallback(
+            self._predict_batch, [images[index] for index in missing], batch_size, self.device, desc="Layout Predict"
+        )
+        if used_batch_size < batch_size:
+            self.batch_size_limit = used_batch_size
+        for index, layout_res in zip(missing, missing_layout_res):
+            images_layout_res[index] = layout_res
         return images_layout_res
@@ -1,11 +1,15 @@
-from tqdm import tqdm
 from ultralytics import YOLO
 
+from magic_pdf.model.sub_modules.batch_size_tuner import (
+    batch_predict_with_oom_fallback, get_probe_image)
+
 
 class YOLOv8MFDModel(object):
     def __init__(self, weight, device="cpu"):
         self.mfd_model = YOLO(weight)
         self.device = device
+        # lowered when a batch runs out of memory
+        self.batch_size_limit = None
 
     def predict(self, image):
         mfd_res = self.mfd_model.predict(
@@ -13,21 +17,28 @@ class YOLOv8MFDModel(object):
         )[0]
         return mfd_res
 
+    def _predict_batch(self, images: list) -> list:
+        return [
+            image_res.cpu()
+            for image_res in self.mfd_model.predict(
+                images,
+                imgsz=1888,
+                conf=0.25,
+                iou=0.45,
+                verbose=False,
+                device=self.device,
+            )
+        ]
+
+    def probe_batch_size(self, batch_size: int):
+        self._predict_batch([get_probe_image()] * batch_size)
+
     def batch_predict(self, images: list, batch_size: int) -> list:
-        images_mfd_res = []
-        # for index in range(0, len(images), batch_size):
-        for index in tqdm(range(0, len(images), batch_size), desc="MFD Predict"):
-            mfd_res = [
-                image_res.cpu()
-                for image_res in self.mfd_model.predict(
-                    images[index : index + batch_size],
-                    imgsz=1888,
-                    conf=0.25,
-                    iou=0.45,
-                    verbose=False,
-                    device=self.device,
-                )
-            ]
-            for image_res in mfd_res:
-                images_mfd_res.append(image_res)
+        if self.batch_size_limit is not None:
+            batch_size = min(batch_size, self.batch_size_limit)
+        images_mfd_res, used_batch_size = batch_predict_with_oom_fallback(
+            self._predict_batch, images, batch_size, self.device, desc="MFD Predict"
+        )
+        if used_batch_size < batch_size:
+            self.batch_size_limit = used_batch_size
         return images_mfd_res
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import torch
+from loguru import logger
+
+
+class MFRCache:
+    def __init__(self, namespace: str = '', max_items: int = 10000, disk_dir: str | None = None,
+                 disk_max_items: int = 1000000):
+        """Cache the latex of formula crops, keyed by the hash of the normalized
+        crop tensor, so formulas seen before skip the decoding.
+
+        The latest results are kept in memory, and, when disk_dir is set, also
+        in a sqlite database shared by all the processes using the same directory.
+
+        Args:
+            namespace (str, optional): identifies the model, results of different models never mix. Defaults to ''.
+            max_items (int, optional): the number of results kept in memory. Defaults to 10000, 0 disables the cache.
+            disk_dir (str | None, optional): the directory of the sqlite database. Defaults to None, which disables the disk cache.
+            disk_max_items (int, optional): the number of results kept on disk, the least recently used are evicted. Defaults to 1000000.
+        """
+        self.namespace = namespace
+        self.max_items = max_items
+        self.disk_max_items = disk_max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_path = None
+        if disk_dir and max_items > 0:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._db_path = os.path.join(disk_dir, 'mfr_cache.sqlite3')
+            with self._connect() as conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS mfr (key TEXT PRIMARY KEY, latex TEXT, atime REAL)')
+                conn.execute('CREATE INDEX IF NOT EXISTS mfr_atime ON mfr (atime)')
+
+    @classmethod
+    def from_env(cls, namespace: str = ''):
+        """Build the cache from MINERU_MFR_CACHE_SIZE, MINERU_MFR_CACHE_DIR and MINERU_MFR_CACHE_DISK_MAX_ITEMS."""
+        return cls(
+            namespace=namespace,
+            max_items=int(os.getenv('MINERU_MFR_CACHE_SIZE', 10000)),
+            disk_dir=os.getenv('MINERU_MFR_CACHE_DIR') or None,
+            disk_max_items=int(os.getenv('MINERU_MFR_CACHE_DISK_MAX_ITEMS', 1000000)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_items > 0
+
+    def make_key(self, image: torch.Tensor) -> str:
+        """The exact hash of a normalized crop tensor."""
+        array = image.detach().cpu().contiguous().numpy()
+        hasher = hashlib.sha1(self.namespace.encode('utf-8'))
+        hasher.update(str(array.shape).encode('utf-8'))
+        hasher.update(array.tobytes())
+        return hasher.hexdigest()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self._db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, keys: list) -> dict:
+        """Get the cached latex of keys.
+
+        Returns:
+            dict: key -> latex of the keys found in the cache
+        """
+        if not self.enabled:
+            return {}
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._items:
+                    self._items.move_to_end(key)
+                    found[key] = self._items[key]
+
+        missing = [key for key in set(keys) if key not in found]
+        if self._db_path is not None and missing:
+            try:
+                with self._connect() as conn:
+                    for beg in range(0, len(missing), 500):
+                        chunk = missing[beg:beg + 500]
+                        rows = conn.execute(
+                            f'SELECT key, latex FROM mfr WHERE key IN ({",".join("?" * len(chunk))})', chunk
+                        ).fetchall()
+                        found.update(rows)
+                        if rows:
+                            conn.executemany('UPDATE mfr SET atime = ? WHERE key = ?',
+                                             [(time.time(), key) for key, _ in rows])
+            except sqlite3.Error as e:
+                logger.warning(f'mfr disk cache read failed: {e}')
+            with self._lock:
+                for key in missing:
+                    if key in found:
+                        self._put_memory(key, found[key])
+        return found
+
+    def put_many(self, results: dict):
+        """Store the latex of keys.
+
+        Args:
+            results (dict): key -> latex
+        """
+        if not self.enabled or not results:
+            return
+        with self._lock:
+            for key, latex in results.items():
+                self._put_memory(key, latex)
+        if self._db_path is not None:
+            try:
+                with self._connect() as conn:
+                    now = time.time()
+                    conn.executemany('INSERT OR REPLACE INTO mfr (key, latex, atime) VALUES (?, ?, ?)',
+                                     [(key, latex, now) for key, latex in results.items()])
+                    count = conn.execute('SELECT COUNT(*) FROM mfr').fetchone()[0]
+                    if count > self.disk_max_items:
+                        conn.execute('DELETE FROM mfr WHERE key IN (SELECT key FROM mfr ORDER BY atime LIMIT ?)',
+                                     (count - self.disk_max_items,))
+            except sqlite3.Error as e:
+                logger.warning(f'mfr disk cache write failed: {e}')
+
+    def _put_memory(self, key: str, latex: str):
+        self._items[key] = latex
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
@@ -1,7 +1,16 @@
+import os
+
 import torch
+from loguru import logger
 from torch.utils.data import DataLoader, Dataset
 from tqdm import tqdm
 
+from magic_pdf.model.sub_modules.mfr.mfr_cache import MFRCache
+
+
+def get_mfr_continuous_decoding_enable() -> bool:
+    return os.getenv('MINERU_MFR_CONTINUOUS_DECODING', 'false').lower() in ['1', 'true']
+
 
 class MathDataset(Dataset):
     def __init__(self, image_paths, transform=None):
@@ -30,6 +39,13 @@ class UnimernetModel(object):
         if not _device_.startswith("cpu"):
             self.model = self.model.to(dtype=torch.float16)
         self.model.eval()
+        self.continuous_decoding = get_mfr_continuous_decoding_enable()
+        if self.continuous_decoding and not self.model.supports_continuous_decoding():
+            # 连续批处理只支持 greedy 解码, 权重自带的 generation_config 不是 greedy 时使用 generate
+            logger.warning('the generation_config of the mfr model is not greedy, continuous decoding is disabled')
+            self.continuous_decoding = False
+        # fp16 may decode differently, so the dtype is part of the cache namespace
+        self.cache = MFRCache.from_env(namespace=f"{os.path.basename(os.path.normpath(weight_dir))}_{self.model.dtype}")
 
     def predict(self, mfd_res, image):
         formula_list = []
@@ -94,42 +110,59 @@ class UnimernetModel(object):
             images_formula_list.append(formula_list)
             backfill_list += formula_list
 
-        # Stable sort by area
-        image_info.sort(key=lambda x: x[0])  # sort by area
-        sorted_indices = [x[1] for x in image_info]
-        sorted_images = [x[2] for x in image_info]
-
-        # Create mapping for results
-        index_mapping = {new_idx: old_idx for new_idx, old_idx in enumerate(sorted_indices)}
+        # The hash of the normalized crop is the key of the cache, the tensors are
+        # not kept here to bound the memory, the uncached ones are normalized again below
+        if self.cache.enabled:
+            cache_keys = [self.cache.make_key(self.model.transform(bbox_img)) for bbox_img in mf_image_list]
+        else:
+            cache_keys = [str(idx) for idx in range(len(mf_image_list))]
+        cached_results = self.cache.get_many(cache_keys)
+
+        # Only the first crop of each uncached key is decoded
+        seen_keys = set()
+        decode_info = []
+        for area, idx, _ in image_info:
+            key = cache_keys[idx]
+            if key in cached_results or key in seen_keys:
+                continue
+            seen_keys.add(key)
+            decode_info.append((area, idx))
 
-        # Create dataset with sorted images
-        dataset = MathDataset(sorted_images, transform=self.model.transform)
-        dataloader = DataLoader(dataset, batch_size=batch_size, num_workers=0)
+        # Stable sort by area
+        decode_info.sort(key=lambda x: x[0])  # sort by area
+        sorted_indices = [x[1] for x in decode_info]
 
         # Process batches and store results
-        mfr_res = []
-        # for mf_img in dataloader:
-
-        with tqdm(total=len(sorted_images), desc="MFR Predict") as pbar:
-            for index, mf_img in enumerate(dataloader):
-                mf_img = mf_img.to(dtype=self.model.dtype)
-                mf_img = mf_img.to(self.device)
-                with torch.no_grad():
-                    output = self.model.generate({"image": mf_img})
-                mfr_res.extend(output["fixed_str"])
-
-                # 更新进度条，每次增加batch_size，但要注意最后一个batch可能不足batch_size
-                current_batch_size = min(batch_size, len(sorted_images) - index * batch_size)
-                pbar.update(current_batch_size)
-
-        # Restore original order
-        unsorted_results = [""] * len(mfr_res)
-        for new_idx, latex in enumerate(mfr_res):
-            original_idx = index_mapping[new_idx]
-            unsorted_results[original_idx] = latex
+        decoded_results = {}
+        with tqdm(total=len(mf_image_list), desc="MFR Predict") as pbar:
+            pbar.update(len(mf_image_list) - len(sorted_indices))
+            if self.continuous_decoding:
+                # finished slots are refilled with the next crops instead of waiting for the whole batch
+                def load_fn(indices):
+                    mf_img = torch.stack([self.model.transform(mf_image_list[sorted_indices[i]]) for i in indices])
+                    return mf_img.to(dtype=self.model.dtype).to(self.device)
+
+                output = self.model.generate_continuous(len(sorted_indices), load_fn, batch_size, pbar.update)
+                for idx, latex in zip(sorted_indices, output["fixed_str"]):
+                    decoded_results[cache_keys[idx]] = latex
+            else:
+                for index in range(0, len(sorted_indices), batch_size):
+                    batch_indices = sorted_indices[index: index + batch_size]
+                    mf_img = torch.stack([self.model.transform(mf_image_list[idx]) for idx in batch_indices])
+                    mf_img = mf_img.to(dtype=self.model.dtype)
+                    mf_img = mf_img.to(self.device)
+                    with torch.no_grad():
+                        output = self.model.generate({"image": mf_img})
+                    for idx, latex in zip(batch_indices, output["fixed_str"]):
+                        decoded_results[cache_keys[idx]] = latex
+
+                    pbar.update(len(batch_indices))
+
+        if self.cache.enabled:
+            self.cache.put_many(decoded_results)
 
         # Fill results back
-        for res, latex in zip(backfill_list, unsorted_results):
-            res["latex"] = latex
+        for res, key in zip(backfill_list, cache_keys):
+            res["latex"] = cached_results[key] if key in cached_results else decoded_results[key]
 
         return images_formula_list
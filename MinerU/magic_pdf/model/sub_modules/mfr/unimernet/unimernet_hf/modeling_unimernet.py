@@ -3,6 +3,7 @@ import re
 import warnings
 from typing import Optional
 
+import numpy as np
 import torch
 from ftfy import fix_text
 from loguru import logger
@@ -12,7 +13,7 @@ from transformers import VisionEncoderDecoderConfig, VisionEncoderDecoderModel
 from transformers.models.vision_encoder_decoder.modeling_vision_encoder_decoder import logger as base_model_logger
 
 from .unimer_swin import UnimerSwinConfig, UnimerSwinModel, UnimerSwinImageProcessor
-from .unimer_mbart import UnimerMBartConfig, UnimerMBartForCausalLM
+from .unimer_mbart import UnimerMBartConfig, UnimerMBartForCausalLM, UnimerMBartContinuousDecoder
 
 AutoConfig.register(UnimerSwinConfig.model_type, UnimerSwinConfig)
 AutoConfig.register(UnimerMBartConfig.model_type, UnimerMBartConfig)
@@ -374,6 +375,38 @@ def latex_rm_whitespace(s: str):
     return s
 
 
+# generation_config 中改变 greedy 解码结果的参数及其不生效时的取值
+NON_GREEDY_GENERATION_DEFAULTS = {
+    "num_beams": (None, 1),
+    "num_beam_groups": (None, 1),
+    "do_sample": (None, False),
+    "penalty_alpha": (None,),
+    "repetition_penalty": (None, 1.0),
+    "encoder_repetition_penalty": (None, 1.0),
+    "no_repeat_ngram_size": (None, 0),
+    "encoder_no_repeat_ngram_size": (None, 0),
+    "bad_words_ids": (None,),
+    "min_length": (None, 0),
+    "min_new_tokens": (None, 0),
+    "suppress_tokens": (None,),
+    "begin_suppress_tokens": (None,),
+    "forced_bos_token_id": (None,),
+    "sequence_bias": (None,),
+}
+
+
+def is_greedy_generation_config(generation_config) -> bool:
+    """Whether `generate` decodes greedily with generation_config, in which case generate_continuous gives the
+    same results."""
+    if generation_config is None:
+        return True
+    for name, defaults in NON_GREEDY_GENERATION_DEFAULTS.items():
+        value = getattr(generation_config, name, None)
+        if value not in defaults and value != []:
+            return False
+    return True
+
+
 class UnimernetModel(VisionEncoderDecoderModel):
     def __init__(
         self,
@@ -480,8 +513,59 @@ class UnimernetModel(VisionEncoderDecoderModel):
         )
 
         outputs = outputs[:, 1:].cpu().numpy()
+        return self._decode_outputs(outputs)
+
+    def _decode_outputs(self, outputs):
         pred_tokens = self.tokenizer.detokenize(outputs)
         pred_str = self.tokenizer.token2str(outputs)
         fixed_str = [latex_rm_whitespace(s) for s in pred_str]
         return {"pred_ids": outputs, "pred_tokens": pred_tokens, "pred_str": pred_str, "fixed_str": fixed_str}
 
+    def encode(self, pixel_values):
+        """The encoder hidden states of the images, projected to the hidden size of the decoder."""
+        if pixel_values.shape[1] == 1:
+            pixel_values = pixel_values.repeat(1, 3, 1, 1)
+        encoder_hidden_states = self.encoder(pixel_values=pixel_values)[0]
+        if (
+            self.encoder.config.hidden_size != self.decoder.config.hidden_size
+            and getattr(self.decoder.config, "cross_attention_hidden_size", None) is None
+        ):
+            encoder_hidden_states = self.enc_to_dec_proj(encoder_hidden_states)
+        return encoder_hidden_states
+
+    def supports_continuous_decoding(self) -> bool:
+        """generate_continuous only decodes greedily, the generation_config shipped with the weights must not
+        ask for more (beams, sampling, penalties...)."""
+        return is_greedy_generation_config(getattr(self, "generation_config", None))
+
+    def generate_continuous(self, num_images: int, load_fn, batch_size: int = 64, on_finished=None):
+        """Greedy decoding with continuous batching, same results as `generate` without the padding of
+        finished sequences in a batch, see UnimerMBartContinuousDecoder.
+
+        Args:
+            num_images (int): the number of images, which enter the batch in their order
+            load_fn: returns the normalized images of the given indices as a tensor on the device of the model
+            batch_size (int, optional): the number of sequences decoded at the same time. Defaults to 64.
+            on_finished (optional): called with the number of images finished by a decoding step
+
+        Returns:
+            dict: the same as `generate`
+        """
+        tokenizer = self.tokenizer.tokenizer
+        continuous_decoder = UnimerMBartContinuousDecoder(
+            self.decoder,
+            bos_token_id=tokenizer.bos_token_id,
+            eos_token_id=tokenizer.eos_token_id,
+            max_new_tokens=tokenizer.model_max_length,
+            max_batch_size=batch_size,
+            forced_eos_token_id=getattr(self.generation_config, "forced_eos_token_id", None),
+        )
+        sequences = continuous_decoder.decode(num_images, lambda indices: self.encode(load_fn(indices)), on_finished)
+        self.last_decoding_stats = continuous_decoder.last_stats
+
+        max_length = max([len(seq) for seq in sequences], default=0)
+        outputs = np.full((num_images, max_length), tokenizer.pad_token_id, dtype=np.int64)
+        for i, seq in enumerate(sequences):
+            outputs[i, :len(seq)] = seq
+        return self._decode_outputs(outputs)
+
@@ -1,8 +1,10 @@
 from .configuration_unimer_mbart import UnimerMBartConfig
 from .modeling_unimer_mbart import UnimerMBartModel, UnimerMBartForCausalLM
+from .decoding_unimer_mbart import UnimerMBartContinuousDecoder
 
 __all__ = [
     "UnimerMBartConfig",
     "UnimerMBartModel",
     "UnimerMBartForCausalLM",
+    "UnimerMBartContinuousDecoder",
 ]
@@ -0,0 +1,238 @@
+import time
+from typing import Callable, List, Optional
+
+import torch
+from loguru import logger
+
+from .modeling_unimer_mbart import UnimerMBartForCausalLM
+
+
+class UnimerMBartContinuousDecoder:
+    """Greedy decoding with continuous batching.
+
+    A fixed number of slots decode in lockstep, one token per step. When the sequence of a slot emits EOS, or
+    reaches `max_new_tokens`, the slot is freed and refilled with the next sequence, so that long formulas no
+    longer keep a whole batch of finished short ones waiting.
+
+    The key/value cache is a set of slot buffers allocated once and reused by all the sequences: the
+    self-attention buffers grow with the longest sequence being decoded, the cross-attention key/values are
+    projected from the encoder output once per sequence when it enters a slot. The active slots are kept at the
+    front of the buffers, each row attends to its own cached length through the attention mask and is embedded
+    at its own position.
+    """
+
+    def __init__(
+        self,
+        decoder: UnimerMBartForCausalLM,
+        bos_token_id: int,
+        eos_token_id: int,
+        max_new_tokens: int,
+        max_batch_size: int = 64,
+        refill_size: Optional[int] = None,
+        forced_eos_token_id: Optional[int] = None,
+    ):
+        """
+        Args:
+            decoder (UnimerMBartForCausalLM): the decoder
+            bos_token_id (int): the first input token of each sequence
+            eos_token_id (int): the token which ends a sequence
+            max_new_tokens (int): the maximum number of tokens generated per sequence
+            max_batch_size (int, optional): the number of slots. Defaults to 64.
+            refill_size (int, optional): the encoder is called once at least this many slots are free, to
+                batch the encoding of new sequences. Defaults to a quarter of the slots.
+            forced_eos_token_id (int, optional): the token forced as the last one of sequences which reach
+                max_new_tokens, as `generate` does. Defaults to None.
+        """
+        self.decoder = decoder
+        self.bos_token_id = bos_token_id
+        self.eos_token_id = eos_token_id
+        self.max_new_tokens = max_new_tokens
+        self.max_batch_size = max(1, max_batch_size)
+        self.refill_size = max(1, refill_size or self.max_batch_size // 4)
+        self.forced_eos_token_id = forced_eos_token_id
+        self.last_stats = {}
+
+    def _layers(self):
+        return self.decoder.get_decoder().layers
+
+    def _alloc(self, num_slots, encoder_hidden_states, capacity):
+        """Allocate the slot buffers, the sizes are taken from the projections of the first layer."""
+        encoder_length = encoder_hidden_states.shape[1]
+        buffers = []
+        for layer in self._layers():
+            self_attn, cross_attn = layer.self_attn, layer.encoder_attn
+            # zeros, as nan in the masked positions of the cache would still reach the attention output
+            new = encoder_hidden_states.new_zeros
+            buffers.append([
+                new(num_slots, self_attn.num_heads, capacity, self_attn.squeeze_head_dim),
+                new(num_slots, self_attn.num_heads, capacity, self_attn.head_dim),
+                new(num_slots, cross_attn.num_heads, encoder_length, cross_attn.squeeze_head_dim),
+                new(num_slots, cross_attn.num_heads, encoder_length, cross_attn.head_dim),
+            ])
+        return buffers
+
+    @staticmethod
+    def _resize(buffers, num_active, capacity):
+        """Reallocate the self-attention buffers with capacity, keeping the active rows."""
+        for layer_buffers in buffers:
+            for i in range(2):
+                old = layer_buffers[i]
+                new = old.new_zeros(old.shape[0], old.shape[1], capacity, old.shape[3])
+                length = min(capacity, old.shape[2])
+                new[:num_active, :, :length] = old[:num_active, :, :length]
+                layer_buffers[i] = new
+
+    @torch.no_grad()
+    def decode(
+        self,
+        num_sequences: int,
+        encode_fn: Callable[[List[int]], torch.Tensor],
+        on_finished: Optional[Callable[[int], None]] = None,
+    ) -> List[List[int]]:
+        """Decode num_sequences sequences, which enter the slots in their order.
+
+        Args:
+            num_sequences (int): the number of sequences
+            encode_fn (Callable[[List[int]], torch.Tensor]): returns the encoder hidden states of the given
+                sequence indices, of shape `(len(indices), encoder_sequence_length, hidden_size)`
+            on_finished (Callable[[int], None], optional): called with the number of sequences finished by a step
+
+        Returns:
+            List[List[int]]: the generated tokens of each sequence, without the bos token, ending with the eos
+                token unless max_new_tokens was reached first
+        """
+        results = [None] * num_sequences
+        if num_sequences == 0:
+            return results
+
+        start = time.time()
+        num_tokens = 0
+        num_steps = 0
+        num_slots = min(self.max_batch_size, num_sequences)
+        buffers = None
+        encoder_states = None
+        capacity = 0
+        device = None
+
+        next_index = 0
+        num_active = 0
+        slot_index = []  # the sequence index of each active slot
+        slot_tokens = []  # the generated tokens of each active slot
+        lengths = None  # the number of cached tokens of each slot
+        input_ids = None  # the next input token of each slot
+
+        while next_index < num_sequences or num_active > 0:
+            # refill the free slots
+            num_free = num_slots - num_active
+            num_remaining = num_sequences - next_index
+            if num_remaining > 0 and (num_active == 0 or num_free >= min(self.refill_size, num_remaining)):
+                new_indices = list(range(next_index, next_index + min(num_free, num_remaining)))
+                next_index += len(new_indices)
+                hidden_states = encode_fn(new_indices)
+                if buffers is None:
+                    device = hidden_states.device
+                    capacity = min(self.max_new_tokens, 32)
+                    buffers = self._alloc(num_slots, hidden_states, capacity)
+                    encoder_states = hidden_states.new_empty(num_slots, *hidden_states.shape[1:])
+                    lengths = torch.zeros(num_slots, dtype=torch.long, device=device)
+                    input_ids = torch.full((num_slots,), self.bos_token_id, dtype=torch.long, device=device)
+                rows = slice(num_active, num_active + len(new_indices))
+                encoder_states[rows] = hidden_states
+                for layer, layer_buffers in zip(self._layers(), buffers):
+                    cross_attn = layer.encoder_attn
+                    layer_buffers[2][rows] = cross_attn._shape_qk(cross_attn.k_proj(hidden_states), -1, len(new_indices))
+                    layer_buffers[3][rows] = cross_attn._shape_v(cross_attn.v_proj(hidden_states), -1, len(new_indices))
+                lengths[rows] = 0
+                input_ids[rows] = self.bos_token_id
+                slot_index += new_indices
+                slot_tokens += [[] for _ in new_indices]
+                num_active += len(new_indices)
+
+                # release the memory of long sequences which have finished
+                max_length = int(lengths[:num_active].max())
+                if capacity > 32 and max_length * 4 <= capacity:
+                    capacity = max(32, capacity // 2)
+                    self._resize(buffers, num_active, capacity)
+
+            # one decoding step of the active slots
+            past_length = int(lengths[:num_active].max())
+            if past_length + 1 > capacity:
+                capacity = min(self.max_new_tokens, capacity * 2)
+                self._resize(buffers, num_active, capacity)
+            past_key_values = tuple(
+                (k[:num_active, :, :past_length], v[:num_active, :, :past_length], ck[:num_active], cv[:num_active])
+                for k, v, ck, cv in buffers
+            )
+            active_lengths = lengths[:num_active].clone()
+            key_positions = torch.arange(past_length + 1, device=device)
+            attention_mask = (key_positions[None, :] < active_lengths[:, None]) | (key_positions[None, :] == past_length)
+            outputs = self.decoder(
+                input_ids=input_ids[:num_active, None],
+                attention_mask=attention_mask.long(),
+                encoder_hidden_states=encoder_states[:num_active],
+                past_key_values=past_key_values,
+                position_ids=active_lengths[:, None],
+                use_cache=True,
+                return_dict=True,
+            )
+
+            # append the key/values of the step to the buffers
+            rows = torch.arange(num_active, device=device)
+            for layer_buffers, present in zip(buffers, outputs.past_key_values):
+                layer_buffers[0][rows, :, active_lengths] = present[0][:, :, past_length]
+                layer_buffers[1][rows, :, active_lengths] = present[1][:, :, past_length]
+            lengths[:num_active] += 1
+
+            next_tokens = outputs.logits[:, -1].argmax(dim=-1)
+            if self.forced_eos_token_id is not None:
+                last = active_lengths + 1 == self.max_new_tokens
+                next_tokens = torch.where(last, torch.full_like(next_tokens, self.forced_eos_token_id), next_tokens)
+            input_ids[:num_active] = next_tokens
+            num_steps += 1
+            num_tokens += num_active
+
+            finished = []
+            for slot, token in enumerate(next_tokens.tolist()):
+                slot_tokens[slot].append(token)
+                if token == self.eos_token_id or len(slot_tokens[slot]) >= self.max_new_tokens:
+                    finished.append(slot)
+            if not finished:
+                continue
+            for slot in finished:
+                results[slot_index[slot]] = slot_tokens[slot]
+
+            # move the last active slots into the freed ones, to keep the active slots in front
+            finished_set = set(finished)
+            keep = [slot for slot in range(num_active) if slot not in finished_set]
+            holes = [slot for slot in finished if slot < len(keep)]
+            movers = [slot for slot in keep if slot >= len(keep)]
+            if holes:
+                src = torch.tensor(movers, device=device)
+                dst = torch.tensor(holes, device=device)
+                for layer_buffers in buffers:
+                    for buffer in layer_buffers:
+                        buffer[dst] = buffer[src]
+                encoder_states[dst] = encoder_states[src]
+                lengths[dst] = lengths[src]
+                input_ids[dst] = input_ids[src]
+                for hole, mover in zip(holes, movers):
+                    slot_index[hole] = slot_index[mover]
+                    slot_tokens[hole] = slot_tokens[mover]
+            num_active = len(keep)
+            del slot_index[num_active:], slot_tokens[num_active:]
+            if on_finished is not None:
+                on_finished(len(finished))
+
+        elapsed = time.time() - start
+        self.last_stats = {
+            'sequences': num_sequences,
+            'tokens': num_tokens,
+            'steps': num_steps,
+            'seconds': elapsed,
+            'tokens_per_second': num_tokens / elapsed if elapsed > 0 else 0.0,
+        }
+        logger.info(
+            f"mfr decoded {num_sequences} formulas, {num_tokens} tokens in {num_steps} steps, "
+            f"{elapsed:.2f}s, {self.last_stats['tokens_per_second']:.1f} tokens/s"
+        )
+        return results
@@ -152,8 +152,13 @@ class UnimerMBartLearnedPositionalEmbedding(nn.Embedding):
         self.offset = 2
         super().__init__(num_embeddings + self.offset, embedding_dim)
 
-    def forward(self, input_ids: torch.Tensor, past_key_values_length: int = 0):
-        """`input_ids' shape is expected to be [bsz x seqlen]."""
+    def forward(self, input_ids: torch.Tensor, past_key_values_length: int = 0,
+                position_ids: Optional[torch.LongTensor] = None):
+        """`input_ids' shape is expected to be [bsz x seqlen].
+        `position_ids` of the same shape overrides the positions, e.g. rows of a batch decoded from different steps."""
+
+        if position_ids is not None:
+            return super().forward(position_ids.to(self.weight.device) + self.offset)
 
         bsz, seq_len = input_ids.shape[:2]
         positions = torch.arange(
@@ -1329,6 +1334,7 @@ class UnimerMBartDecoder(UnimerMBartPreTrainedModel):
         output_attentions: Optional[bool] = None,
         output_hidden_states: Optional[bool] = None,
         return_dict: Optional[bool] = None,
+        position_ids: Optional[torch.LongTensor] = None,
     ) -> Union[Tuple, BaseModelOutputWithPastAndCrossAttentions]:
         r"""
         Args:
@@ -1394,6 +1400,10 @@ class UnimerMBartDecoder(UnimerMBartPreTrainedModel):
                 for more detail.
             return_dict (`bool`, *optional*):
                 Whether or not to return a [`~utils.ModelOutput`] instead of a plain tuple.
+            position_ids (`torch.LongTensor` of shape `(batch_size, sequence_length)`, *optional*):
+                Positions of the input tokens, defaults to the positions following `past_key_values`. Required when
+                the rows of the batch have cached different numbers of tokens, the cache padding of each row is then
+                masked by `attention_mask` of shape `(batch_size, past_key_values_length + sequence_length)`.
         """
         output_attentions = output_attentions if output_attentions is not None else self.config.output_attentions
         output_hidden_states = (
@@ -1459,7 +1469,7 @@ class UnimerMBartDecoder(UnimerMBartPreTrainedModel):
                 )
 
         # embed positions
-        positions = self.embed_positions(input, past_key_values_length)
+        positions = self.embed_positions(input, past_key_values_length, position_ids)
 
         hidden_states = inputs_embeds + positions.to(inputs_embeds.device)
 
@@ -2182,6 +2192,7 @@ class UnimerMBartForCausalLM(UnimerMBartPreTrainedModel, GenerationMixin):
         output_hidden_states: Optional[bool] = None,
         return_dict: Optional[bool] = None,
         count_gt: Optional[torch.LongTensor] = None,
+        position_ids: Optional[torch.LongTensor] = None,
     ) -> Union[Tuple, CausalLMOutputWithCrossAttentions]:
         r"""
         Args:
@@ -2248,6 +2259,8 @@ class UnimerMBartForCausalLM(UnimerMBartPreTrainedModel, GenerationMixin):
                 for more detail.
             return_dict (`bool`, *optional*):
                 Whether or not to return a [`~utils.ModelOutput`] instead of a plain tuple.
+            position_ids (`torch.LongTensor` of shape `(batch_size, sequence_length)`, *optional*):
+                Positions of the input tokens, see [`UnimerMBartDecoder.forward`].
 
         Returns:
 
@@ -2291,6 +2304,7 @@ class UnimerMBartForCausalLM(UnimerMBartPreTrainedModel, GenerationMixin):
             output_attentions=output_attentions,
             output_hidden_states=output_hidden_states,
             return_dict=return_dict,
+            position_ids=position_ids,
         )
 
         logits = self.lm_head(outputs[0])
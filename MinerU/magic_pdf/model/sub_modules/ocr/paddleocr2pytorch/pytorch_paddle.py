@@ -120,16 +120,7 @@ class PytorchPaddleOCR(TextSystem):
                     img = preprocess_image(img)
                     dt_boxes, elapse = self.text_detector(img)
                     # logger.debug("dt_boxes num : {}, elapsed : {}".format(len(dt_boxes), elapse))
-                    if dt_boxes is None:
-                        ocr_res.append(None)
-                        continue
-                    dt_boxes = sorted_boxes(dt_boxes)
-                    # merge_det_boxes 和 update_det_boxes 都会把poly转成bbox再转回poly，因此需要过滤所有倾斜程度较大的文本框
-                    dt_boxes = merge_det_boxes(dt_boxes)
-                    if mfd_res:
-                        dt_boxes = update_det_boxes(dt_boxes, mfd_res)
-                    tmp_res = [box.tolist() for box in dt_boxes]
-                    ocr_res.append(tmp_res)
+                    ocr_res.append(self.__det_post_process(dt_boxes, mfd_res))
                 return ocr_res
             elif not det and rec:
                 ocr_res = []
@@ -142,6 +133,36 @@ class PytorchPaddleOCR(TextSystem):
                     ocr_res.append(rec_res)
                 return ocr_res
 
+    def det_batch(self, imgs, mfd_res_list=None):
+        """Detect the text boxes of independent crops in batches.
+
+        Args:
+            imgs (list): the crops
+            mfd_res_list (list, optional): the mfd_res of each crop. Defaults to None.
+
+        Returns:
+            list: the detected boxes of each crop, None for a crop without boxes
+        """
+        imgs = [preprocess_image(check_img(img)) for img in imgs]
+        if mfd_res_list is None:
+            mfd_res_list = [None] * len(imgs)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            dt_boxes_list, elapse = self.text_detector.batch_call(imgs)
+        return [self.__det_post_process(dt_boxes, mfd_res)
+                for dt_boxes, mfd_res in zip(dt_boxes_list, mfd_res_list)]
+
+    @staticmethod
+    def __det_post_process(dt_boxes, mfd_res=None):
+        if dt_boxes is None:
+            return None
+        dt_boxes = sorted_boxes(dt_boxes)
+        # merge_det_boxes 和 update_det_boxes 都会把poly转成bbox再转回poly，因此需要过滤所有倾斜程度较大的文本框
+        dt_boxes = merge_det_boxes(dt_boxes)
+        if mfd_res:
+            dt_boxes = update_det_boxes(dt_boxes, mfd_res)
+        return [box.tolist() for box in dt_boxes]
+
     def __call__(self, img, mfd_res=None):
 
         if img is None:
@@ -14,6 +14,8 @@ class TextDetector(BaseOCRV20):
         self.args = args
         self.det_algorithm = args.det_algorithm
         self.device = args.device
+        self.det_batch_num = args.det_batch_num
+        self.det_max_pad_ratio = args.det_max_pad_ratio
         pre_process_list = [{
             'DetResizeForTest': {
                 'limit_side_len': args.det_limit_side_len,
@@ -170,23 +172,7 @@ class TextDetector(BaseOCRV20):
         dt_boxes = np.array(dt_boxes_new)
         return dt_boxes
 
-    def __call__(self, img):
-        ori_im = img.copy()
-        data = {'image': img}
-        data = transform(data, self.preprocess_op)
-        img, shape_list = data
-        if img is None:
-            return None, 0
-        img = np.expand_dims(img, axis=0)
-        shape_list = np.expand_dims(shape_list, axis=0)
-        img = img.copy()
-        starttime = time.time()
-
-        with torch.no_grad():
-            inp = torch.from_numpy(img)
-            inp = inp.to(self.device)
-            outputs = self.net(inp)
-
+    def _get_preds(self, outputs):
         preds = {}
         if self.det_algorithm == "EAST":
             preds['f_geo'] = outputs['f_geo'].cpu().numpy()
@@ -203,15 +189,113 @@ class TextDetector(BaseOCRV20):
                 preds['level_{}'.format(i)] = output
         else:
             raise NotImplementedError
+        return preds
 
-        post_result = self.postprocess_op(preds, shape_list)
-        dt_boxes = post_result[0]['points']
+    def _filter_det_res(self, dt_boxes, image_shape):
         if (self.det_algorithm == "SAST" and
             self.det_sast_polygon) or (self.det_algorithm in ["PSE", "FCE"] and
                                        self.postprocess_op.box_type == 'poly'):
-            dt_boxes = self.filter_tag_det_res_only_clip(dt_boxes, ori_im.shape)
+            return self.filter_tag_det_res_only_clip(dt_boxes, image_shape)
         else:
-            dt_boxes = self.filter_tag_det_res(dt_boxes, ori_im.shape)
+            return self.filter_tag_det_res(dt_boxes, image_shape)
+
+    def _group_by_size(self, sizes, batch_size):
+        """
+        sort the images by size and group them into batches, an image joins a batch
+        only if padding the batch to its largest image wastes at most det_max_pad_ratio of the area.
+        With the default det_max_pad_ratio of 0 only images of the same size share a batch, so the
+        results are the same as detecting each image alone
+        """
+        order = sorted(range(len(sizes)), key=lambda i: (sizes[i][0], sizes[i][1]))
+        batches = []
+        batch, max_h, max_w, area = [], 0, 0, 0
+        for index in order:
+            h, w = sizes[index]
+            new_max_h, new_max_w = max(max_h, h), max(max_w, w)
+            new_area = area + h * w
+            if batch and (len(batch) >= batch_size or
+                          new_max_h * new_max_w * (len(batch) + 1) > new_area * (1 + self.det_max_pad_ratio)):
+                batches.append(batch)
+                batch, new_max_h, new_max_w, new_area = [], h, w, h * w
+            batch.append(index)
+            max_h, max_w, area = new_max_h, new_max_w, new_area
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def batch_call(self, img_list, batch_size=None):
+        """
+        detect the text of several images, images of the same size (or of similar size,
+        padded, when det_max_pad_ratio > 0) are stacked into one tensor per forward pass
+
+        Returns:
+            list of dt_boxes (None if the image can not be resized) in the order of img_list, total elapse
+        """
+        if self.det_algorithm not in ['DB', 'DB++']:
+            # only the DB maps can be cropped back to each image
+            results = [self(img) for img in img_list]
+            return [dt_boxes for dt_boxes, _ in results], sum(elapse for _, elapse in results)
+
+        batch_size = batch_size or self.det_batch_num
+        dt_boxes_list = [None] * len(img_list)
+        inputs, shapes, valid_indices = [], [], []
+        for index, img in enumerate(img_list):
+            data = transform({'image': img}, self.preprocess_op)
+            if data is None or data[0] is None:
+                continue
+            inputs.append(data[0])
+            shapes.append(data[1])
+            valid_indices.append(index)
+
+        starttime = time.time()
+        sizes = [inp.shape[1:3] for inp in inputs]
+        for batch in self._group_by_size(sizes, batch_size):
+            max_h = max(sizes[i][0] for i in batch)
+            max_w = max(sizes[i][1] for i in batch)
+            # pad with zero, the mean color after normalization, at the bottom and the right
+            batch_inp = np.zeros((len(batch), inputs[batch[0]].shape[0], max_h, max_w), dtype=np.float32)
+            for batch_index, i in enumerate(batch):
+                h, w = sizes[i]
+                batch_inp[batch_index, :, :h, :w] = inputs[i]
+
+            with torch.no_grad():
+                inp = torch.from_numpy(batch_inp)
+                inp = inp.to(self.device)
+                outputs = self.net(inp)
+            preds = self._get_preds(outputs)
+
+            for batch_index, i in enumerate(batch):
+                h, w = sizes[i]
+                img_preds = {'maps': preds['maps'][batch_index:batch_index + 1, :, :h, :w]}
+                post_result = self.postprocess_op(img_preds, np.expand_dims(shapes[i], axis=0))
+                ori_index = valid_indices[i]
+                dt_boxes_list[ori_index] = self._filter_det_res(post_result[0]['points'], img_list[ori_index].shape)
+
+        elapse = time.time() - starttime
+        return dt_boxes_list, elapse
+
+    def __call__(self, img):
+        ori_im = img.copy()
+        data = {'image': img}
+        data = transform(data, self.preprocess_op)
+        img, shape_list = data
+        if img is None:
+            return None, 0
+        img = np.expand_dims(img, axis=0)
+        shape_list = np.expand_dims(shape_list, axis=0)
+        img = img.copy()
+        starttime = time.time()
+
+        with torch.no_grad():
+            inp = torch.from_numpy(img)
+            inp = inp.to(self.device)
+            outputs = self.net(inp)
+
+        preds = self._get_preds(outputs)
+
+        post_result = self.postprocess_op(preds, shape_list)
+        dt_boxes = post_result[0]['points']
+        dt_boxes = self._filter_det_res(dt_boxes, ori_im.shape)
 
         elapse = time.time() - starttime
         return dt_boxes, elapse
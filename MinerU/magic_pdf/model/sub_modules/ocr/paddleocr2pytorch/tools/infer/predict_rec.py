@@ -74,6 +74,9 @@ class TextRecognizer(BaseOCRV20):
 
         self.limited_max_width = args.limited_max_width
         self.limited_min_width = args.limited_min_width
+        self.rec_width_bucket = getattr(args, 'rec_width_bucket', 0)
+        self.rec_batch_width_budget = getattr(args, 'rec_batch_width_budget', None) or \
+            self.rec_batch_num * self.limited_max_width
 
         self.weights_path = args.rec_model_path
         self.yaml_path = args.rec_yaml_path
@@ -94,7 +97,7 @@ class TextRecognizer(BaseOCRV20):
         self.net.eval()
         self.net.to(self.device)
 
-    def resize_norm_img(self, img, max_wh_ratio):
+    def resize_norm_img(self, img, max_wh_ratio, padded_width=None):
         imgC, imgH, imgW = self.rec_image_shape
         if self.rec_algorithm == 'NRTR' or self.rec_algorithm == 'ViTSTR':
             img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
@@ -124,9 +127,10 @@ class TextRecognizer(BaseOCRV20):
             return resized_image
 
         assert imgC == img.shape[2]
-        max_wh_ratio = max(max_wh_ratio, imgW / imgH)
-        imgW = int((imgH * max_wh_ratio))
-        imgW = max(min(imgW, self.limited_max_width), self.limited_min_width)
+        if padded_width is not None:
+            imgW = padded_width
+        else:
+            imgW = self.get_padded_width(max_wh_ratio)
         h, w = img.shape[:2]
         ratio = w / float(h)
         ratio_imgH = math.ceil(imgH * ratio)
@@ -144,6 +148,54 @@ class TextRecognizer(BaseOCRV20):
         padding_im[:, :, 0:resized_w] = resized_image
         return padding_im
 
+    def get_padded_width(self, wh_ratio):
+        imgC, imgH, imgW = self.rec_image_shape
+        wh_ratio = max(wh_ratio, imgW / imgH)
+        imgW = int((imgH * wh_ratio))
+        return max(min(imgW, self.limited_max_width), self.limited_min_width)
+
+    def get_bucketed_batches(self, img_list):
+        """
+        group the crops into buckets of padded width, every bucket is split into
+        batches whose padded widths sum up to at most rec_batch_width_budget,
+        so short lines are batched together instead of padded to the long ones.
+        With rec_width_bucket 1 no crop is padded beyond its own padded width
+
+        Returns:
+            list of (indices of img_list, padded width)
+        """
+        buckets = {}
+        for index, img in enumerate(img_list):
+            h, w = img.shape[0:2]
+            width = self.get_padded_width(w * 1.0 / h)
+            bucket_width = min(math.ceil(width / self.rec_width_bucket) * self.rec_width_bucket,
+                               self.limited_max_width)
+            buckets.setdefault(bucket_width, []).append((w * 1.0 / h, index))
+
+        batches = []
+        for bucket_width in sorted(buckets):
+            bucket = [index for _, index in sorted(buckets[bucket_width])]
+            batch_size = max(1, self.rec_batch_width_budget // bucket_width)
+            for beg in range(0, len(bucket), batch_size):
+                batches.append((bucket[beg:beg + batch_size], bucket_width))
+        return batches
+
+    def get_sorted_batches(self, img_list):
+        """
+        sort the crops by width and split them into batches of rec_batch_num
+
+        Returns:
+            list of (indices of img_list, None)
+        """
+        # Calculate the aspect ratio of all text bars
+        width_list = []
+        for img in img_list:
+            width_list.append(img.shape[1] / float(img.shape[0]))
+        # Sorting can speed up the recognition process
+        indices = np.argsort(np.array(width_list))
+        batch_num = self.rec_batch_num
+        return [(indices[beg:beg + batch_num].tolist(), None) for beg in range(0, len(img_list), batch_num)]
+
     def resize_norm_img_svtr(self, img, image_shape):
 
         imgC, imgH, imgW = image_shape
@@ -290,33 +342,26 @@ class TextRecognizer(BaseOCRV20):
 
     def __call__(self, img_list, tqdm_enable=False):
         img_num = len(img_list)
-        # Calculate the aspect ratio of all text bars
-        width_list = []
-        for img in img_list:
-            width_list.append(img.shape[1] / float(img.shape[0]))
-        # Sorting can speed up the recognition process
-        indices = np.argsort(np.array(width_list))
+        if self.rec_width_bucket > 0 and self.rec_algorithm not in ["SAR", "SVTR", "SRN", "CAN", "NRTR", "ViTSTR", "RFL"]:
+            batches = self.get_bucketed_batches(img_list)
+        else:
+            batches = self.get_sorted_batches(img_list)
 
         # rec_res = []
         rec_res = [['', 0.0]] * img_num
-        batch_num = self.rec_batch_num
         elapse = 0
-        # for beg_img_no in range(0, img_num, batch_num):
         with tqdm(total=img_num, desc='OCR-rec Predict', disable=not tqdm_enable) as pbar:
-            index = 0
-            for beg_img_no in range(0, img_num, batch_num):
-                end_img_no = min(img_num, beg_img_no + batch_num)
+            for batch_indices, padded_width in batches:
                 norm_img_batch = []
                 max_wh_ratio = 0
-                for ino in range(beg_img_no, end_img_no):
-                    # h, w = img_list[ino].shape[0:2]
-                    h, w = img_list[indices[ino]].shape[0:2]
+                for ino in batch_indices:
+                    h, w = img_list[ino].shape[0:2]
                     wh_ratio = w * 1.0 / h
                     max_wh_ratio = max(max_wh_ratio, wh_ratio)
-                for ino in range(beg_img_no, end_img_no):
+                for ino in batch_indices:
                     if self.rec_algorithm == "SAR":
                         norm_img, _, _, valid_ratio = self.resize_norm_img_sar(
-                            img_list[indices[ino]], self.rec_image_shape)
+                            img_list[ino], self.rec_image_shape)
                         norm_img = norm_img[np.newaxis, :]
                         valid_ratio = np.expand_dims(valid_ratio, axis=0)
                         valid_ratios = []
@@ -324,12 +369,12 @@ class TextRecognizer(BaseOCRV20):
                         norm_img_batch.append(norm_img)
 
                     elif self.rec_algorithm == "SVTR":
-                        norm_img = self.resize_norm_img_svtr(img_list[indices[ino]],
+                        norm_img = self.resize_norm_img_svtr(img_list[ino],
                                                              self.rec_image_shape)
                         norm_img = norm_img[np.newaxis, :]
                         norm_img_batch.append(norm_img)
                     elif self.rec_algorithm == "SRN":
-                        norm_img = self.process_image_srn(img_list[indices[ino]],
+                        norm_img = self.process_image_srn(img_list[ino],
                                                           self.rec_image_shape, 8,
                                                           self.max_text_length)
                         encoder_word_pos_list = []
@@ -342,7 +387,7 @@ class TextRecognizer(BaseOCRV20):
                         gsrm_slf_attn_bias2_list.append(norm_img[4])
                         norm_img_batch.append(norm_img[0])
                     elif self.rec_algorithm == "CAN":
-                        norm_img = self.norm_img_can(img_list[indices[ino]],
+                        norm_img = self.norm_img_can(img_list[ino],
                                                      max_wh_ratio)
                         norm_img = norm_img[np.newaxis, :]
                         norm_img_batch.append(norm_img)
@@ -353,8 +398,8 @@ class TextRecognizer(BaseOCRV20):
                         norm_img_mask_batch.append(norm_image_mask)
                         word_label_list.append(word_label)
                     else:
-                        norm_img = self.resize_norm_img(img_list[indices[ino]],
-                                                        max_wh_ratio)
+                        norm_img = self.resize_norm_img(img_list[ino],
+                                                        max_wh_ratio, padded_width)
                         norm_img = norm_img[np.newaxis, :]
                         norm_img_batch.append(norm_img)
                 norm_img_batch = np.concatenate(norm_img_batch)
@@ -429,13 +474,10 @@ class TextRecognizer(BaseOCRV20):
 
                 rec_result = self.postprocess_op(preds)
                 for rno in range(len(rec_result)):
-                    rec_res[indices[beg_img_no + rno]] = rec_result[rno]
+                    rec_res[batch_indices[rno]] = rec_result[rno]
                 elapse += time.time() - starttime
 
-                # 更新进度条，每次增加batch_size，但要注意最后一个batch可能不足batch_size
-                current_batch_size = min(batch_num, img_num - index * batch_num)
-                index += 1
-                pbar.update(current_batch_size)
+                pbar.update(len(batch_indices))
 
         # Fix NaN values in recognition results
         for i in range(len(rec_res)):
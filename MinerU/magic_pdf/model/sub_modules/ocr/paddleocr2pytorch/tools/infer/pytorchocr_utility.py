@@ -32,6 +32,9 @@ def init_args():
     parser.add_argument("--det_model_path", type=str)
     parser.add_argument("--det_limit_side_len", type=float, default=960)
     parser.add_argument("--det_limit_type", type=str, default='max')
+    parser.add_argument("--det_batch_num", type=int, default=8)
+    # the zero padding changes the DB maps near the edges, 0 batches only the images of the same size
+    parser.add_argument("--det_max_pad_ratio", type=float, default=0)
 
     # DB parmas
     parser.add_argument("--det_db_thresh", type=float, default=0.3)
@@ -72,6 +75,12 @@ def init_args():
     parser.add_argument("--rec_image_shape", type=str, default="3, 48, 320")
     parser.add_argument("--rec_char_type", type=str, default='ch')
     parser.add_argument("--rec_batch_num", type=int, default=6)
+    # group the crops into padded width buckets of this step, 0 disables the bucketing. With the default of 1 a
+    # bucket holds the crops of the same padded width, which get the input of recognizing each crop alone; a
+    # larger step pads the crops up to the bucket width, so the text and scores may differ slightly from it
+    parser.add_argument("--rec_width_bucket", type=int, default=1)
+    # the sum of the padded widths of a bucketed batch, defaults to rec_batch_num * limited_max_width
+    parser.add_argument("--rec_batch_width_budget", type=int, default=None)
     parser.add_argument("--max_text_length", type=int, default=25)
 
     parser.add_argument("--use_space_char", type=str2bool, default=True)
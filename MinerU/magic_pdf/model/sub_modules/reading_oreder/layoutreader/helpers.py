@@ -74,6 +74,24 @@ def boxes2inputs(boxes: List[List[int]]) -> Dict[str, torch.Tensor]:
     }
 
 
+def batch_boxes2inputs(boxes_list: List[List[List[int]]]) -> Dict[str, torch.Tensor]:
+    """boxes2inputs of several pages at once, padded to the longest one as DataCollator does."""
+    max_len = max(len(boxes) for boxes in boxes_list) + 2
+    bbox = []
+    input_ids = []
+    attention_mask = []
+    for boxes in boxes_list:
+        pad_len = max_len - len(boxes) - 2
+        bbox.append([[0, 0, 0, 0]] + boxes + [[0, 0, 0, 0]] * (pad_len + 1))
+        input_ids.append([CLS_TOKEN_ID] + [UNK_TOKEN_ID] * len(boxes) + [EOS_TOKEN_ID] * (pad_len + 1))
+        attention_mask.append([1] * (len(boxes) + 2) + [0] * pad_len)
+    return {
+        "bbox": torch.tensor(bbox),
+        "attention_mask": torch.tensor(attention_mask),
+        "input_ids": torch.tensor(input_ids),
+    }
+
+
 def prepare_inputs(
     inputs: Dict[str, torch.Tensor], model: LayoutLMv3ForTokenClassification
 ) -> Dict[str, torch.Tensor]:
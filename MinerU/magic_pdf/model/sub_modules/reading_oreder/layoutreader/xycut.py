@@ -68,13 +68,14 @@ def split_projection_profile(arr_values: np.array, min_value: float, min_gap: fl
     return arr_start, arr_end
 
 
-def recursive_xy_cut(boxes: np.ndarray, indices: List[int], res: List[int]):
+def recursive_xy_cut(boxes: np.ndarray, indices: List[int], res: List[int], groups: List[np.ndarray] = None):
     """
 
     Args:
         boxes: (N, 4)
         indices: 递归过程中始终表示 box 在原始数据中的索引
         res: 保存输出结果
+        groups: 可选, 按顺序保存无法再切分的区域的索引
 
     """
     # 向 y 轴投影
@@ -113,6 +114,8 @@ def recursive_xy_cut(boxes: np.ndarray, indices: List[int], res: List[int]):
         if len(arr_x0) == 1:
             # x 方向无法切分
             res.extend(x_sorted_indices_chunk)
+            if groups is not None:
+                groups.append(x_sorted_indices_chunk)
             continue
 
         # x 方向上能分开，继续递归调用
@@ -121,7 +124,7 @@ def recursive_xy_cut(boxes: np.ndarray, indices: List[int], res: List[int]):
                 x_sorted_boxes_chunk[:, 0] < c1
             )
             recursive_xy_cut(
-                x_sorted_boxes_chunk[_indices], x_sorted_indices_chunk[_indices], res
+                x_sorted_boxes_chunk[_indices], x_sorted_indices_chunk[_indices], res, groups
             )
 
 
@@ -66,6 +66,7 @@ class InferenceResultBase(ABC):
         end_page_id=None,
         debug_mode=False,
         lang=None,
+        finalize=True,
     ) -> PipeResult:
         """Post-proc the model inference result, Extract the text using the
         third library, such as `pymupdf`
@@ -76,6 +77,8 @@ class InferenceResultBase(ABC):
             end_page_id (int, optional):  Defaults to the last page index of dataset. Let user select some pages He/She want to process
             debug_mode (bool, optional): Defaults to False. will dump more log if enabled
             lang (str, optional): Defaults to None.
+            finalize (bool, optional): Defaults to True. False skips the paragraph split and the llm aided steps,
+                for a page-range shard which is finalized by merge_pdf_info_shards
 
         Returns:
             PipeResult: the result
@@ -90,5 +93,6 @@ class InferenceResultBase(ABC):
         end_page_id=None,
         debug_mode=False,
         lang=None,
+        finalize=True,
     ) -> PipeResult:
         pass
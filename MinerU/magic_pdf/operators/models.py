@@ -76,6 +76,7 @@ class InferenceResult(InferenceResultBase):
         end_page_id=None,
         debug_mode=False,
         lang=None,
+        finalize=True,
     ) -> PipeResult:
         """Post-proc the model inference result, Extract the text using the
         third library, such as `pymupdf`
@@ -86,6 +87,8 @@ class InferenceResult(InferenceResultBase):
             end_page_id (int, optional):  Defaults to the last page index of dataset. Let user select some pages He/She want to process
             debug_mode (bool, optional): Defaults to False. will dump more log if enabled
             lang (str, optional): Defaults to None.
+            finalize (bool, optional): Defaults to True. False skips the paragraph split and the llm aided steps,
+                for a page-range shard which is finalized by merge_pdf_info_shards
 
         Returns:
             PipeResult: the result
@@ -108,6 +111,7 @@ class InferenceResult(InferenceResultBase):
             end_page_id=end_page_id,
             debug_mode=debug_mode,
             lang=lang,
+            finalize=finalize,
         )
         return res
 
@@ -118,6 +122,7 @@ class InferenceResult(InferenceResultBase):
         end_page_id=None,
         debug_mode=False,
         lang=None,
+        finalize=True,
     ) -> PipeResult:
         """Post-proc the model inference result, Extract the text using `OCR`
         technical.
@@ -128,6 +133,8 @@ class InferenceResult(InferenceResultBase):
             end_page_id (int, optional):  Defaults to the last page index of dataset. Let user select some pages He/She want to process
             debug_mode (bool, optional): Defaults to False. will dump more log if enabled
             lang (str, optional): Defaults to None.
+            finalize (bool, optional): Defaults to True. False skips the paragraph split and the llm aided steps,
+                for a page-range shard which is finalized by merge_pdf_info_shards
 
         Returns:
             PipeResult: the result
@@ -150,5 +157,6 @@ class InferenceResult(InferenceResultBase):
             end_page_id=end_page_id,
             debug_mode=debug_mode,
             lang=lang,
+            finalize=finalize,
         )
         return res
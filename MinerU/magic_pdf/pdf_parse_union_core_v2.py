@@ -1,10 +1,12 @@
 import copy
 import math
 import os
+import pickle
 import re
 import statistics
 import time
 import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import List
 
 import cv2
@@ -16,7 +18,8 @@ from tqdm import tqdm
 
 from magic_pdf.config.enums import SupportedPdfParseMethod
 from magic_pdf.config.ocr_content_type import BlockType, ContentType
-from magic_pdf.data.dataset import Dataset, PageableData
+from magic_pdf.data.dataset import Dataset, PageableData, PymuDocDataset
+from magic_pdf.libs.box_index import BboxIndex
 from magic_pdf.libs.boxbase import calculate_overlap_area_in_bbox1_area_ratio, __is_overlaps_y_exceeds_threshold
 from magic_pdf.libs.clean_memory import clean_memory
 from magic_pdf.libs.config_reader import get_local_layoutreader_model_dir, get_llm_aided_config, get_device
@@ -37,6 +40,8 @@ from magic_pdf.pre_proc.ocr_span_list_modify import get_qa_need_list_v2, remove_
 
 os.environ['NO_ALBUMENTATIONS_UPDATE'] = '1'  # 禁止albumentations检查更新
 
+LAYOUTREADER_MAX_LINES = 200  # layoutreader单次排序的最大line数, 超过后按块排序
+
 
 def __replace_STX_ETX(text_str: str):
     """Replace \u0002 and \u0003, as these characters become garbled when extracted using pymupdf. In fact, they were originally quotation marks.
@@ -79,18 +84,16 @@ def chars_to_content(span):
         # 通过x轴重叠比率移除一部分char
         span = remove_x_overlapping_chars(span, median_width)
 
-        content = ''
-        for char in span['chars']:
+        chars = span['chars']
+        content = []
+        for char1, char2 in zip(chars, chars[1:] + [None]):
 
             # 如果下一个char的x0和上一个char的x1距离超过0.25个字符宽度，则需要在中间插入一个空格
-            char1 = char
-            char2 = span['chars'][span['chars'].index(char) + 1] if span['chars'].index(char) + 1 < len(span['chars']) else None
-            if char2 and char2['bbox'][0] - char1['bbox'][2] > median_width * 0.25 and char['c'] != ' ' and char2['c'] != ' ':
-                content += f"{char['c']} "
-            else:
-                content += char['c']
+            content.append(char1['c'])
+            if char2 and char2['bbox'][0] - char1['bbox'][2] > median_width * 0.25 and char1['c'] != ' ' and char2['c'] != ' ':
+                content.append(' ')
 
-        span['content'] = __replace_ligatures(content)
+        span['content'] = __replace_ligatures(''.join(content))
 
     del span['chars']
 
@@ -104,12 +107,14 @@ def fill_char_in_spans(spans, all_chars):
     # 简单从上到下排一下序
     spans = sorted(spans, key=lambda x: x['bbox'][1])
 
-    for char in all_chars:
-
-        for span in spans:
-            if calculate_char_in_span(char['bbox'], span['bbox'], char['c']):
-                span['chars'].append(char)
-                break
+    char_span_idx = assign_chars_to_spans(
+        [char['bbox'] for char in all_chars],
+        [char['c'] for char in all_chars],
+        [span['bbox'] for span in spans],
+    )
+    for char, span_idx in zip(all_chars, char_span_idx.tolist()):
+        if span_idx >= 0:
+            spans[span_idx]['chars'].append(char)
 
     need_ocr_spans = []
     for span in spans:
@@ -122,6 +127,61 @@ def fill_char_in_spans(spans, all_chars):
     return need_ocr_spans
 
 
+def assign_chars_to_spans(char_bboxes, char_texts, span_bboxes, span_height_radio=0.33, chunk_size=4 * 1024 * 1024):
+    """calculate_char_in_span的向量化版本, 一次判断所有char和所有span.
+
+    Args:
+        char_bboxes: 所有char的bbox
+        char_texts: 所有char的字符, 用于LINE_STOP_FLAG/LINE_START_FLAG的判定
+        span_bboxes: 所有span的bbox
+        span_height_radio (float, optional): char中轴和span中轴的高度差占span高度的比例上限. Defaults to 0.33.
+        chunk_size (int, optional): 每次判断的char*span数量上限, 限制内存. Defaults to 4M.
+
+    Returns:
+        np.ndarray: 每个char所属的第一个span的序号, 不属于任何span时为-1
+    """
+    num_chars = len(char_bboxes)
+    if num_chars == 0 or len(span_bboxes) == 0:
+        return np.full(num_chars, -1, dtype=np.int64)
+
+    chars = np.asarray(char_bboxes, dtype=np.float64).reshape(-1, 4)
+    spans = np.asarray(span_bboxes, dtype=np.float64).reshape(-1, 4)
+    is_stop = np.array([c in LINE_STOP_FLAG for c in char_texts], dtype=bool)
+    # 同时属于两类的字符只按LINE_STOP_FLAG判定
+    is_start = np.array([c in LINE_START_FLAG for c in char_texts], dtype=bool) & ~is_stop
+
+    span_x0, span_y0, span_x1, span_y1 = (spans[:, i][None, :] for i in range(4))
+    span_center_y = (span_y0 + span_y1) / 2
+    span_height = span_y1 - span_y0
+
+    result = np.full(num_chars, -1, dtype=np.int64)
+    step = max(1, chunk_size // len(spans))
+    for beg in range(0, num_chars, step):
+        char_x0, char_y0, char_x1, char_y1 = (chars[beg:beg + step, i][:, None] for i in range(4))
+        char_center_x = (char_x0 + char_x1) / 2
+        char_center_y = (char_y0 + char_y1) / 2
+
+        # 高度判定对三种方案相同
+        in_height = (
+            (span_y0 < char_center_y) & (char_center_y < span_y1)
+            & (np.abs(char_center_y - span_center_y) < span_height * span_height_radio)
+        )
+        in_span = (span_x0 < char_center_x) & (char_center_x < span_x1)
+        stop_in_span = (
+            is_stop[beg:beg + step, None]
+            & ((span_x1 - span_height) < char_x0) & (char_x0 < span_x1) & (char_center_x > span_x0)
+        )
+        start_in_span = (
+            is_start[beg:beg + step, None]
+            & (span_x0 < char_x1) & (char_x1 < (span_x0 + span_height)) & (char_center_x < span_x1)
+        )
+        matched = in_height & (in_span | stop_in_span | start_in_span)
+
+        first_span_idx = matched.argmax(axis=1)
+        result[beg:beg + step] = np.where(matched.any(axis=1), first_span_idx, -1)
+    return result
+
+
 # 使用鲁棒性更强的中心点坐标判断
 def calculate_char_in_span(char_bbox, span_bbox, char, span_height_radio=0.33):
     char_center_x = (char_bbox[0] + char_bbox[2]) / 2
@@ -198,7 +258,7 @@ def calculate_contrast(img, img_mode) -> float:
     return round(contrast, 2)
 
 # @measure_time
-def txt_spans_extract_v2(pdf_page, spans, all_bboxes, all_discarded_blocks, lang):
+def txt_spans_extract_v2(pdf_page, spans, all_bboxes, all_discarded_blocks, lang, block_index: BboxIndex = None):
     # cid用0xfffd表示，连字符拆开
     # text_blocks_raw = pdf_page.get_text('rawdict', flags=fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_MEDIABOX_CLIP)['blocks']
 
@@ -239,16 +299,23 @@ def txt_spans_extract_v2(pdf_page, spans, all_bboxes, all_discarded_blocks, lang
     unuseful_spans = []
     # 纵向span的两个特征：1. 高度超过多个line 2. 高宽比超过某个值
     vertical_spans = []
+    all_blocks = all_bboxes + all_discarded_blocks
+    if block_index is None or len(block_index.position_map(all_blocks)) != len(all_blocks):
+        block_index = BboxIndex(all_blocks)
+    block_positions = block_index.position_map(all_blocks)
     for span in spans:
         if span['type'] in [ContentType.InterlineEquation, ContentType.Image, ContentType.Table]:
             continue
-        for block in all_bboxes + all_discarded_blocks:
+        # 只检查与span相交的block, 按all_bboxes + all_discarded_blocks的顺序
+        candidates = sorted(block_positions[p] for p in block_index.query(span['bbox']) if p in block_positions)
+        for block_idx in candidates:
+            block = all_blocks[block_idx]
             if block[7] in [BlockType.ImageBody, BlockType.TableBody, BlockType.InterlineEquation]:
                 continue
             if calculate_overlap_area_in_bbox1_area_ratio(span['bbox'], block[0:4]) > 0.5:
                 if span['height'] > median_span_height * 3 and span['height'] > span['width'] * 3:
                     vertical_spans.append(span)
-                elif block in all_bboxes:
+                elif block_idx < len(all_bboxes):
                     useful_spans.append(span)
                 else:
                     unuseful_spans.append(span)
@@ -373,17 +440,35 @@ class ModelSingleton:
         return self._models[model_name]
 
 
+def get_layoutreader_batch_size() -> int:
+    """The number of pages (or chunks of pages) whose reading order is predicted in one forward pass."""
+    return max(1, int(os.getenv('MINERU_LAYOUTREADER_BATCH_SIZE', 16)))
+
+
 def do_predict(boxes: List[List[int]], model) -> List[int]:
+    return do_predict_batch([boxes], model)[0]
+
+
+def do_predict_batch(boxes_list: List[List[List[int]]], model) -> List[List[int]]:
+    """Predict the reading order of several pages in one padded forward pass.
+
+    Args:
+        boxes_list (List[List[List[int]]]): the line boxes of each page, scaled to 0-1000
+        model: the layoutreader model
+
+    Returns:
+        List[List[int]]: the order of the boxes of each page
+    """
     from magic_pdf.model.sub_modules.reading_oreder.layoutreader.helpers import (
-        boxes2inputs, parse_logits, prepare_inputs)
+        batch_boxes2inputs, parse_logits, prepare_inputs)
 
     with warnings.catch_warnings():
         warnings.filterwarnings("ignore", category=FutureWarning, module="transformers")
 
-        inputs = boxes2inputs(boxes)
+        inputs = batch_boxes2inputs(boxes_list)
         inputs = prepare_inputs(inputs, model)
-        logits = model(**inputs).logits.cpu().squeeze(0)
-    return parse_logits(logits, len(boxes))
+        logits = model(**inputs).logits.cpu()
+    return [parse_logits(page_logits, len(boxes)) for page_logits, boxes in zip(logits, boxes_list)]
 
 
 def cal_block_index(fix_blocks, sorted_bboxes):
@@ -490,7 +575,8 @@ def insert_lines_into_block(block_bbox, line_height, page_w, page_h):
         return [[x0, y0, x1, y1]]
 
 
-def sort_lines_by_model(fix_blocks, page_w, page_h, line_height, footnote_blocks):
+def get_page_line_list(fix_blocks, page_w, page_h, line_height, footnote_blocks):
+    """获取页面所有line的bbox, 没有line的block按line_height切出虚拟line"""
     page_line_list = []
 
     def add_lines_to_block(b):
@@ -523,10 +609,11 @@ def sort_lines_by_model(fix_blocks, page_w, page_h, line_height, footnote_blocks
         footnote_block = {'bbox': block[:4]}
         add_lines_to_block(footnote_block)
 
-    if len(page_line_list) > 200:  # layoutreader最高支持512line
-        return None
+    return page_line_list
 
-    # 使用layoutreader排序
+
+def scale_line_boxes(page_line_list, page_w, page_h):
+    """将line的bbox缩放到layoutreader的0-1000坐标"""
     x_scale = 1000.0 / page_w
     y_scale = 1000.0 / page_h
     boxes = []
@@ -561,13 +648,99 @@ def sort_lines_by_model(fix_blocks, page_w, page_h, line_height, footnote_blocks
             1000 >= right >= left >= 0 and 1000 >= bottom >= top >= 0
         ), f'Invalid box. right: {right}, left: {left}, bottom: {bottom}, top: {top}'  # noqa: E126, E121
         boxes.append([left, top, right, bottom])
-    model_manager = ModelSingleton()
-    model = model_manager.get_model('layoutreader')
-    with torch.no_grad():
-        orders = do_predict(boxes, model)
-    sorted_bboxes = [page_line_list[i] for i in orders]
+    return boxes
 
-    return sorted_bboxes
+
+def split_line_chunks(boxes, max_lines=LAYOUTREADER_MAX_LINES):
+    """layoutreader最高支持512line, 行数较多时排序质量下降, 超过max_lines的页面按xycut的粗排序切成连续的块,
+    块内由layoutreader排序, 块间保持xycut的顺序.
+
+    Returns:
+        list[list[int]]: the indices of the boxes of each chunk
+    """
+    if len(boxes) <= max_lines:
+        return [list(range(len(boxes)))]
+
+    from magic_pdf.model.sub_modules.reading_oreder.layoutreader.xycut import \
+        recursive_xy_cut
+
+    # 行间距处的空白会让xycut先按行切开, 多栏的行交错在一起; 按行高上下扩展line, 使同一栏的line连成一片
+    xycut_boxes = np.asarray(boxes).astype(int)
+    line_height = max(1, int(np.median(xycut_boxes[:, 3] - xycut_boxes[:, 1])))
+    xycut_boxes[:, 1] = np.maximum(xycut_boxes[:, 1] - line_height, 0)
+    xycut_boxes[:, 3] = xycut_boxes[:, 3] + line_height
+    groups = []
+    recursive_xy_cut(xycut_boxes, np.arange(len(boxes)), [], groups)
+    # 切不开的区域内按从上到下从左到右排列, xycut会丢掉没有宽度的box, 同样补在最后
+    line_key = lambda i: (boxes[i][1], boxes[i][0])  # noqa: E731
+    coarse_order = []
+    for group in groups:
+        coarse_order.extend(sorted((int(i) for i in group), key=line_key))
+    seen = set(coarse_order)
+    coarse_order.extend(sorted((i for i in range(len(boxes)) if i not in seen), key=line_key))
+    num_chunks = math.ceil(len(boxes) / max_lines)
+    return [chunk.tolist() for chunk in np.array_split(np.array(coarse_order), num_chunks)]
+
+
+def predict_reading_orders(boxes_list, batch_size=None):
+    """Predict the reading order of the line boxes of several pages, in padded batches of chunks.
+
+    Args:
+        boxes_list (list[list[list[int]]]): the line boxes of each page, scaled to 0-1000
+        batch_size (int, optional): the number of chunks per forward pass. Defaults to get_layoutreader_batch_size().
+
+    Returns:
+        list[list[int]]: the order of the boxes of each page
+    """
+    batch_size = batch_size or get_layoutreader_batch_size()
+    chunks = []  # (page, chunk indices)
+    for page, boxes in enumerate(boxes_list):
+        if boxes:
+            chunks.extend((page, indices) for indices in split_line_chunks(boxes))
+
+    # 长度相近的块放在同一个batch, 减少padding
+    chunks.sort(key=lambda chunk: len(chunk[1]), reverse=True)
+    chunk_orders = {}
+    if chunks:
+        model = ModelSingleton().get_model('layoutreader')
+        with torch.no_grad():
+            for beg in range(0, len(chunks), batch_size):
+                batch = chunks[beg:beg + batch_size]
+                orders = do_predict_batch([[boxes_list[page][i] for i in indices] for page, indices in batch], model)
+                for (page, indices), order in zip(batch, orders):
+                    chunk_orders[(page, indices[0])] = [indices[i] for i in order]
+
+    page_orders = [[] for _ in boxes_list]
+    # 同一页的块按xycut的顺序拼接
+    for page, indices in sorted(chunks, key=lambda chunk: chunk[0]):
+        page_orders[page].extend(chunk_orders[(page, indices[0])])
+    return page_orders
+
+
+def sort_page_lines(page_line_lists, page_sizes, batch_size=None):
+    """Sort the lines of several pages with layoutreader.
+
+    Args:
+        page_line_lists (list[list]): the line bboxes of each page, see get_page_line_list
+        page_sizes (list[tuple]): the (page_w, page_h) of each page
+        batch_size (int, optional): see predict_reading_orders
+
+    Returns:
+        list[list]: the sorted line bboxes of each page
+    """
+    boxes_list = [
+        scale_line_boxes(page_line_list, page_w, page_h)
+        for page_line_list, (page_w, page_h) in zip(page_line_lists, page_sizes)
+    ]
+    page_orders = predict_reading_orders(boxes_list, batch_size)
+    return [
+        [page_line_list[i] for i in orders] for page_line_list, orders in zip(page_line_lists, page_orders)
+    ]
+
+
+def sort_lines_by_model(fix_blocks, page_w, page_h, line_height, footnote_blocks):
+    page_line_list = get_page_line_list(fix_blocks, page_w, page_h, line_height, footnote_blocks)
+    return sort_page_lines([page_line_list], [(page_w, page_h)])[0]
 
 
 def get_line_height(blocks):
@@ -644,20 +817,28 @@ def revert_group_blocks(blocks):
     return new_blocks
 
 
-def remove_outside_spans(spans, all_bboxes, all_discarded_blocks):
-    def get_block_bboxes(blocks, block_type_list):
-        return [block[0:4] for block in blocks if block[7] in block_type_list]
-
-    image_bboxes = get_block_bboxes(all_bboxes, [BlockType.ImageBody])
-    table_bboxes = get_block_bboxes(all_bboxes, [BlockType.TableBody])
+def remove_outside_spans(spans, all_bboxes, all_discarded_blocks, block_index: BboxIndex = None):
     other_block_type = []
     for block_type in BlockType.__dict__.values():
         if not isinstance(block_type, str):
             continue
         if block_type not in [BlockType.ImageBody, BlockType.TableBody]:
             other_block_type.append(block_type)
-    other_block_bboxes = get_block_bboxes(all_bboxes, other_block_type)
-    discarded_block_bboxes = get_block_bboxes(all_discarded_blocks, [BlockType.Discarded])
+
+    all_blocks = all_bboxes + all_discarded_blocks
+    if block_index is None or len(block_index.position_map(all_blocks)) != len(all_blocks):
+        block_index = BboxIndex(all_blocks)
+    block_positions = block_index.position_map(all_blocks)
+
+    def overlaps(span_bbox, from_discarded, block_type_list, ratio):
+        for p in block_index.query(span_bbox):
+            block_idx = block_positions.get(p)
+            if block_idx is None or (block_idx >= len(all_bboxes)) != from_discarded:
+                continue
+            block = all_blocks[block_idx]
+            if block[7] in block_type_list and calculate_overlap_area_in_bbox1_area_ratio(span_bbox, block[0:4]) > ratio:
+                return True
+        return False
 
     new_spans = []
 
@@ -665,30 +846,31 @@ def remove_outside_spans(spans, all_bboxes, all_discarded_blocks):
         span_bbox = span['bbox']
         span_type = span['type']
 
-        if any(calculate_overlap_area_in_bbox1_area_ratio(span_bbox, block_bbox) > 0.4 for block_bbox in
-               discarded_block_bboxes):
+        if overlaps(span_bbox, True, [BlockType.Discarded], 0.4):
             new_spans.append(span)
             continue
 
         if span_type == ContentType.Image:
-            if any(calculate_overlap_area_in_bbox1_area_ratio(span_bbox, block_bbox) > 0.5 for block_bbox in
-                   image_bboxes):
+            if overlaps(span_bbox, False, [BlockType.ImageBody], 0.5):
                 new_spans.append(span)
         elif span_type == ContentType.Table:
-            if any(calculate_overlap_area_in_bbox1_area_ratio(span_bbox, block_bbox) > 0.5 for block_bbox in
-                   table_bboxes):
+            if overlaps(span_bbox, False, [BlockType.TableBody], 0.5):
                 new_spans.append(span)
         else:
-            if any(calculate_overlap_area_in_bbox1_area_ratio(span_bbox, block_bbox) > 0.5 for block_bbox in
-                   other_block_bboxes):
+            if overlaps(span_bbox, False, other_block_type, 0.5):
                 new_spans.append(span)
 
     return new_spans
 
 
-def parse_page_core(
+def prepare_page_core(
     page_doc: PageableData, magic_model, page_id, pdf_bytes_md5, imageWriter, parse_mode, lang
 ):
+    """parse_page_core排序之前的部分, 返回的page_ctx交给finish_page_core, 多页的line可以一起排序.
+
+    Returns:
+        dict: page_ctx, `page_info` is already set when the page has nothing to sort
+    """
     need_drop = False
     drop_reason = []
 
@@ -805,12 +987,15 @@ def parse_page_core(
             page_h,
         )
 
+    """页面所有block的空间索引, 供span与block的匹配共用"""
+    block_index = BboxIndex(all_bboxes + all_discarded_blocks)
+
     """获取所有的spans信息"""
     spans = magic_model.get_all_spans(page_id)
 
     """在删除重复span之前，应该通过image_body和table_body的block过滤一下image和table的span"""
     """顺便删除大水印并保留abandon的span"""
-    spans = remove_outside_spans(spans, all_bboxes, all_discarded_blocks)
+    spans = remove_outside_spans(spans, all_bboxes, all_discarded_blocks, block_index)
 
     """删除重叠spans中置信度较低的那些"""
     spans, dropped_spans_by_confidence = remove_overlaps_low_confidence_spans(spans)
@@ -821,7 +1006,7 @@ def parse_page_core(
     if parse_mode == SupportedPdfParseMethod.TXT:
 
         """使用新版本的混合ocr方案."""
-        spans = txt_spans_extract_v2(page_doc, spans, all_bboxes, all_discarded_blocks, lang)
+        spans = txt_spans_extract_v2(page_doc, spans, all_bboxes, all_discarded_blocks, lang, block_index)
 
     elif parse_mode == SupportedPdfParseMethod.OCR:
         pass
@@ -830,14 +1015,14 @@ def parse_page_core(
 
     """先处理不需要排版的discarded_blocks"""
     discarded_block_with_spans, spans = fill_spans_in_blocks(
-        all_discarded_blocks, spans, 0.4
+        all_discarded_blocks, spans, 0.4, block_index
     )
     fix_discarded_blocks = fix_discarded_block(discarded_block_with_spans)
 
     """如果当前页面没有有效的bbox则跳过"""
     if len(all_bboxes) == 0:
         logger.warning(f'skip this page, not found useful bbox, page_id: {page_id}')
-        return ocr_construct_page_component_v2(
+        return {'page_id': page_id, 'page_info': ocr_construct_page_component_v2(
             [],
             [],
             page_id,
@@ -850,7 +1035,7 @@ def parse_page_core(
             fix_discarded_blocks,
             need_drop,
             drop_reason,
-        )
+        )}
 
     """对image和table截图"""
     spans = ocr_cut_image_and_table(
@@ -858,7 +1043,7 @@ def parse_page_core(
     )
 
     """span填充进block"""
-    block_with_spans, spans = fill_spans_in_blocks(all_bboxes, spans, 0.5)
+    block_with_spans, spans = fill_spans_in_blocks(all_bboxes, spans, 0.5, block_index)
 
     """对block进行fix操作"""
     fix_blocks = fix_block_spans_v2(block_with_spans)
@@ -869,8 +1054,34 @@ def parse_page_core(
     """获取所有line并计算正文line的高度"""
     line_height = get_line_height(fix_blocks)
 
-    """获取所有line并对line排序"""
-    sorted_bboxes = sort_lines_by_model(fix_blocks, page_w, page_h, line_height, footnote_blocks)
+    """获取所有line, 交给layoutreader排序"""
+    page_line_list = get_page_line_list(fix_blocks, page_w, page_h, line_height, footnote_blocks)
+
+    return {
+        'page_id': page_id,
+        'page_w': page_w,
+        'page_h': page_h,
+        'fix_blocks': fix_blocks,
+        'fix_discarded_blocks': fix_discarded_blocks,
+        'need_drop': need_drop,
+        'drop_reason': drop_reason,
+        'page_line_list': page_line_list,
+    }
+
+
+def finish_page_core(page_ctx, sorted_bboxes):
+    """parse_page_core排序之后的部分.
+
+    Args:
+        page_ctx (dict): the result of prepare_page_core
+        sorted_bboxes (list): the sorted page_line_list of the page, ignored when page_ctx has a `page_info`
+
+    Returns:
+        dict: the page info
+    """
+    if 'page_info' in page_ctx:
+        return page_ctx['page_info']
+    fix_blocks = page_ctx['fix_blocks']
 
     """根据line的中位数算block的序列关系"""
     fix_blocks = cal_block_index(fix_blocks, sorted_bboxes)
@@ -893,20 +1104,161 @@ def parse_page_core(
     page_info = ocr_construct_page_component_v2(
         sorted_blocks,
         [],
-        page_id,
-        page_w,
-        page_h,
+        page_ctx['page_id'],
+        page_ctx['page_w'],
+        page_ctx['page_h'],
         [],
         images,
         tables,
         interline_equations,
-        fix_discarded_blocks,
-        need_drop,
-        drop_reason,
+        page_ctx['fix_discarded_blocks'],
+        page_ctx['need_drop'],
+        page_ctx['drop_reason'],
     )
     return page_info
 
 
+def parse_page_core(
+    page_doc: PageableData, magic_model, page_id, pdf_bytes_md5, imageWriter, parse_mode, lang
+):
+    return parse_pages_core([(page_id, page_doc)], magic_model, pdf_bytes_md5, imageWriter, parse_mode, lang)[page_id]
+
+
+def parse_pages_core(pages, magic_model, pdf_bytes_md5, imageWriter, parse_mode, lang, on_page_done=None):
+    """Parse several pages, the reading order of the lines of up to get_layoutreader_batch_size() pages is
+    predicted in one batch.
+
+    Args:
+        pages (list[tuple]): the (page_id, page_doc) of the pages
+        on_page_done (Callable[[], None], optional): called after each page is parsed
+
+    Returns:
+        dict: page_id -> page info
+    """
+    page_infos = {}
+    batch_size = get_layoutreader_batch_size()
+    for beg in range(0, len(pages), batch_size):
+        page_ctxs = [
+            prepare_page_core(page_doc, magic_model, page_id, pdf_bytes_md5, imageWriter, parse_mode, lang)
+            for page_id, page_doc in pages[beg:beg + batch_size]
+        ]
+        page_infos.update(finish_pages_core(page_ctxs, batch_size, on_page_done))
+    return page_infos
+
+
+def finish_pages_core(page_ctxs, batch_size=None, on_page_done=None):
+    """Sort the lines of the prepared pages with layoutreader, batch_size pages at a time, and finish them.
+
+    Args:
+        page_ctxs (list[dict]): the results of prepare_page_core
+        batch_size (int, optional): Defaults to get_layoutreader_batch_size().
+        on_page_done (Callable[[], None], optional): called after each page is finished
+
+    Returns:
+        dict: page_id -> page info
+    """
+    batch_size = batch_size or get_layoutreader_batch_size()
+    page_infos = {}
+    for beg in range(0, len(page_ctxs), batch_size):
+        batch_ctxs = page_ctxs[beg:beg + batch_size]
+        to_sort = [page_ctx for page_ctx in batch_ctxs if 'page_info' not in page_ctx]
+        sorted_bboxes_list = sort_page_lines(
+            [page_ctx['page_line_list'] for page_ctx in to_sort],
+            [(page_ctx['page_w'], page_ctx['page_h']) for page_ctx in to_sort],
+            batch_size,
+        )
+        sorted_bboxes_map = {page_ctx['page_id']: sorted_bboxes for page_ctx, sorted_bboxes in zip(to_sort, sorted_bboxes_list)}
+        for page_ctx in batch_ctxs:
+            page_infos[page_ctx['page_id']] = finish_page_core(page_ctx, sorted_bboxes_map.get(page_ctx['page_id']))
+            if on_page_done is not None:
+                on_page_done()
+    return page_infos
+
+
+def get_parse_worker_num(default=1) -> int:
+    """The number of processes used to run prepare_page_core, read from
+    MINERU_PARSE_WORKER_NUM. 1 means parsing in the calling process."""
+    return max(1, int(os.getenv('MINERU_PARSE_WORKER_NUM', default)))
+
+
+def build_window_magic_model(page_dicts, dataset):
+    """MagicModel of some pages of dataset, the other pages are left empty so that it can still be indexed by page_no.
+
+    MagicModel fixes each page on its own, so the pages get the same blocks as with the whole model_list.
+    """
+    window_model_list = [
+        {'layout_dets': [], 'page_info': {'page_no': page_id, 'width': 0, 'height': 0}}
+        for page_id in range(len(dataset))
+    ]
+    for page_dict in page_dicts:
+        window_model_list[page_dict['page_info']['page_no']] = page_dict
+    return MagicModel(window_model_list, dataset)
+
+
+_parse_worker_dataset = None  # the dataset reopened once by each parse worker
+
+
+def _init_parse_worker(pdf_bytes):
+    global _parse_worker_dataset
+    _parse_worker_dataset = PymuDocDataset(pdf_bytes)
+
+
+def _prepare_pages_in_worker(page_dicts, pdf_bytes_md5, imageWriter, parse_mode, lang):
+    dataset = _parse_worker_dataset
+    magic_model = build_window_magic_model(page_dicts, dataset)
+    page_ctxs = []
+    for page_dict in page_dicts:
+        page_id = page_dict['page_info']['page_no']
+        page_ctxs.append(prepare_page_core(
+            dataset.get_page(page_id), magic_model, page_id, pdf_bytes_md5, imageWriter, parse_mode, lang
+        ))
+    return page_ctxs
+
+
+def parallel_prepare_pages_core(
+    dataset: Dataset, page_dicts, pdf_bytes_md5, imageWriter, parse_mode, lang,
+    num_workers=None, pages_per_job=4, on_page_done=None,
+):
+    """Run prepare_page_core with a process pool, each worker reopens the pdf once with PyMuPDF.
+
+    Args:
+        dataset (Dataset): the dataset, only its pdf bytes are sent to the workers
+        page_dicts (list[dict]): the model results of the pages to prepare, as in model_list, before MagicModel
+            fixed them
+        num_workers (int, optional): Defaults to get_parse_worker_num().
+        pages_per_job (int, optional): Defaults to 4.
+        on_page_done (Callable[[], None], optional): called after each page is prepared
+
+    Returns:
+        list[dict]: the page_ctx of each page, aligned with page_dicts
+    """
+    num_workers = num_workers or get_parse_worker_num()
+    jobs = [page_dicts[beg:beg + pages_per_job] for beg in range(0, len(page_dicts), pages_per_job)]
+    page_ctxs = [None] * len(jobs)
+    with ProcessPoolExecutor(
+        max_workers=min(num_workers, len(jobs)) or 1, initializer=_init_parse_worker, initargs=(dataset.data_bits(),)
+    ) as executor:
+        futures = {
+            executor.submit(_prepare_pages_in_worker, job, pdf_bytes_md5, imageWriter, parse_mode, lang): idx
+            for idx, job in enumerate(jobs)
+        }
+        for future in as_completed(futures):
+            page_ctxs[futures[future]] = future.result()
+            if on_page_done is not None:
+                for _ in page_ctxs[futures[future]]:
+                    on_page_done()
+    return [page_ctx for job_ctxs in page_ctxs for page_ctx in job_ctxs]
+
+
+def _can_send_to_workers(imageWriter) -> bool:
+    try:
+        pickle.dumps(imageWriter)
+    except Exception as e:
+        logger.warning(f'imageWriter can not be sent to the parse workers, parse the pages in this process: {e}')
+        return False
+    return True
+
+
 def pdf_parse_union(
     model_list,
     dataset: Dataset,
@@ -916,6 +1268,7 @@ def pdf_parse_union(
     end_page_id=None,
     debug_mode=False,
     lang=None,
+    finalize=True,
 ):
 
     pdf_bytes_md5 = compute_md5(dataset.data_bits())
@@ -923,9 +1276,6 @@ def pdf_parse_union(
     """初始化空的pdf_info_dict"""
     pdf_info_dict = {}
 
-    """用model_list和docs对象初始化magic_model"""
-    magic_model = MagicModel(model_list, dataset)
-
     """根据输入的起始范围解析pdf"""
     end_page_id = (
         end_page_id
@@ -937,24 +1287,101 @@ def pdf_parse_union(
         logger.warning('end_page_id is out of range, use pdf_docs length')
         end_page_id = len(dataset) - 1
 
-    # """初始化启动时间"""
-    # start_time = time.time()
-
-    # for page_id, page in enumerate(dataset):
-    for page_id, page in tqdm(enumerate(dataset), total=len(dataset), desc="Processing pages"):
-        # """debug时输出每页解析的耗时."""
-        # if debug_mode:
-            # time_now = time.time()
-            # logger.info(
-            #     f'page_id: {page_id}, last_page_cost_time: {round(time.time() - start_time, 2)}'
-            # )
-            # start_time = time_now
+    """解析pdf中的每一页, 多页的line一起排序"""
+    page_ids = list(range(start_page_id, end_page_id + 1))
+    num_workers = get_parse_worker_num()
+    with tqdm(total=len(page_ids), desc="Processing pages") as pbar:
+        if num_workers > 1 and len(page_ids) > 1 and _can_send_to_workers(imageWriter):
+            """页内的处理分发到多个进程, 排序和跨页的处理留在本进程"""
+            page_ctxs = parallel_prepare_pages_core(
+                dataset, [model_list[page_id] for page_id in page_ids], pdf_bytes_md5, imageWriter, parse_mode,
+                lang, num_workers=num_workers, on_page_done=lambda: pbar.update(1),
+            )
+            parsed_page_infos = finish_pages_core(page_ctxs)
+        else:
+            """用model_list和docs对象初始化magic_model"""
+            magic_model = MagicModel(model_list, dataset)
+            parsed_page_infos = parse_pages_core(
+                [(page_id, dataset.get_page(page_id)) for page_id in page_ids],
+                magic_model, pdf_bytes_md5, imageWriter, parse_mode, lang, on_page_done=lambda: pbar.update(1),
+            )
 
-        """解析pdf中的每一页"""
+    for page_id, page in enumerate(dataset):
         if start_page_id <= page_id <= end_page_id:
-            page_info = parse_page_core(
-                page, magic_model, page_id, pdf_bytes_md5, imageWriter, parse_mode, lang
+            page_info = parsed_page_infos[page_id]
+        else:
+            page_info = page.get_page_info()
+            page_w = page_info.w
+            page_h = page_info.h
+            page_info = ocr_construct_page_component_v2(
+                [], [], page_id, page_w, page_h, [], [], [], [], [], True, 'skip page'
+            )
+        pdf_info_dict[f'page_{page_id}'] = page_info
+
+    return pdf_info_post_process(pdf_info_dict, lang, finalize=finalize)
+
+
+def pdf_parse_union_streaming(
+    model_windows,
+    dataset: Dataset,
+    imageWriter,
+    parse_mode,
+    start_page_id=0,
+    end_page_id=None,
+    debug_mode=False,
+    lang=None,
+    on_window_parsed=None,
+):
+    """Streaming variant of pdf_parse_union.
+
+    Args:
+        model_windows (Iterable[list[dict]]): yields windows of model results, each page dict has the
+            same shape as an element of model_list. Pages are parsed as soon as their window arrives,
+            so the producer can keep inferring the next window meanwhile.
+        dataset (Dataset): the dataset related with the model results
+        imageWriter (DataWriter): the image writer handle
+        parse_mode (SupportedPdfParseMethod): TXT or OCR
+        start_page_id (int, optional): Defaults to 0.
+        end_page_id (int, optional): Defaults to the last page index of dataset.
+        debug_mode (bool, optional): Defaults to False.
+        lang (str, optional): Defaults to None.
+        on_window_parsed (Callable[[dict], None], optional): called with the page_id -> page info of each
+            window once it is parsed, before the cross-page stages (batched ocr rec, para_split, llm aided).
+
+    Returns:
+        dict: the same result as pdf_parse_union
+    """
+    pdf_bytes_md5 = compute_md5(dataset.data_bits())
+
+    end_page_id = (
+        end_page_id
+        if end_page_id is not None and end_page_id >= 0
+        else len(dataset) - 1
+    )
+
+    if end_page_id > len(dataset) - 1:
+        logger.warning('end_page_id is out of range, use pdf_docs length')
+        end_page_id = len(dataset) - 1
+
+    parsed_page_infos = {}
+    with tqdm(total=end_page_id - start_page_id + 1, desc="Processing pages") as pbar:
+        for window in model_windows:
+            """窗口外的页用空结果占位, 使magic_model可以按page_no索引"""
+            magic_model = build_window_magic_model(window, dataset)
+
+            window_page_infos = parse_pages_core(
+                [(page_dict['page_info']['page_no'], dataset.get_page(page_dict['page_info']['page_no']))
+                 for page_dict in window],
+                magic_model, pdf_bytes_md5, imageWriter, parse_mode, lang, on_page_done=lambda: pbar.update(1),
             )
+            parsed_page_infos.update(window_page_infos)
+            if on_window_parsed is not None:
+                on_window_parsed(window_page_infos)
+
+    pdf_info_dict = {}
+    for page_id, page in enumerate(dataset):
+        if start_page_id <= page_id <= end_page_id:
+            page_info = parsed_page_infos[page_id]
         else:
             page_info = page.get_page_info()
             page_w = page_info.w
@@ -964,6 +1391,14 @@ def pdf_parse_union(
             )
         pdf_info_dict[f'page_{page_id}'] = page_info
 
+    return pdf_info_post_process(pdf_info_dict, lang)
+
+
+def pdf_info_post_process(pdf_info_dict, lang=None, finalize=True):
+    """跨页的后处理: 批量ocr识别, 分段, llm优化, 并将pdf_info_dict转为list.
+
+    finalize为False时跳过分段和llm优化(pdf_info_finalize), 用于之后由merge_pdf_info_shards合并的分片.
+    """
     need_ocr_list = []
     img_crop_list = []
     text_block_list = []
@@ -1005,6 +1440,20 @@ def pdf_parse_union(
         # rec_time = time.time() - rec_start
         # logger.info(f'ocr-dynamic-rec time: {round(rec_time, 2)}, total images processed: {len(img_crop_list)}')
 
+    if finalize:
+        new_pdf_info_dict = pdf_info_finalize(pdf_info_dict)
+    else:
+        new_pdf_info_dict = {
+            'pdf_info': dict_to_list(pdf_info_dict),
+        }
+
+    clean_memory(get_device())
+
+    return new_pdf_info_dict
+
+
+def pdf_info_finalize(pdf_info_dict):
+    """跨页的分段和llm优化, 并将pdf_info_dict转为list, 只依赖preproc_blocks, 可以在合并分片后重新执行."""
 
     """分段"""
     para_split(pdf_info_dict)
@@ -1040,10 +1489,34 @@ def pdf_parse_union(
         'pdf_info': pdf_info_list,
     }
 
-    clean_memory(get_device())
-
     return new_pdf_info_dict
 
 
+def merge_pdf_info_shards(shards):
+    """Merge the results of page-range shards of one document, parsed separately (e.g. on different devices),
+    into the result of parsing the document at once. The paragraphs are split again across the shard
+    boundaries.
+
+    Args:
+        shards (list): (start_page_id, end_page_id, pdf_info) of each shard, pdf_info is the 'pdf_info' list
+            of pdf_parse_union run on the whole document with the shard's page range and finalize=False, the
+            paragraphs are split and the llm-aided steps run once here
+
+    Returns:
+        dict: {'pdf_info': [...]}, as pdf_parse_union
+    """
+    if not shards:
+        raise ValueError('no shard to merge')
+    num_pages = len(shards[0][2])
+    pages = list(shards[0][2])
+    for start_page_id, end_page_id, pdf_info in shards:
+        if len(pdf_info) != num_pages:
+            raise ValueError(f'shard {start_page_id}-{end_page_id} has {len(pdf_info)} pages, expected {num_pages}')
+        for page_id in range(start_page_id, min(end_page_id, num_pages - 1) + 1):
+            pages[page_id] = pdf_info[page_id]
+
+    return pdf_info_finalize({f'page_{page_id}': page_info for page_id, page_info in enumerate(pages)})
+
+
 if __name__ == '__main__':
     pass
@@ -1,4 +1,5 @@
 from magic_pdf.config.ocr_content_type import BlockType, ContentType
+from magic_pdf.libs.box_index import BboxIndex
 from magic_pdf.libs.boxbase import __is_overlaps_y_exceeds_threshold, calculate_overlap_area_in_bbox1_area_ratio
 
 
@@ -81,10 +82,37 @@ def span_block_type_compatible(span_type, block_type):
         return False
 
 
-def fill_spans_in_blocks(blocks, spans, radio):
-    """将allspans中的span按位置关系，放入blocks中."""
+def fill_spans_in_blocks(blocks, spans, radio, block_index: BboxIndex = None):
+    """将allspans中的span按位置关系，放入blocks中.
+
+    每个span放入第一个与其重叠比例超过radio且类型兼容的block, 只需检查索引中与span相交的block.
+
+    Args:
+        blocks: 页面的block
+        spans: 页面的span, 放入block的span会从中删除
+        radio: span与block的重叠面积占span面积的比例阈值
+        block_index (BboxIndex, optional): 页面block的索引, 可以是包含blocks在内的所有block的共享索引.
+            Defaults to None, 此时临时构建.
+    """
+    if block_index is None or len(block_index.position_map(blocks)) != len(blocks):
+        block_index = BboxIndex(blocks)
+    block_positions = block_index.position_map(blocks)
+
+    block_spans_list = [[] for _ in blocks]
+    remaining_spans = []
+    for span in spans:
+        span_bbox = span['bbox']
+        candidates = sorted(block_positions[p] for p in block_index.query(span_bbox) if p in block_positions)
+        for block_idx in candidates:
+            block = blocks[block_idx]
+            if calculate_overlap_area_in_bbox1_area_ratio(span_bbox, block[0:4]) > radio and span_block_type_compatible(span['type'], block[7]):
+                block_spans_list[block_idx].append(span)
+                break
+        else:
+            remaining_spans.append(span)
+
     block_with_spans = []
-    for block in blocks:
+    for block, block_spans in zip(blocks, block_spans_list):
         block_type = block[7]
         block_bbox = block[0:4]
         block_dict = {
@@ -96,19 +124,11 @@ def fill_spans_in_blocks(blocks, spans, radio):
             BlockType.TableBody, BlockType.TableCaption, BlockType.TableFootnote
         ]:
             block_dict['group_id'] = block[-1]
-        block_spans = []
-        for span in spans:
-            span_bbox = span['bbox']
-            if calculate_overlap_area_in_bbox1_area_ratio(span_bbox, block_bbox) > radio and span_block_type_compatible(span['type'], block_type):
-                block_spans.append(span)
-
         block_dict['spans'] = block_spans
         block_with_spans.append(block_dict)
 
-        # 从spans删除已经放入block_spans中的span
-        if len(block_spans) > 0:
-            for span in block_spans:
-                spans.remove(span)
+    # 从spans删除已经放入block_spans中的span
+    spans[:] = remaining_spans
 
     return block_with_spans, spans
 
@@ -11,7 +11,10 @@ from magic_pdf.data.data_reader_writer import FileBasedDataWriter
 from magic_pdf.data.dataset import Dataset, PymuDocDataset
 from magic_pdf.libs.draw_bbox import draw_char_bbox
 from magic_pdf.model.doc_analyze_by_custom_model import (batch_doc_analyze,
-                                                         doc_analyze)
+                                                         doc_analyze,
+                                                         doc_analyze_streaming)
+from magic_pdf.model.model_json_cache import ModelJsonCache
+from magic_pdf.tools.model_server import get_model_server_client
 
 # from io import BytesIO
 # from pypdf import PdfReader, PdfWriter
@@ -112,9 +115,68 @@ def _do_parse(
     image_writer, md_writer = FileBasedDataWriter(local_image_dir), FileBasedDataWriter(local_md_dir)
     image_dir = str(os.path.basename(local_image_dir))
 
+    model_json_cache = ModelJsonCache.from_env()
+    model_json_cache_key = None
+    if len(model_list) == 0 and model_config.__use_inside_model__ and model_json_cache.enabled \
+            and parse_method in ['auto', 'txt', 'ocr']:
+        """增量解析: 推理结果按文档哈希和模型指纹缓存, 只有后处理变化时跳过推理, 只重新执行pipe"""
+        if parse_method == 'auto':
+            parse_method = 'txt' if ds.classify() == SupportedPdfParseMethod.TXT else 'ocr'
+        # pymupdf 截取页码范围后写出的pdf每次都不同, 用用户给出的原始bytes和页码范围作为键
+        if isinstance(pdf_bytes_or_dataset, bytes):
+            key_bytes, key_start_page_id, key_end_page_id = pdf_bytes_or_dataset, start_page_id, end_page_id
+        else:
+            key_bytes, key_start_page_id, key_end_page_id = pdf_bytes, 0, None
+        model_json_cache_key = ModelJsonCache.make_key(
+            key_bytes,
+            ocr=parse_method == 'ocr',
+            lang=ds._lang,
+            layout_model=layout_model,
+            formula_enable=formula_enable,
+            table_enable=table_enable,
+            start_page_id=key_start_page_id,
+            end_page_id=key_end_page_id,
+        )
+        model_list = model_json_cache.get(model_json_cache_key) or []
+        if len(model_list) > 0:
+            logger.info(f'model json cache hit ({model_json_cache_key}), skip the inference')
+            model_json_cache_key = None
+
     if len(model_list) == 0:
         if model_config.__use_inside_model__:
-            if parse_method == 'auto':
+            streaming_enable = os.environ.get('MINERU_STREAMING_PIPELINE', 'false').lower() in ['1', 'true']
+            model_server = get_model_server_client() if parse_method in ['auto', 'txt', 'ocr'] else None
+            if model_server is not None:
+                """模型常驻的服务进程已启动, 推理交给它, 省去加载模型的时间"""
+                if parse_method == 'auto':
+                    ocr = ds.classify() != SupportedPdfParseMethod.TXT
+                else:
+                    ocr = parse_method == 'ocr'
+                infer_result, pipe_result = model_server.analyze(
+                    ds,
+                    image_writer,
+                    ocr=ocr,
+                    lang=ds._lang,
+                    layout_model=layout_model,
+                    formula_enable=formula_enable,
+                    table_enable=table_enable,
+                )
+            elif streaming_enable and parse_method in ['auto', 'txt', 'ocr']:
+                if parse_method == 'auto':
+                    ocr = ds.classify() != SupportedPdfParseMethod.TXT
+                else:
+                    ocr = parse_method == 'ocr'
+                infer_result, pipe_result = ds.apply(
+                    doc_analyze_streaming,
+                    image_writer,
+                    ocr=ocr,
+                    lang=ds._lang,
+                    layout_model=layout_model,
+                    formula_enable=formula_enable,
+                    table_enable=table_enable,
+                    debug_mode=True,
+                )
+            elif parse_method == 'auto':
                 if ds.classify() == SupportedPdfParseMethod.TXT:
                     infer_result = ds.apply(
                         doc_analyze,
@@ -170,6 +232,8 @@ def _do_parse(
         else:
             logger.error('need model list input')
             exit(2)
+        if model_json_cache_key is not None:
+            model_json_cache.put(model_json_cache_key, infer_result.get_infer_res())
     else:
 
         infer_result = InferenceResult(model_list, ds)
@@ -0,0 +1,305 @@
+"""A long-lived local process which keeps the models loaded and parses pdfs for
+thin clients over a Unix socket, so that interactive tools skip the model
+loading of every run.
+
+Start it with ``magic-pdf-server``, the clients (``magic-pdf``, ``do_parse``,
+the web api...) use it as soon as its socket exists, and parse in their own
+process otherwise.
+"""
+import json
+import os
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+import time
+import traceback
+
+import click
+from loguru import logger
+
+from magic_pdf.data.data_reader_writer import DataWriter
+from magic_pdf.data.dataset import Dataset
+
+_HEADER = struct.Struct('>QQ')  # json length, payload length
+
+
+def get_model_server_socket() -> str:
+    """The socket path of the model server, read from MINERU_MODEL_SERVER_SOCKET."""
+    default = os.path.join(tempfile.gettempdir(), f'mineru-model-server-{os.getuid()}.sock') \
+        if hasattr(os, 'getuid') else os.path.join(tempfile.gettempdir(), 'mineru-model-server.sock')
+    return os.environ.get('MINERU_MODEL_SERVER_SOCKET', default)
+
+
+class ModelServerError(RuntimeError):
+    """The model server failed to run a job."""
+
+
+def _recv_exactly(sock, size: int) -> bytes:
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError('model server connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def send_message(sock, header: dict, payload: bytes = b''):
+    """Send a json header followed by a binary payload."""
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(header_bytes), len(payload)) + header_bytes)
+    if payload:
+        sock.sendall(payload)
+
+
+def recv_message(sock):
+    """Receive a message sent by send_message.
+
+    Returns:
+        tuple: (header, payload)
+    """
+    header_len, payload_len = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    header = json.loads(_recv_exactly(sock, header_len).decode('utf-8'))
+    return header, _recv_exactly(sock, payload_len)
+
+
+class MemoryDataWriter(DataWriter):
+    """Keeps the written files in memory, in the order they were written."""
+
+    def __init__(self):
+        self.files = {}
+
+    def write(self, path: str, data: bytes) -> None:
+        self.files[path] = data
+
+
+def analyze_pdf(pdf_bytes: bytes, ocr: bool, lang=None, layout_model=None, formula_enable=None, table_enable=None,
+                start_page_id=0, end_page_id=None):
+    """Run the model inference and the pipeline on a pdf, as _do_parse does.
+
+    Returns:
+        tuple: (model_list, pipe_res, images), images maps the image paths to their bytes
+    """
+    from magic_pdf.data.dataset import PymuDocDataset
+    from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze
+
+    ds = PymuDocDataset(pdf_bytes, lang=lang)
+    image_writer = MemoryDataWriter()
+    infer_result = ds.apply(
+        doc_analyze,
+        ocr=ocr,
+        lang=ds._lang,
+        start_page_id=start_page_id,
+        end_page_id=end_page_id,
+        layout_model=layout_model,
+        formula_enable=formula_enable,
+        table_enable=table_enable,
+    )
+    pipe = infer_result.pipe_ocr_mode if ocr else infer_result.pipe_txt_mode
+    pipe_result = pipe(image_writer, start_page_id=start_page_id, end_page_id=end_page_id, debug_mode=True,
+                       lang=ds._lang)
+    return infer_result.get_infer_res(), pipe_result._pipe_res, image_writer.files
+
+
+def warmup_models(lang=None, layout_model=None, formula_enable=None, table_enable=None):
+    """Load the models used by analyze_pdf."""
+    from magic_pdf.model.doc_analyze_by_custom_model import ModelSingleton
+    from magic_pdf.pdf_parse_union_core_v2 import ModelSingleton as ReadingOrderModelSingleton
+
+    start = time.time()
+    ModelSingleton().get_model(
+        ocr=True, show_log=False, lang=lang, layout_model=layout_model, formula_enable=formula_enable,
+        table_enable=table_enable,
+    )
+    ReadingOrderModelSingleton().get_model('layoutreader')
+    logger.info(f'model server warmed up in {round(time.time() - start, 2)}s')
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server.model_server
+        try:
+            header, payload = recv_message(self.request)
+        except (ConnectionError, struct.error, ValueError) as e:
+            logger.warning(f'model server got a bad request: {e}')
+            return
+
+        try:
+            op = header.get('op')
+            if op == 'ping':
+                send_message(self.request, {'ok': True, 'pid': os.getpid(), 'jobs': server.num_jobs})
+            elif op == 'analyze':
+                send_message(self.request, *server.run_analyze(header.get('kwargs', {}), payload))
+            elif op == 'shutdown':
+                send_message(self.request, {'ok': True})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            else:
+                send_message(self.request, {'ok': False, 'error': f'unknown op: {op}'})
+        except Exception:  # noqa
+            logger.exception('model server job failed')
+            send_message(self.request, {'ok': False, 'error': traceback.format_exc()})
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ModelServer:
+    def __init__(self, socket_path: str = None, analyze_fn=analyze_pdf):
+        """Serve analyze_pdf over a Unix socket. Connections are handled in threads, the jobs run one at a time
+        so that they never compete for the device memory.
+
+        Args:
+            socket_path (str, optional): Defaults to get_model_server_socket().
+            analyze_fn (optional): runs the jobs. Defaults to analyze_pdf.
+        """
+        self.socket_path = socket_path or get_model_server_socket()
+        self.analyze_fn = analyze_fn
+        self.num_jobs = 0
+        self._job_lock = threading.Lock()
+        self._server = None
+
+    def run_analyze(self, kwargs: dict, pdf_bytes: bytes):
+        with self._job_lock:
+            start = time.time()
+            model_list, pipe_res, images = self.analyze_fn(pdf_bytes, **kwargs)
+            self.num_jobs += 1
+        logger.info(f'model server job {self.num_jobs} done in {round(time.time() - start, 2)}s')
+        image_paths = list(images.keys())
+        header = {
+            'ok': True,
+            'model_list': model_list,
+            'pipe_res': pipe_res,
+            'images': [[path, len(images[path])] for path in image_paths],
+        }
+        return header, b''.join(images[path] for path in image_paths)
+
+    def start(self):
+        """Bind the socket, a stale socket file left by a dead server is replaced."""
+        if os.path.exists(self.socket_path):
+            if ModelServerClient(self.socket_path).ping() is not None:
+                raise ModelServerError(f'a model server is already listening on {self.socket_path}')
+            os.remove(self.socket_path)
+        self._server = _UnixServer(self.socket_path, _RequestHandler)
+        self._server.model_server = self
+        # the jobs read and write files as the user running the server
+        os.chmod(self.socket_path, 0o600)
+
+    def serve_forever(self):
+        if self._server is None:
+            self.start()
+        logger.info(f'model server listening on {self.socket_path}')
+        try:
+            self._server.serve_forever()
+        finally:
+            self.close()
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+    def close(self):
+        if self._server is not None:
+            self._server.server_close()
+            self._server = None
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+
+class ModelServerClient:
+    def __init__(self, socket_path: str = None, timeout: float = None):
+        """Client of the model server.
+
+        Args:
+            socket_path (str, optional): Defaults to get_model_server_socket().
+            timeout (float, optional): the socket timeout in seconds. Defaults to None, jobs can take long.
+        """
+        self.socket_path = socket_path or get_model_server_socket()
+        self.timeout = timeout
+
+    def _request(self, header: dict, payload: bytes = b'', timeout: float = None):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout if timeout is not None else self.timeout)
+            sock.connect(self.socket_path)
+            send_message(sock, header, payload)
+            response, response_payload = recv_message(sock)
+        if not response.get('ok'):
+            raise ModelServerError(response.get('error', 'unknown error'))
+        return response, response_payload
+
+    def ping(self, timeout: float = 2):
+        """The server status, or None when no server is listening."""
+        try:
+            return self._request({'op': 'ping'}, timeout=timeout)[0]
+        except (OSError, ConnectionError, ValueError, struct.error):
+            return None
+
+    def shutdown(self):
+        self._request({'op': 'shutdown'}, timeout=10)
+
+    def analyze(self, dataset: Dataset, image_writer: DataWriter, ocr: bool, lang=None, layout_model=None,
+                formula_enable=None, table_enable=None, start_page_id=0, end_page_id=None):
+        """Run doc_analyze and the txt or ocr pipeline of dataset on the server.
+
+        Args:
+            dataset (Dataset): the dataset, its pdf bytes are sent to the server
+            image_writer (DataWriter): writes the images cut by the pipeline
+            ocr (bool): use the ocr pipeline, else the txt one
+
+        Returns:
+            tuple: (InferenceResult, PipeResult), bound to dataset
+        """
+        from magic_pdf.operators.models import InferenceResult
+        from magic_pdf.operators.pipes import PipeResult
+
+        kwargs = {
+            'ocr': ocr,
+            'lang': lang,
+            'layout_model': layout_model,
+            'formula_enable': formula_enable,
+            'table_enable': table_enable,
+            'start_page_id': start_page_id,
+            'end_page_id': end_page_id,
+        }
+        response, payload = self._request({'op': 'analyze', 'kwargs': kwargs}, dataset.data_bits())
+        offset = 0
+        for path, size in response['images']:
+            image_writer.write(path, payload[offset:offset + size])
+            offset += size
+        return InferenceResult(response['model_list'], dataset), PipeResult(response['pipe_res'], dataset)
+
+
+def get_model_server_client():
+    """The client of the running model server, or None when there is none."""
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    client = ModelServerClient()
+    if not os.path.exists(client.socket_path) or client.ping() is None:
+        return None
+    return client
+
+
+@click.command()
+@click.option('-s', '--socket', 'socket_path', type=str, default=None,
+              help='the unix socket to listen on, defaults to MINERU_MODEL_SERVER_SOCKET or a per-user temp path')
+@click.option('--warmup/--no-warmup', default=True, help='load the models before accepting jobs')
+@click.option('--stop', is_flag=True, default=False, help='stop the server listening on the socket')
+def cli(socket_path, warmup, stop):
+    """Keep the models loaded and parse pdfs for magic-pdf and the other clients."""
+    if stop:
+        ModelServerClient(socket_path).shutdown()
+        return
+    import magic_pdf.model as model_config
+    model_config.__use_inside_model__ = True
+    server = ModelServer(socket_path)
+    server.start()
+    if warmup:
+        warmup_models()
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    cli()
@@ -13,7 +13,7 @@ def to_b64(file_path):
         raise Exception(f'File: {file_path} - Info: {e}')
 
 
-def do_parse(file_path, url='http://127.0.0.1:8000/predict', **kwargs):
+def do_parse(file_path, url='http://127.0.0.1:8000/parse', **kwargs):
     try:
         response = requests.post(url, json={
             'file': to_b64(file_path),
@@ -1,15 +1,56 @@
 import os
 import uuid
 import shutil
+import asyncio
 import tempfile
 import gc
 import fitz
 import torch
 import base64
 import filetype
+import requests
 import litserve as ls
 from pathlib import Path
-from fastapi import HTTPException
+from fastapi import HTTPException, Request
+
+
+def cvt2pdf(file_base64):
+    from magic_pdf.tools.cli import convert_file_to_pdf
+
+    try:
+        temp_dir = Path(tempfile.mkdtemp())
+        temp_file = temp_dir.joinpath('tmpfile')
+        file_bytes = base64.b64decode(file_base64)
+        file_ext = filetype.guess_extension(file_bytes)
+
+        if file_ext in ['pdf', 'jpg', 'png', 'doc', 'docx', 'ppt', 'pptx']:
+            if file_ext == 'pdf':
+                return file_bytes
+            elif file_ext in ['jpg', 'png']:
+                with fitz.open(stream=file_bytes, filetype=file_ext) as f:
+                    return f.convert_to_pdf()
+            else:
+                temp_file.write_bytes(file_bytes)
+                convert_file_to_pdf(temp_file, temp_dir)
+                return temp_file.with_suffix('.pdf').read_bytes()
+        else:
+            raise Exception('Unsupported file format')
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def split_page_ranges(num_pages, num_shards, min_shard_pages=1):
+    """Split the pages into at most num_shards contiguous ranges of similar size, each of at least
+    min_shard_pages pages (but one).
+
+    Returns:
+        list: (start_page_id, end_page_id) of each shard, end_page_id included
+    """
+    num_shards = max(1, min(num_shards, num_pages // max(1, min_shard_pages)))
+    bounds = [round(i * num_pages / num_shards) for i in range(num_shards + 1)]
+    return [(bounds[i], bounds[i + 1] - 1) for i in range(num_shards)]
 
 
 class MinerUAPI(ls.LitAPI):
@@ -22,11 +63,10 @@ class MinerUAPI(ls.LitAPI):
             if torch.cuda.device_count() > 1:
                 raise RuntimeError("Remove any CUDA actions before setting 'CUDA_VISIBLE_DEVICES'.")
 
-        from magic_pdf.tools.cli import do_parse, convert_file_to_pdf
+        from magic_pdf.tools.cli import do_parse
         from magic_pdf.model.doc_analyze_by_custom_model import ModelSingleton
 
         self.do_parse = do_parse
-        self.convert_file_to_pdf = convert_file_to_pdf
 
         model_manager = ModelSingleton()
         model_manager.get_model(True, False)
@@ -34,6 +74,10 @@ class MinerUAPI(ls.LitAPI):
         print(f'Model initialization complete on {device}!')
 
     def decode_request(self, request):
+        if 'shard' in request:
+            # 大文档的一个页码分片, 由 ShardedParser 发来, pdf 已写在共享的输出目录
+            opts = dict(request['shard'], shard=True)
+            return Path(opts.pop('pdf_path')).read_bytes(), opts
         file = request['file']
         file = self.cvt2pdf(file)
         opts = request.get('kwargs', {})
@@ -42,6 +86,13 @@ class MinerUAPI(ls.LitAPI):
         return file, opts
 
     def predict(self, inputs):
+        if inputs[1].pop('shard', False):
+            try:
+                return self.parse_shard(inputs[0], **inputs[1])
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=str(e))
+            finally:
+                self.clean_memory()
         try:
             pdf_name = str(uuid.uuid4())
             output_dir = self.output_dir.joinpath(pdf_name)
@@ -53,7 +104,40 @@ class MinerUAPI(ls.LitAPI):
         finally:
             self.clean_memory()
 
+    def parse_shard(self, pdf_bytes, output_dir, parse_method, start_page_id, end_page_id, lang=None,
+                    layout_model=None, formula_enable=None, table_enable=None):
+        """Run the inference and the pipeline on a page range of the document, the images are written to the
+        images dir of output_dir, shared by all the shards. The pages are not finalized, merge_pdf_info_shards
+        does it once over the merged pages."""
+        from magic_pdf.data.data_reader_writer import FileBasedDataWriter
+        from magic_pdf.data.dataset import PymuDocDataset
+        from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze
+
+        ds = PymuDocDataset(pdf_bytes, lang=lang)
+        infer_result = ds.apply(
+            doc_analyze,
+            ocr=parse_method == 'ocr',
+            lang=ds._lang,
+            start_page_id=start_page_id,
+            end_page_id=end_page_id,
+            layout_model=layout_model,
+            formula_enable=formula_enable,
+            table_enable=table_enable,
+        )
+        pipe = infer_result.pipe_ocr_mode if parse_method == 'ocr' else infer_result.pipe_txt_mode
+        pipe_result = pipe(
+            FileBasedDataWriter(os.path.join(output_dir, 'images')),
+            start_page_id=start_page_id,
+            end_page_id=end_page_id,
+            debug_mode=True,
+            lang=ds._lang,
+            finalize=False,
+        )
+        return {'model_list': infer_result.get_infer_res(), 'pipe_res': pipe_result._pipe_res}
+
     def encode_response(self, response):
+        if isinstance(response, dict):
+            return response
         return {'output_dir': response}
 
     def clean_memory(self):
@@ -63,36 +147,133 @@ class MinerUAPI(ls.LitAPI):
         gc.collect()
 
     def cvt2pdf(self, file_base64):
+        return cvt2pdf(file_base64)
+
+
+class ShardedParser:
+    def __init__(self, output_dir='/tmp', predict_url='http://127.0.0.1:8000/predict', num_shards=1,
+                 min_shard_pages=None):
+        """Parse a document on all the devices: its pages are split into contiguous ranges, one per worker,
+        parsed by the workers of the LitServe server and merged back into one result, as do_parse writes it.
+        Runs in the server process, which holds no model, so it never blocks a worker.
+
+        Args:
+            output_dir (str, optional): Defaults to '/tmp'.
+            predict_url (str, optional): the predict endpoint of the workers.
+            num_shards (int, optional): the number of workers. Defaults to 1.
+            min_shard_pages (int, optional): documents are not split below this number of pages per shard.
+                Defaults to MINERU_SHARD_MIN_PAGES or 16.
+        """
+        self.output_dir = Path(output_dir)
+        self.predict_url = predict_url
+        self.num_shards = num_shards
+        if min_shard_pages is None:
+            min_shard_pages = max(1, int(os.getenv('MINERU_SHARD_MIN_PAGES', 16)))
+        self.min_shard_pages = min_shard_pages
+
+    def post_shard(self, shard):
+        response = requests.post(self.predict_url, json={'shard': shard})
+        if response.status_code != 200:
+            raise Exception(response.text)
+        return response.json()
+
+    async def parse(self, request: Request):
+        body = await request.json()
+        opts = body.get('kwargs', {})
+        opts.setdefault('debug_able', False)
+        opts.setdefault('parse_method', 'auto')
+        pdf_bytes = await asyncio.to_thread(cvt2pdf, body['file'])
+
+        pdf_name = str(uuid.uuid4())
+        output_dir = self.output_dir.joinpath(pdf_name)
         try:
-            temp_dir = Path(tempfile.mkdtemp())
-            temp_file = temp_dir.joinpath('tmpfile')
-            file_bytes = base64.b64decode(file_base64)
-            file_ext = filetype.guess_extension(file_bytes)
-
-            if file_ext in ['pdf', 'jpg', 'png', 'doc', 'docx', 'ppt', 'pptx']:
-                if file_ext == 'pdf':
-                    return file_bytes
-                elif file_ext in ['jpg', 'png']:
-                    with fitz.open(stream=file_bytes, filetype=file_ext) as f:
-                        return f.convert_to_pdf()
-                else:
-                    temp_file.write_bytes(file_bytes)
-                    self.convert_file_to_pdf(temp_file, temp_dir)
-                    return temp_file.with_suffix('.pdf').read_bytes()
-            else:
-                raise Exception('Unsupported file format')
+            await self.parse_sharded(pdf_name, pdf_bytes, **opts)
+            return {'output_dir': output_dir}
         except Exception as e:
+            shutil.rmtree(output_dir, ignore_errors=True)
             raise HTTPException(status_code=500, detail=str(e))
-        finally:
-            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    async def parse_sharded(self, pdf_name, pdf_bytes, parse_method='auto', debug_able=False, lang=None,
+                            layout_model=None, formula_enable=None, table_enable=None):
+        from magic_pdf.config.enums import SupportedPdfParseMethod
+        from magic_pdf.data.dataset import PymuDocDataset
+        from magic_pdf.tools.common import prepare_env
+
+        ds = PymuDocDataset(pdf_bytes, lang=lang)
+        local_image_dir, local_md_dir = prepare_env(str(self.output_dir), pdf_name, parse_method)
+        pdf_path = os.path.join(local_md_dir, f'{pdf_name}_origin.pdf')
+        Path(pdf_path).write_bytes(pdf_bytes)
+
+        # 所有分片使用同一种解析方式
+        shard_parse_method = parse_method
+        if parse_method == 'auto':
+            is_txt = await asyncio.to_thread(ds.classify) == SupportedPdfParseMethod.TXT
+            shard_parse_method = 'txt' if is_txt else 'ocr'
+
+        page_ranges = split_page_ranges(len(ds), self.num_shards, self.min_shard_pages)
+        shard_results = await asyncio.gather(*[
+            asyncio.to_thread(self.post_shard, {
+                'pdf_path': pdf_path,
+                'output_dir': local_md_dir,
+                'parse_method': shard_parse_method,
+                'start_page_id': start_page_id,
+                'end_page_id': end_page_id,
+                'lang': ds._lang,
+                'layout_model': layout_model,
+                'formula_enable': formula_enable,
+                'table_enable': table_enable,
+            })
+            for start_page_id, end_page_id in page_ranges
+        ])
+        await asyncio.to_thread(
+            self.dump_merged, ds, pdf_name, local_image_dir, local_md_dir, page_ranges, shard_results, debug_able
+        )
+
+    def dump_merged(self, ds, pdf_name, local_image_dir, local_md_dir, page_ranges, shard_results, debug_able):
+        """Merge the shard results and write the outputs of do_parse."""
+        from magic_pdf.config.make_content_config import DropMode
+        from magic_pdf.data.data_reader_writer import FileBasedDataWriter
+        from magic_pdf.operators.models import InferenceResult
+        from magic_pdf.operators.pipes import PipeResult
+        from magic_pdf.pdf_parse_union_core_v2 import merge_pdf_info_shards
+
+        model_list = list(shard_results[0]['model_list'])
+        for (start_page_id, end_page_id), shard_result in zip(page_ranges, shard_results):
+            model_list[start_page_id:end_page_id + 1] = shard_result['model_list'][start_page_id:end_page_id + 1]
+        pipe_res = dict(shard_results[0]['pipe_res'])
+        pipe_res.update(merge_pdf_info_shards([
+            (start_page_id, end_page_id, shard_result['pipe_res']['pdf_info'])
+            for (start_page_id, end_page_id), shard_result in zip(page_ranges, shard_results)
+        ]))
+        infer_result, pipe_result = InferenceResult(model_list, ds), PipeResult(pipe_res, ds)
+
+        md_writer = FileBasedDataWriter(local_md_dir)
+        image_dir = str(os.path.basename(local_image_dir))
+        pipe_result.draw_layout(os.path.join(local_md_dir, f'{pdf_name}_layout.pdf'))
+        pipe_result.draw_span(os.path.join(local_md_dir, f'{pdf_name}_spans.pdf'))
+        if debug_able:
+            infer_result.draw_model(os.path.join(local_md_dir, f'{pdf_name}_model.pdf'))
+            pipe_result.draw_line_sort(os.path.join(local_md_dir, f'{pdf_name}_line_sort.pdf'))
+        pipe_result.dump_md(md_writer, f'{pdf_name}.md', image_dir, drop_mode=DropMode.NONE)
+        pipe_result.dump_middle_json(md_writer, f'{pdf_name}_middle.json')
+        infer_result.dump_model(md_writer, f'{pdf_name}_model.json')
+        pipe_result.dump_content_list(md_writer, f'{pdf_name}_content_list.json', image_dir)
 
 
 if __name__ == '__main__':
+    workers_per_device = 1
     server = ls.LitServer(
         MinerUAPI(output_dir='/tmp'),
         accelerator='cuda',
         devices='auto',
-        workers_per_device=1,
+        workers_per_device=workers_per_device,
         timeout=False
     )
+    # 大文档按页码分片, 分发到所有 GPU 上的 worker 并行解析
+    sharded_parser = ShardedParser(
+        output_dir='/tmp',
+        predict_url='http://127.0.0.1:8000/predict',
+        num_shards=max(1, torch.cuda.device_count()) * workers_per_device,
+    )
+    server.app.add_api_route('/parse', sharded_parser.parse, methods=['POST'])
     server.run(port=8000)
@@ -1,30 +1,35 @@
+import copy
 import json
 import os
 from base64 import b64encode
+from contextlib import asynccontextmanager
 from glob import glob
 from io import StringIO
 import tempfile
-from typing import Tuple, Union
+from typing import Callable, Dict, Optional, Tuple, Union
 
 import uvicorn
 from fastapi import FastAPI, HTTPException, UploadFile
-from fastapi.responses import JSONResponse
-from loguru import logger
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from magic_pdf.data.read_api import read_local_images, read_local_office
 import magic_pdf.model as model_config
 from magic_pdf.config.enums import SupportedPdfParseMethod
+from magic_pdf.config.make_content_config import DropMode, MakeMode
 from magic_pdf.data.data_reader_writer import DataWriter, FileBasedDataWriter
 from magic_pdf.data.data_reader_writer.s3 import S3DataReader, S3DataWriter
 from magic_pdf.data.dataset import ImageDataset, PymuDocDataset
+from magic_pdf.dict2md.ocr_mkcontent import union_make
 from magic_pdf.libs.config_reader import get_bucket_name, get_s3_config
-from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze
+from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze_streaming
 from magic_pdf.operators.models import InferenceResult
 from magic_pdf.operators.pipes import PipeResult
+from magic_pdf.post_proc.para_split_v3 import para_split
+from magic_pdf.tools.model_server import get_model_server_client
 
-model_config.__use_inside_model__ = True
+from job_queue import JobQueue, QueueFullError
 
-app = FastAPI()
+model_config.__use_inside_model__ = True
 
 pdf_extensions = [".pdf"]
 office_extensions = [".ppt", ".pptx", ".doc", ".docx"]
@@ -52,7 +57,8 @@ class MemoryDataWriter(DataWriter):
 
 def init_writers(
     file_path: str = None,
-    file: UploadFile = None,
+    file_bytes: bytes = None,
+    file_name: str = None,
     output_path: str = None,
     output_image_path: str = None,
 ) -> Tuple[
@@ -65,7 +71,8 @@ def init_writers(
 
     Args:
         file_path: file path (local path or S3 path)
-        file: Uploaded file object
+        file_bytes: Content of the uploaded file
+        file_name: Name of the uploaded file
         output_path: Output directory path
         output_image_path: Image output directory path
 
@@ -100,8 +107,7 @@ def init_writers(
             file_extension = os.path.splitext(file_path)[1]
     else:
         # 处理上传的文件
-        file_bytes = file.file.read()
-        file_extension = os.path.splitext(file.filename)[1]
+        file_extension = os.path.splitext(file_name)[1]
         writer = FileBasedDataWriter(output_path)
         image_writer = FileBasedDataWriter(output_image_path)
         os.makedirs(output_image_path, exist_ok=True)
@@ -114,6 +120,7 @@ def process_file(
     file_extension: str,
     parse_method: str,
     image_writer: Union[S3DataWriter, FileBasedDataWriter],
+    on_window_parsed: Optional[Callable[[Dict[int, dict]], None]] = None,
 ) -> Tuple[InferenceResult, PipeResult]:
     """
     Process PDF file content
@@ -123,6 +130,8 @@ def process_file(
         file_extension: file extension
         parse_method: Parse method ('ocr', 'txt', 'auto')
         image_writer: Image writer
+        on_window_parsed: called with the page infos of each window of pages as soon as it is parsed, not
+            called when the inference runs in the model server
 
     Returns:
         Tuple[InferenceResult, PipeResult]: Returns inference result and pipeline result
@@ -143,24 +152,18 @@ def process_file(
         with open(os.path.join(temp_dir, f"temp_file.{file_extension}"), "wb") as f:
             f.write(file_bytes)
         ds = read_local_images(temp_dir)[0]
-    infer_result: InferenceResult = None
-    pipe_result: PipeResult = None
-
-    if parse_method == "ocr":
-        infer_result = ds.apply(doc_analyze, ocr=True)
-        pipe_result = infer_result.pipe_ocr_mode(image_writer)
-    elif parse_method == "txt":
-        infer_result = ds.apply(doc_analyze, ocr=False)
-        pipe_result = infer_result.pipe_txt_mode(image_writer)
-    else:  # auto
-        if ds.classify() == SupportedPdfParseMethod.OCR:
-            infer_result = ds.apply(doc_analyze, ocr=True)
-            pipe_result = infer_result.pipe_ocr_mode(image_writer)
-        else:
-            infer_result = ds.apply(doc_analyze, ocr=False)
-            pipe_result = infer_result.pipe_txt_mode(image_writer)
 
-    return infer_result, pipe_result
+    if parse_method == "auto":
+        ocr = ds.classify() == SupportedPdfParseMethod.OCR
+    else:
+        ocr = parse_method == "ocr"
+
+    model_server = get_model_server_client()
+    if model_server is not None:
+        # 模型常驻在magic-pdf-server进程中
+        return model_server.analyze(ds, image_writer, ocr=ocr)
+    # 每个窗口的页推理完成后立即解析, 解析结果通过on_window_parsed发出
+    return ds.apply(doc_analyze_streaming, image_writer, ocr=ocr, on_window_parsed=on_window_parsed)
 
 
 def encode_image(image_path: str) -> str:
@@ -169,6 +172,200 @@ def encode_image(image_path: str) -> str:
         return b64encode(f.read()).decode()
 
 
+def page_event(page_info: dict) -> dict:
+    """The md and content list of a parsed page."""
+    page_idx = page_info["page_idx"]
+    return {
+        "page_idx": page_idx,
+        "md_content": union_make([page_info], MakeMode.MM_MD, DropMode.NONE, "images"),
+        "content_list": union_make([page_info], MakeMode.STANDARD_FORMAT, DropMode.NONE, "images"),
+    }
+
+
+def parse_file(request: dict, emit: Callable[[dict], None]) -> dict:
+    """
+    Run a parse job, in the inference executor of the job queue
+
+    The pages of each window are published as soon as they are parsed, with the paragraphs split within the
+    window. Once the document is finished, a "fixup" event carries the pages whose result changed with the
+    cross-page stages (paragraphs merged across windows, batched ocr of the spans).
+
+    Args:
+        request: the arguments of the job, see `read_parse_request`
+        emit: publishes the result of each page to the clients streaming the job
+
+    Returns:
+        dict: the response data of `/file_parse`
+    """
+    file_name = request["file_name"]
+    output_path = f"{request['output_dir']}/{file_name}"
+    output_image_path = f"{output_path}/images"
+
+    # Initialize readers/writers and get PDF content
+    writer, image_writer, file_bytes, file_extension = init_writers(
+        file_path=request["file_path"],
+        file_bytes=request["file_bytes"],
+        file_name=request["upload_name"],
+        output_path=output_path,
+        output_image_path=output_image_path,
+    )
+
+    # page_idx -> the page event published before the cross-page stages
+    streamed_pages = {}
+
+    def on_window_parsed(page_infos: Dict[int, dict]):
+        # the page infos are finalized later, split the paragraphs of the window on a copy
+        window_pdf_info = {
+            f"page_{page_id}": copy.deepcopy(page_info) for page_id, page_info in sorted(page_infos.items())
+        }
+        para_split(window_pdf_info)
+        for page_info in window_pdf_info.values():
+            # as read back from the middle json, to compare with the final pages
+            event = json.loads(json.dumps(page_event(page_info), ensure_ascii=False))
+            streamed_pages[event["page_idx"]] = event
+            emit({"event": "page", **event})
+
+    # Process PDF
+    infer_result, pipe_result = process_file(
+        file_bytes, file_extension, request["parse_method"], image_writer, on_window_parsed
+    )
+
+    # Use MemoryDataWriter to get results
+    content_list_writer = MemoryDataWriter()
+    md_content_writer = MemoryDataWriter()
+    middle_json_writer = MemoryDataWriter()
+
+    # Use PipeResult's dump method to get data
+    pipe_result.dump_content_list(content_list_writer, "", "images")
+    pipe_result.dump_md(md_content_writer, "", "images")
+    pipe_result.dump_middle_json(middle_json_writer, "")
+
+    # Get content
+    content_list = json.loads(content_list_writer.get_value())
+    md_content = md_content_writer.get_value()
+    middle_json = json.loads(middle_json_writer.get_value())
+    model_json = infer_result.get_infer_res()
+
+    # Publish the pages not streamed yet (e.g. parsed by the model server), and fix up the streamed ones
+    fixed_pages = []
+    for page_info in middle_json["pdf_info"]:
+        event = page_event(page_info)
+        if event["page_idx"] not in streamed_pages:
+            emit({"event": "page", **event})
+        elif event != streamed_pages[event["page_idx"]]:
+            fixed_pages.append(event)
+    emit({"event": "fixup", "pages": fixed_pages})
+
+    # If results need to be saved
+    if request["is_json_md_dump"]:
+        writer.write_string(
+            f"{file_name}_content_list.json", content_list_writer.get_value()
+        )
+        writer.write_string(f"{file_name}.md", md_content)
+        writer.write_string(
+            f"{file_name}_middle.json", middle_json_writer.get_value()
+        )
+        writer.write_string(
+            f"{file_name}_model.json",
+            json.dumps(model_json, indent=4, ensure_ascii=False),
+        )
+        # Save visualization results
+        pipe_result.draw_layout(os.path.join(output_path, f"{file_name}_layout.pdf"))
+        pipe_result.draw_span(os.path.join(output_path, f"{file_name}_spans.pdf"))
+        pipe_result.draw_line_sort(
+            os.path.join(output_path, f"{file_name}_line_sort.pdf")
+        )
+        infer_result.draw_model(os.path.join(output_path, f"{file_name}_model.pdf"))
+
+    # Build return data
+    data = {}
+    if request["return_layout"]:
+        data["layout"] = model_json
+    if request["return_info"]:
+        data["info"] = middle_json
+    if request["return_content_list"]:
+        data["content_list"] = content_list
+    if request["return_images"]:
+        image_paths = glob(f"{output_image_path}/*.jpg")
+        data["images"] = {
+            os.path.basename(
+                image_path
+            ): f"data:image/jpeg;base64,{encode_image(image_path)}"
+            for image_path in image_paths
+        }
+    data["md_content"] = md_content  # md_content is always returned
+
+    # Clean up memory writers
+    content_list_writer.close()
+    md_content_writer.close()
+    middle_json_writer.close()
+
+    return data
+
+
+job_queue = JobQueue.from_env(parse_file)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+async def read_parse_request(
+    file: UploadFile,
+    file_path: str,
+    parse_method: str,
+    is_json_md_dump: bool,
+    output_dir: str,
+    return_layout: bool,
+    return_info: bool,
+    return_content_list: bool,
+    return_images: bool,
+) -> dict:
+    """
+    Validate the parameters of a parse job, the uploaded file is read here so that the job does not depend on
+    the request
+
+    Raises:
+        HTTPException: when neither or both of file and file_path are given
+    """
+    if (file is None and file_path is None) or (
+        file is not None and file_path is not None
+    ):
+        raise HTTPException(status_code=400, detail="Must provide either file or file_path")
+
+    # Get PDF filename
+    file_name = os.path.basename(file_path if file_path else file.filename).split(
+        "."
+    )[0]
+    return {
+        "file_name": file_name,
+        "file_path": file_path,
+        "file_bytes": await file.read() if file is not None else None,
+        "upload_name": file.filename if file is not None else None,
+        "parse_method": parse_method,
+        "is_json_md_dump": is_json_md_dump,
+        "output_dir": output_dir,
+        "return_layout": return_layout,
+        "return_info": return_info,
+        "return_content_list": return_content_list,
+        "return_images": return_images,
+    }
+
+
+def submit_job(request: dict):
+    """Queue a parse job, answering 429 when the queue is full so that the clients back off."""
+    try:
+        return job_queue.submit(request)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "10"})
+
+
 @app.post(
     "/file_parse",
     tags=["projects"],
@@ -187,7 +384,8 @@ async def file_parse(
 ):
     """
     Execute the process of converting PDF to JSON and MD, outputting MD and JSON files
-    to the specified directory.
+    to the specified directory. The file is parsed through the job queue, the
+    request waits for the result.
 
     Args:
         file: The PDF file to be parsed. Must not be specified together with
@@ -206,97 +404,74 @@ async def file_parse(
         return_content_list: Whether to return parsed PDF content list. Default to False
     """
     try:
-        if (file is None and file_path is None) or (
-            file is not None and file_path is not None
-        ):
-            return JSONResponse(
-                content={"error": "Must provide either file or file_path"},
-                status_code=400,
-            )
-
-        # Get PDF filename
-        file_name = os.path.basename(file_path if file_path else file.filename).split(
-            "."
-        )[0]
-        output_path = f"{output_dir}/{file_name}"
-        output_image_path = f"{output_path}/images"
-
-        # Initialize readers/writers and get PDF content
-        writer, image_writer, file_bytes, file_extension = init_writers(
-            file_path=file_path,
-            file=file,
-            output_path=output_path,
-            output_image_path=output_image_path,
+        request = await read_parse_request(
+            file, file_path, parse_method, is_json_md_dump, output_dir,
+            return_layout, return_info, return_content_list, return_images,
         )
+    except HTTPException as e:
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+    job = submit_job(request)
+    await job.wait()
+    if job.status == "failed":
+        return JSONResponse(content={"error": job.error}, status_code=500)
+    return JSONResponse(job.result, status_code=200)
 
-        # Process PDF
-        infer_result, pipe_result = process_file(file_bytes, file_extension, parse_method, image_writer)
-
-        # Use MemoryDataWriter to get results
-        content_list_writer = MemoryDataWriter()
-        md_content_writer = MemoryDataWriter()
-        middle_json_writer = MemoryDataWriter()
-
-        # Use PipeResult's dump method to get data
-        pipe_result.dump_content_list(content_list_writer, "", "images")
-        pipe_result.dump_md(md_content_writer, "", "images")
-        pipe_result.dump_middle_json(middle_json_writer, "")
-
-        # Get content
-        content_list = json.loads(content_list_writer.get_value())
-        md_content = md_content_writer.get_value()
-        middle_json = json.loads(middle_json_writer.get_value())
-        model_json = infer_result.get_infer_res()
-
-        # If results need to be saved
-        if is_json_md_dump:
-            writer.write_string(
-                f"{file_name}_content_list.json", content_list_writer.get_value()
-            )
-            writer.write_string(f"{file_name}.md", md_content)
-            writer.write_string(
-                f"{file_name}_middle.json", middle_json_writer.get_value()
-            )
-            writer.write_string(
-                f"{file_name}_model.json",
-                json.dumps(model_json, indent=4, ensure_ascii=False),
-            )
-            # Save visualization results
-            pipe_result.draw_layout(os.path.join(output_path, f"{file_name}_layout.pdf"))
-            pipe_result.draw_span(os.path.join(output_path, f"{file_name}_spans.pdf"))
-            pipe_result.draw_line_sort(
-                os.path.join(output_path, f"{file_name}_line_sort.pdf")
-            )
-            infer_result.draw_model(os.path.join(output_path, f"{file_name}_model.pdf"))
-
-        # Build return data
-        data = {}
-        if return_layout:
-            data["layout"] = model_json
-        if return_info:
-            data["info"] = middle_json
-        if return_content_list:
-            data["content_list"] = content_list
-        if return_images:
-            image_paths = glob(f"{output_image_path}/*.jpg")
-            data["images"] = {
-                os.path.basename(
-                    image_path
-                ): f"data:image/jpeg;base64,{encode_image(image_path)}"
-                for image_path in image_paths
-            }
-        data["md_content"] = md_content  # md_content is always returned
-
-        # Clean up memory writers
-        content_list_writer.close()
-        md_content_writer.close()
-        middle_json_writer.close()
-
-        return JSONResponse(data, status_code=200)
-
-    except Exception as e:
-        logger.exception(e)
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+@app.post(
+    "/jobs",
+    tags=["projects"],
+    summary="Submit a parse job, returns at once with the job id",
+    status_code=202,
+)
+async def submit_parse_job(
+    file: UploadFile = None,
+    file_path: str = None,
+    parse_method: str = "auto",
+    is_json_md_dump: bool = False,
+    output_dir: str = "output",
+    return_layout: bool = False,
+    return_info: bool = False,
+    return_content_list: bool = False,
+    return_images: bool = False,
+):
+    """
+    Queue a parse job with the parameters of `/file_parse`. Poll `/jobs/{job_id}`
+    or stream `/jobs/{job_id}/stream` for the result. Answers 429 when too many
+    jobs are already queued.
+    """
+    request = await read_parse_request(
+        file, file_path, parse_method, is_json_md_dump, output_dir,
+        return_layout, return_info, return_content_list, return_images,
+    )
+    job = submit_job(request)
+    return JSONResponse(job.to_dict(), status_code=202)
+
+
+def get_job_or_404(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
+
+@app.get("/jobs/{job_id}", tags=["projects"], summary="Get the status of a parse job, and its result once done")
+async def get_parse_job(job_id: str):
+    return JSONResponse(get_job_or_404(job_id).to_dict())
+
+
+@app.get(
+    "/jobs/{job_id}/stream",
+    tags=["projects"],
+    summary="Stream the events of a parse job as NDJSON: status changes and the result of each page",
+)
+async def stream_parse_job(job_id: str):
+    job = get_job_or_404(job_id)
+
+    async def events():
+        async for event in job.iter_events():
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,181 @@
+import asyncio
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+
+class QueueFullError(Exception):
+    """Raised by JobQueue.submit when the queue is full, the client should retry later."""
+
+
+class Job:
+    def __init__(self, request: Dict[str, Any]):
+        """A parse job and the events it emitted so far."""
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.status = "queued"  # queued -> running -> done | failed
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def add_event(self, event: Dict[str, Any]):
+        """Must be called from the event loop thread."""
+        self.events.append(event)
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def set_status(self, status: str, **extra):
+        self.status = status
+        if status == "running":
+            self.started_at = time.time()
+        elif self.finished:
+            self.finished_at = time.time()
+        self.add_event({"event": "status", "status": status, **extra})
+
+    async def wait(self):
+        """Wait until the job is finished."""
+        while not self.finished:
+            await self._changed.wait()
+
+    async def iter_events(self):
+        """Yield all the events of the job, the past ones first, until it is finished."""
+        index = 0
+        while True:
+            changed = self._changed
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.finished:
+                return
+            await changed.wait()
+
+    def to_dict(self, with_result: bool = True) -> Dict[str, Any]:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "pages_done": sum(1 for event in self.events if event["event"] == "page"),
+        }
+        if self.error is not None:
+            data["error"] = self.error
+        if with_result and self.result is not None:
+            data["result"] = self.result
+        return data
+
+
+class JobQueue:
+    def __init__(
+        self,
+        process_fn: Callable[[Dict[str, Any], Callable[[Dict[str, Any]], None]], Dict[str, Any]],
+        max_queued: int = 16,
+        num_workers: int = 1,
+        job_ttl: float = 3600,
+    ):
+        """A bounded queue of parse jobs, run by num_workers threads of a dedicated executor so that the
+        inference never blocks the event loop, and at most num_workers documents share the device memory.
+
+        Args:
+            process_fn: runs a job in an executor thread, `process_fn(request, emit)` returns the result,
+                emit(event) publishes an event (e.g. a parsed page) to the clients streaming the job
+            max_queued (int, optional): the jobs waiting for a worker, more are rejected. Defaults to 16.
+            num_workers (int, optional): the jobs running at the same time. Defaults to 1.
+            job_ttl (float, optional): finished jobs are forgotten after job_ttl seconds. Defaults to 3600.
+        """
+        self.process_fn = process_fn
+        self.max_queued = max_queued
+        self.num_workers = num_workers
+        self.job_ttl = job_ttl
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._workers: List[asyncio.Task] = []
+
+    @classmethod
+    def from_env(cls, process_fn):
+        """Build the queue from MINERU_API_MAX_QUEUED_JOBS, MINERU_API_GPU_WORKERS and MINERU_API_JOB_TTL."""
+        return cls(
+            process_fn,
+            max_queued=max(1, int(os.getenv("MINERU_API_MAX_QUEUED_JOBS", 16))),
+            num_workers=max(1, int(os.getenv("MINERU_API_GPU_WORKERS", 1))),
+            job_ttl=float(os.getenv("MINERU_API_JOB_TTL", 3600)),
+        )
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._executor = ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="mineru-infer")
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.num_workers)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, request: Dict[str, Any]) -> Job:
+        """Queue a job.
+
+        Raises:
+            QueueFullError: max_queued jobs are already waiting
+        """
+        self._forget_expired()
+        job = Job(request)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"{self.max_queued} jobs are already queued")
+        self.jobs[job.id] = job
+        job.set_status("queued", queue_position=self.queued)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def _forget_expired(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job.finished and now - job.finished_at > self.job_ttl]:
+            del self.jobs[job_id]
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            job.set_status("running")
+
+            def emit(event, job=job):
+                loop.call_soon_threadsafe(job.add_event, event)
+
+            try:
+                result = await loop.run_in_executor(self._executor, self.process_fn, job.request, emit)
+            except Exception as e:
+                logger.exception(e)
+                job.error = str(e)
+                job.set_status("failed", error=job.error)
+            else:
+                job.result = result
+                job.set_status("done")
+            finally:
+                # the request may hold the whole file
+                job.request = None
+                self._queue.task_done()
@@ -0,0 +1,164 @@
+import asyncio
+import threading
+
+import pytest
+
+from job_queue import JobQueue, QueueFullError
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=10))
+
+
+async def wait_until(predicate):
+    while not predicate():
+        await asyncio.sleep(0.01)
+
+
+def parse_pages(num_pages, release=None):
+    """A process_fn emitting num_pages page events, blocked until release is set."""
+    def process_fn(request, emit):
+        if release is not None:
+            release.wait(10)
+        for page_idx in range(num_pages):
+            emit({"event": "page", "page_idx": page_idx})
+        return {"md_content": request["name"]}
+    return process_fn
+
+
+def test_submit_rejects_when_queue_full():
+    async def main():
+        release = threading.Event()
+        job_queue = JobQueue(parse_pages(0, release), max_queued=1, num_workers=1)
+        await job_queue.start()
+        try:
+            running = job_queue.submit({"name": "running"})
+            await wait_until(lambda: running.status == "running")
+            queued = job_queue.submit({"name": "queued"})
+            with pytest.raises(QueueFullError):
+                job_queue.submit({"name": "rejected"})
+            assert queued.status == "queued" and len(job_queue.jobs) == 2
+
+            release.set()
+            await queued.wait()
+            # the queue has room again
+            await job_queue.submit({"name": "accepted"}).wait()
+        finally:
+            release.set()
+            await job_queue.stop()
+
+    run(main())
+
+
+def test_job_status_and_events():
+    async def main():
+        release = threading.Event()
+        job_queue = JobQueue(parse_pages(2, release))
+        await job_queue.start()
+        try:
+            job = job_queue.submit({"name": "doc"})
+            assert job.status == "queued" and job_queue.get(job.id) is job
+            await wait_until(lambda: job.status == "running")
+            assert job.started_at is not None and job.finished_at is None
+
+            release.set()
+            await job.wait()
+        finally:
+            release.set()
+            await job_queue.stop()
+
+        assert job.status == "done" and job.result == {"md_content": "doc"}
+        assert job.request is None
+        assert job.to_dict()["pages_done"] == 2
+        assert job.to_dict()["result"] == job.result
+
+        # a client subscribing after the job finished gets all its events
+        events = [event async for event in job.iter_events()]
+        assert events == [
+            {"event": "status", "status": "queued", "queue_position": 1},
+            {"event": "status", "status": "running"},
+            {"event": "page", "page_idx": 0},
+            {"event": "page", "page_idx": 1},
+            {"event": "status", "status": "done"},
+        ]
+
+    run(main())
+
+
+def test_subscriber_joining_a_running_job_gets_the_past_events():
+    async def main():
+        release = threading.Event()
+        job_queue = JobQueue(parse_pages(3, release))
+        await job_queue.start()
+        try:
+            job = job_queue.submit({"name": "doc"})
+            await wait_until(lambda: job.status == "running")
+
+            async def subscribe():
+                return [event async for event in job.iter_events()]
+
+            early = asyncio.create_task(subscribe())
+            await asyncio.sleep(0.05)
+            release.set()
+            await wait_until(lambda: job.to_dict()["pages_done"] >= 1)
+            late = asyncio.create_task(subscribe())
+            assert await early == await late
+        finally:
+            release.set()
+            await job_queue.stop()
+        assert [event["event"] for event in job.events] == ["status", "status", "page", "page", "page", "status"]
+
+    run(main())
+
+
+def test_failed_job():
+    def process_fn(request, emit):
+        emit({"event": "page", "page_idx": 0})
+        raise ValueError("broken pdf")
+
+    async def main():
+        job_queue = JobQueue(process_fn)
+        await job_queue.start()
+        try:
+            job = job_queue.submit({"name": "doc"})
+            await job.wait()
+            # the queue keeps serving the next jobs
+            await job_queue.submit({"name": "next"}).wait()
+        finally:
+            await job_queue.stop()
+
+        assert job.status == "failed" and job.error == "broken pdf"
+        assert job.result is None and job.finished_at is not None
+        assert job.to_dict()["error"] == "broken pdf"
+        assert job.events[-1] == {"event": "status", "status": "failed", "error": "broken pdf"}
+
+    run(main())
+
+
+def test_finished_jobs_expire_after_ttl():
+    async def main():
+        job_queue = JobQueue(parse_pages(0), job_ttl=60)
+        await job_queue.start()
+        try:
+            expired = job_queue.submit({"name": "expired"})
+            kept = job_queue.submit({"name": "kept"})
+            await expired.wait()
+            await kept.wait()
+            expired.finished_at -= 61
+
+            job = job_queue.submit({"name": "doc"})
+            assert job_queue.get(expired.id) is None
+            assert job_queue.get(kept.id) is kept and job_queue.get(job.id) is job
+            await job.wait()
+        finally:
+            await job_queue.stop()
+
+    run(main())
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("MINERU_API_MAX_QUEUED_JOBS", "4")
+    monkeypatch.setenv("MINERU_API_GPU_WORKERS", "2")
+    monkeypatch.setenv("MINERU_API_JOB_TTL", "30")
+    job_queue = JobQueue.from_env(parse_pages(0))
+    assert (job_queue.max_queued, job_queue.num_workers, job_queue.job_ttl) == (4, 2, 30)
@@ -85,7 +85,8 @@ if __name__ == '__main__':
         entry_points={
             "console_scripts": [
                 "magic-pdf = magic_pdf.tools.cli:cli",
-                "magic-pdf-dev = magic_pdf.tools.cli_dev:cli" 
+                "magic-pdf-dev = magic_pdf.tools.cli_dev:cli",
+                "magic-pdf-server = magic_pdf.tools.model_server:cli",
             ],
         },  # 项目提供的可执行命令
         include_package_data=True,  # 是否包含非代码文件，如数据文件、配置文件等
@@ -0,0 +1,19 @@
+import pytest
+import torch
+
+from magic_pdf.pdf_parse_union_core_v2 import ModelSingleton
+
+
+@pytest.fixture
+def layoutreader(monkeypatch):
+    """A tiny randomly initialized layoutreader."""
+    from transformers import LayoutLMv3Config, LayoutLMv3ForTokenClassification
+
+    torch.manual_seed(0)
+    config = LayoutLMv3Config(
+        vocab_size=10, hidden_size=32, num_hidden_layers=2, num_attention_heads=2, intermediate_size=64,
+        coordinate_size=4, shape_size=8, num_labels=510, max_position_embeddings=514, visual_embed=False,
+    )
+    model = LayoutLMv3ForTokenClassification(config).eval()
+    monkeypatch.setitem(ModelSingleton._models, 'layoutreader', model)
+    return model
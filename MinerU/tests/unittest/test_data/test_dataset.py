@@ -16,3 +16,58 @@ def test_imagedataset():
     datasets = ImageDataset(bits)
     assert len(datasets) == 1
     assert datasets.get_page(0).get_page_info().w > 100
+
+
+def test_pymudataset_classify_sampled(monkeypatch):
+    import fitz
+
+    import magic_pdf.filter as pdf_filter
+    from magic_pdf.config.enums import SupportedPdfParseMethod
+
+    with open('tests/unittest/test_data/assets/pdfs/test_01.pdf', 'rb') as f:
+        bits = f.read()
+    assert PymuDocDataset(bits).classify() == pdf_filter.classify_by_meta_scan(bits)
+
+    # a scanned book: the text of the sampled pages decides, the cached result is reused
+    doc = fitz.open()
+    for _ in range(300):
+        page = doc.new_page()
+        page.insert_text((50, 50), 'p')
+    bits = doc.tobytes()
+    doc = fitz.open('pdf', bits)
+    read_pages = []
+    get_text = fitz.Page.get_text
+
+    def spy_get_text(page, *args, **kwargs):
+        read_pages.append(page.number)
+        return get_text(page, *args, **kwargs)
+
+    monkeypatch.setattr(fitz.Page, 'get_text', spy_get_text)
+    assert pdf_filter.classify(bits, doc) == SupportedPdfParseMethod.OCR
+    assert 50 <= len(read_pages) < 100 and max(read_pages) == 299
+    assert pdf_filter.classify(bits, doc) == SupportedPdfParseMethod.OCR
+    assert 50 <= len(read_pages) < 100
+
+
+def test_pymudataset_shares_text_pages(monkeypatch):
+    import fitz
+
+    with open('tests/unittest/test_data/assets/pdfs/test_01.pdf', 'rb') as f:
+        bits = f.read()
+    datasets = PymuDocDataset(bits)
+    page = datasets.get_page(0)
+    expected = [page.get_doc().get_text(option, flags=fitz.TEXTFLAGS_TEXT) for option in ('text', 'rawdict', 'dict')]
+
+    extracted = []
+    get_textpage = fitz.Page.get_textpage
+
+    def spy_get_textpage(page, *args, **kwargs):
+        extracted.append(page.number)
+        return get_textpage(page, *args, **kwargs)
+
+    monkeypatch.setattr(fitz.Page, 'get_textpage', spy_get_textpage)
+    # the classification and the span extraction read the same text page
+    assert page.get_text('text') == expected[0]
+    assert page.get_text('rawdict', flags=fitz.TEXTFLAGS_TEXT) == expected[1]
+    assert page.get_text('dict', flags=fitz.TEXTFLAGS_TEXT) == expected[2]
+    assert extracted == [0]
@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+
+from magic_pdf.data.dataset import PymuDocDataset
+from magic_pdf.data.page_image_store import PageImageStore
+
+
+def _img_dict(value):
+    img = np.full((1024, 1024), value, dtype=np.uint8)
+    return {'img': img, 'width': 1024, 'height': 1024}
+
+
+def test_page_image_store_lru_eviction():
+    store = PageImageStore(max_memory_mb=2)
+    render_count = {'n': 0}
+
+    def render(value):
+        def _render():
+            render_count['n'] += 1
+            return _img_dict(value)
+        return _render
+
+    for page_id in range(3):
+        store.get(page_id, render(page_id))
+    assert render_count['n'] == 3
+    assert store.memory_bytes <= 2 * 1024 * 1024
+    assert 0 not in store
+    assert 2 in store
+
+    # page 0 was evicted, so it is rendered again
+    assert store.get(0, render(0))['img'][0, 0] == 0
+    assert render_count['n'] == 4
+
+
+def test_page_image_store_spill(tmp_path):
+    store = PageImageStore(max_memory_mb=1, spill_dir=str(tmp_path))
+    for page_id in range(3):
+        store.put(page_id, _img_dict(page_id))
+
+    assert 0 in store
+    spilled = store.get(0, lambda: (_ for _ in ()).throw(AssertionError('spilled page must not be rendered')))
+    assert isinstance(spilled['img'], np.memmap)
+    assert spilled['img'][0, 0] == 0
+    assert spilled['width'] == 1024 and spilled['height'] == 1024
+
+    store.clear()
+    assert 0 not in store
+    assert os.listdir(tmp_path) == []
+
+
+def test_pymudataset_image_budget(monkeypatch):
+    monkeypatch.setenv('MINERU_PAGE_IMAGE_CACHE_MB', '1')
+    with open('tests/unittest/test_model/assets/test_02.pdf', 'rb') as f:
+        bits = f.read()
+    datasets = PymuDocDataset(bits)
+    assert len(datasets) > 1
+
+    first = datasets.get_page(0).get_image()
+    for page in datasets:
+        page.get_image()
+    again = datasets.get_page(0).get_image()
+    assert np.array_equal(first['img'], again['img'])
+    assert datasets._image_store.memory_bytes == again['img'].nbytes
@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pytest
+
+from magic_pdf.data import utils as data_utils
+from magic_pdf.data.batch_build_dataset import batch_build_dataset
+from magic_pdf.data.dataset import PymuDocDataset
+from magic_pdf.data.utils import parallel_render_pages, partition_array_greedy
+
+
+def test_partition_array_greedy():
+    partitions = partition_array_greedy([('a', 8), ('b', 8), ('c', 4), ('d', 4)], 2)
+    assert sorted(sorted(p) for p in partitions) == [[0, 2], [1, 3]]
+
+
+def test_parallel_render_pages():
+    with open('tests/unittest/test_model/assets/test_02.pdf', 'rb') as f:
+        bits_02 = f.read()
+    with open('tests/unittest/test_data/assets/pdfs/test_01.pdf', 'rb') as f:
+        bits_01 = f.read()
+
+    page_ids_list = [[0, 3, 5, 12], [0]]
+    serial = parallel_render_pages([bits_02, bits_01], page_ids_list, num_workers=1)
+    parallel = parallel_render_pages([bits_02, bits_01], page_ids_list, num_workers=2, pages_per_job=1)
+
+    assert [len(images) for images in parallel] == [4, 1]
+    for serial_images, parallel_images in zip(serial, parallel):
+        for a, b in zip(serial_images, parallel_images):
+            assert (a['width'], a['height']) == (b['width'], b['height'])
+            assert np.array_equal(a['img'], b['img'])
+
+    dataset = PymuDocDataset(bits_02)
+    assert np.array_equal(dataset.get_page(3).get_image()['img'], parallel[0][1]['img'])
+
+
+def test_batch_build_dataset_parallel():
+    pdf_paths = ['tests/unittest/test_model/assets/test_02.pdf', 'tests/unittest/test_data/assets/pdfs/test_01.pdf']
+    datasets = batch_build_dataset(pdf_paths, 2)
+    assert len(datasets) == 2
+    assert all(page.has_image() for dataset in datasets for page in dataset)
+
+
+def test_parallel_set_images_bounded_store(monkeypatch):
+    with open('tests/unittest/test_model/assets/test_02.pdf', 'rb') as f:
+        bits_02 = f.read()
+    page_bytes = PymuDocDataset(bits_02).get_page(0).get_image()['img'].nbytes
+    # room for 4 pages, the windows are 2 pages
+    monkeypatch.setenv('MINERU_PAGE_IMAGE_CACHE_MB', str(4.5 * page_bytes / 1024 / 1024))
+    dataset = PymuDocDataset(bits_02)
+
+    rendered = []
+    orig_parallel_render_pages = data_utils.parallel_render_pages
+
+    def parallel_render_pages(pdf_bytes_list, page_ids_list=None, **kwargs):
+        rendered.append([list(page_ids) for page_ids in page_ids_list])
+        return orig_parallel_render_pages(pdf_bytes_list, page_ids_list, **kwargs)
+
+    monkeypatch.setattr(data_utils, 'parallel_render_pages', parallel_render_pages)
+    data_utils.parallel_set_images([dataset], num_workers=2, pages_per_job=1)
+
+    # the pages are stored window by window, the rendering stops before the store has to drop a page
+    assert rendered == [[[0, 1]], [[2, 3]]]
+    assert [page.has_image() for page in dataset][:5] == [True, True, True, True, False]
+    assert dataset._image_store.memory_bytes == 4 * page_bytes
+
+
+def test_parallel_render_pages_releases_shared_memory_on_failure():
+    if not os.path.isdir('/dev/shm') or not data_utils._SHARED_MEMORY_HANDOFF:
+        pytest.skip('no shared memory handoff')
+    with open('tests/unittest/test_model/assets/test_02.pdf', 'rb') as f:
+        bits_02 = f.read()
+
+    before = set(os.listdir('/dev/shm'))
+    # the worker renders pages 0 and 1 of the job before failing on the missing page
+    with pytest.raises(Exception):
+        parallel_render_pages([bits_02, bits_02], [[0, 1, 999], [2, 3]], num_workers=2)
+    assert set(os.listdir('/dev/shm')) - before == set()
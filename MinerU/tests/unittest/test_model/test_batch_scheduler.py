@@ -0,0 +1,121 @@
+import copy
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from magic_pdf.model.batch_analyze import BatchAnalyze
+from magic_pdf.model.batch_scheduler import ContinuousBatchScheduler
+
+
+class FakeBatchAnalyze(BatchAnalyze):
+    """BatchAnalyze with the models replaced by functions of the page image."""
+
+    def __init__(self):
+        super().__init__(None, 1, False, None, None, None)
+        self.calls = []
+
+    @property
+    def model(self):
+        return SimpleNamespace(apply_formula=True, apply_table=True)
+
+    def layout_batch_size(self):
+        return 4
+
+    def mfd_batch_size(self):
+        return 4
+
+    def layout_predict(self, images, batch_size=1):
+        self.calls.append(('layout', len(images)))
+        return [[{'category_id': 1, 'page': int(image[0, 0])}] for image in images]
+
+    def mfd_predict(self, images, batch_size=1):
+        self.calls.append(('mfd', len(images)))
+        return [SimpleNamespace(boxes=[None] * (int(image[0, 0]) % 3)) for image in images]
+
+    def mfr_predict(self, images_mfd_res, images, batch_size=None):
+        self.calls.append(('mfr', sum(len(mfd_res.boxes) for mfd_res in images_mfd_res)))
+        return [[{'category_id': 14, 'latex': f'{int(image[0, 0])}_{i}'} for i in range(len(mfd_res.boxes))]
+                for mfd_res, image in zip(images_mfd_res, images)]
+
+    @staticmethod
+    def get_ocr_and_table_res(layout_res, np_array_img, ocr_enable, _lang):
+        page = int(np_array_img[0, 0])
+        table_res = {'category_id': 5, 'page': page}
+        layout_res.append(table_res)
+        ocr_res_list_dict = {'page': page, 'lang': _lang, 'layout_res': layout_res}
+        return ocr_res_list_dict, [{'table_res': table_res}] if page % 2 else []
+
+    @staticmethod
+    def ocr_det_predict(ocr_res_list_dicts):
+        for ocr_res_list_dict in ocr_res_list_dicts:
+            for i in range(ocr_res_list_dict['page'] % 4):
+                ocr_res_list_dict['layout_res'].append(
+                    {'category_id': 15, 'np_img': ocr_res_list_dict['page'] * 10 + i, 'lang': ocr_res_list_dict['lang']}
+                )
+
+    @staticmethod
+    def table_predict(table_res_dict):
+        table_res_dict['table_res']['html'] = f"<table>{table_res_dict['table_res']['page']}</table>"
+
+    @staticmethod
+    def ocr_rec_predict(need_ocr_list, lang, tqdm_enable=False):
+        for layout_res_item in need_ocr_list:
+            layout_res_item['text'] = f"{lang}_{layout_res_item.pop('np_img')}"
+            layout_res_item.pop('lang')
+
+
+def _pages(start, num, lang):
+    return [(np.full((4, 4), page, dtype=np.uint8), True, lang) for page in range(start, start + num)]
+
+
+@pytest.mark.parametrize('max_wait', [0, 0.2])
+def test_continuous_batching_matches_batch_analyze(max_wait):
+    docs = [_pages(0, 7, 'en'), _pages(7, 3, 'ch'), _pages(10, 12, 'en')]
+    expected = [FakeBatchAnalyze()(copy.deepcopy(doc)) for doc in docs]
+
+    batch_analyze = FakeBatchAnalyze()
+    scheduler = ContinuousBatchScheduler(batch_analyze, max_wait=max_wait)
+    scheduler.batch_sizes.update({'mfr': 5, 'ocr_rec': 6})
+    with ThreadPoolExecutor(len(docs)) as executor:
+        futures = list(executor.map(scheduler.submit, docs))
+    results = [future.result(timeout=30) for future in futures]
+
+    assert results == expected
+    for stage, size in batch_analyze.calls:
+        if stage in ['layout', 'mfd']:
+            assert size <= 4
+    assert scheduler.submit([]).result(timeout=30) == []
+
+
+def test_continuous_batching_failure():
+    class FailingBatchAnalyze(FakeBatchAnalyze):
+        def table_predict(self, table_res_dict):
+            raise RuntimeError('table model failed')
+
+    scheduler = ContinuousBatchScheduler(FailingBatchAnalyze(), max_wait=0)
+    with pytest.raises(RuntimeError):
+        scheduler.submit(_pages(1, 2, 'en')).result(timeout=30)
+    # documents without tables are not affected
+    assert len(scheduler.submit(_pages(2, 1, 'en')).result(timeout=30)) == 1
+
+
+def test_continuous_batching_waits_for_a_full_batch():
+    batch_analyze = FakeBatchAnalyze()
+    scheduler = ContinuousBatchScheduler(batch_analyze, max_wait=30)
+    # pages trickling in join the same layout batch
+    futures = []
+    for page in range(4):
+        futures.append(scheduler.submit(_pages(page, 1, 'en')))
+        time.sleep(0.05)
+    assert [len(future.result(timeout=30)) for future in futures] == [1, 1, 1, 1]
+    assert [size for stage, size in batch_analyze.calls if stage == 'layout'] == [4]
+
+    # a partial batch runs once its oldest page waited max_wait
+    scheduler.max_wait = 0.2
+    begin = time.time()
+    assert len(scheduler.submit(_pages(5, 2, 'en')).result(timeout=30)) == 2
+    assert time.time() - begin >= 0.2
+    assert [size for stage, size in batch_analyze.calls if stage == 'layout'] == [4, 2]
@@ -0,0 +1,80 @@
+import pytest
+import torch
+
+from magic_pdf.model.sub_modules.batch_size_tuner import (
+    BatchSizeTuner, batch_predict_with_oom_fallback)
+
+
+def test_batch_predict_with_oom_fallback():
+    batch_sizes = []
+
+    def predict(images):
+        batch_sizes.append(len(images))
+        if len(images) > 3:
+            raise torch.cuda.OutOfMemoryError('CUDA out of memory')
+        return [image * 2 for image in images]
+
+    results, batch_size = batch_predict_with_oom_fallback(predict, list(range(10)), 16)
+    assert results == [image * 2 for image in range(10)]
+    assert batch_size == 2
+    assert batch_sizes == [10, 8, 4, 2, 2, 2, 2, 2]
+
+    def broken(images):
+        raise ValueError('not an oom')
+
+    with pytest.raises(ValueError):
+        batch_predict_with_oom_fallback(broken, list(range(4)), 4)
+
+
+class FakeDeviceTuner(BatchSizeTuner):
+    """Every image of a batch reserves 10% of the device memory."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.peak = 0
+
+    def get_device_name(self, device):
+        return None if device == 'cpu' else 'FakeGPU_24GB'
+
+    def get_peak_memory_fraction(self, device):
+        return self.peak
+
+    def reset_peak_memory(self, device):
+        self.peak = 0
+
+
+def test_batch_size_tuner_probe_and_cache(tmp_path):
+    cache_path = str(tmp_path / 'batch_size.json')
+    tuner = FakeDeviceTuner(cache_path=cache_path, max_batch_size=64, memory_fraction=0.6)
+    probed = []
+
+    def probe(batch_size):
+        probed.append(batch_size)
+        tuner.peak = 0.1 * batch_size
+
+    assert tuner.get('doclayout_yolo', 'cpu', probe, 1) == 1
+    assert probed == []
+
+    # 8 images reserve 80% > 60%
+    assert tuner.get('doclayout_yolo', 'cuda:0', probe, 1) == 4
+    assert probed == [1, 2, 4, 8]
+
+    # a new process reads the probed batch size from the cache
+    tuner = FakeDeviceTuner(cache_path=cache_path, max_batch_size=64, memory_fraction=0.6)
+    assert tuner.get('doclayout_yolo', 'cuda:0', probe, 1) == 4
+    assert probed == [1, 2, 4, 8]
+
+    tuner.update('doclayout_yolo', 'cuda:0', 2)
+    tuner.update('doclayout_yolo', 'cuda:0', 3)
+    tuner = FakeDeviceTuner(cache_path=cache_path, max_batch_size=64, memory_fraction=0.6)
+    assert tuner.get('doclayout_yolo', 'cuda:0', probe, 1) == 2
+
+
+def test_batch_size_tuner_probe_oom(tmp_path):
+    tuner = FakeDeviceTuner(cache_path=str(tmp_path / 'batch_size.json'), max_batch_size=64, memory_fraction=1.0)
+
+    def probe(batch_size):
+        if batch_size > 16:
+            raise RuntimeError('CUDA out of memory. Tried to allocate 2.00 GiB')
+
+    assert tuner.get('yolo_v8_mfd', 'cuda:0', probe, 1) == 16
@@ -0,0 +1,83 @@
+import copy
+import json
+
+import pytest
+
+import magic_pdf.model.doc_analyze_by_custom_model as doc_analyze_module
+from magic_pdf.config.enums import SupportedPdfParseMethod
+from magic_pdf.data.data_reader_writer import FileBasedDataWriter
+from magic_pdf.data.read_api import read_local_pdfs
+from magic_pdf.data.utils import fitz_doc_to_image
+from magic_pdf.libs.hash_utils import compute_md5
+
+PDF_PATH = 'tests/unittest/test_model/assets/test_02.pdf'
+MODEL_JSON_PATH = 'tests/unittest/test_model/assets/test_02.model.json'
+
+
+@pytest.fixture
+def analyzed_pages(monkeypatch):
+    """Stub the models with the recorded results of test_02.pdf, the pages are recognized by their image.
+
+    Returns:
+        list: the page images, in the order they were inferred
+    """
+    dataset = read_local_pdfs(PDF_PATH)[0]
+    with open(MODEL_JSON_PATH) as f:
+        model_list = json.load(f)
+    page_by_image = {
+        compute_md5(fitz_doc_to_image(dataset.get_page(page_id).get_doc())['img'].tobytes()): page_id
+        for page_id in range(len(dataset))
+    }
+
+    inferred = []
+
+    def may_batch_image_analyze(images_with_extra_info, ocr, show_log=False, layout_model=None,
+                                formula_enable=None, table_enable=None):
+        page_ids = [page_by_image[compute_md5(image.tobytes())] for image, _, _ in images_with_extra_info]
+        inferred.append(page_ids)
+        return [copy.deepcopy(model_list[page_id]['layout_dets']) for page_id in page_ids]
+
+    monkeypatch.setattr(doc_analyze_module, 'may_batch_image_analyze', may_batch_image_analyze)
+    for name in ['MINERU_PAGE_CACHE_DIR', 'MINERU_CONTINUOUS_BATCHING', 'MINERU_RENDER_WORKER_NUM']:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('MINERU_STREAMING_WINDOW_SIZE', '1')
+    monkeypatch.setenv('MINERU_STREAMING_MAX_INFLIGHT_WINDOWS', '2')
+    return inferred
+
+
+def test_iter_doc_analyze_matches_doc_analyze(analyzed_pages):
+    expected = doc_analyze_module.doc_analyze(
+        read_local_pdfs(PDF_PATH)[0], start_page_id=1, end_page_id=6,
+    ).get_infer_res()
+    assert analyzed_pages == [list(range(1, 7))]
+
+    analyzed_pages.clear()
+    windows = list(doc_analyze_module.iter_doc_analyze(read_local_pdfs(PDF_PATH)[0], start_page_id=1, end_page_id=6))
+    assert analyzed_pages == [[page_id] for page_id in range(1, 7)]
+    assert [[page_dict['page_info']['page_no'] for page_dict in window] for window in windows] == analyzed_pages
+    assert [page_dict for window in windows for page_dict in window] == expected[1:7]
+
+
+@pytest.mark.parametrize('parse_mode', [SupportedPdfParseMethod.TXT, SupportedPdfParseMethod.OCR])
+def test_doc_analyze_streaming_matches_doc_analyze(parse_mode, analyzed_pages, layoutreader, tmp_path):
+    ocr = parse_mode == SupportedPdfParseMethod.OCR
+
+    infer_result = doc_analyze_module.doc_analyze(
+        read_local_pdfs(PDF_PATH)[0], ocr=ocr, start_page_id=1, end_page_id=6,
+    )
+    pipe = infer_result.pipe_ocr_mode if ocr else infer_result.pipe_txt_mode
+    pipe_result = pipe(FileBasedDataWriter(str(tmp_path / 'batch')), start_page_id=1, end_page_id=6)
+
+    windows = []
+    streaming_infer_result, streaming_pipe_result = doc_analyze_module.doc_analyze_streaming(
+        read_local_pdfs(PDF_PATH)[0], FileBasedDataWriter(str(tmp_path / 'streaming')), ocr=ocr,
+        start_page_id=1, end_page_id=6, on_window_parsed=lambda page_infos: windows.append(sorted(page_infos)),
+    )
+
+    assert windows == [[page_id] for page_id in range(1, 7)]
+    assert streaming_infer_result.get_infer_res() == infer_result.get_infer_res()
+    assert streaming_pipe_result._pipe_res == pipe_result._pipe_res
+    # the pages out of the range are skipped the same way
+    assert len(streaming_pipe_result._pipe_res['pdf_info']) == len(streaming_infer_result.get_infer_res())
+    assert sorted(path.name for path in (tmp_path / 'streaming').iterdir()) == \
+        sorted(path.name for path in (tmp_path / 'batch').iterdir())
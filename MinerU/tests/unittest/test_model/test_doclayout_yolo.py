@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+from magic_pdf.model.sub_modules.language_detection.utils import get_text_images
+from magic_pdf.model.sub_modules.layout.doclayout_yolo import DocLayoutYOLO
+
+
+class FakeResult:
+    def __init__(self, image):
+        self.boxes = SimpleNamespace(xyxy=torch.tensor([[0, 0, image.shape[1], image.shape[0]]]),
+                                     conf=torch.tensor([0.9]), cls=torch.tensor([1]))
+
+    def cpu(self):
+        return self
+
+
+class FakeYOLO:
+    """Finds one text block as large as the image."""
+
+    def __init__(self, weight):
+        self.predicted = 0
+
+    def predict(self, images, **kwargs):
+        images = images if isinstance(images, list) else [images]
+        self.predicted += len(images)
+        return [FakeResult(image) for image in images]
+
+
+def test_batch_predict_reuses_single_predictions(monkeypatch):
+    monkeypatch.setattr(DocLayoutYOLO, 'YOLOv10', FakeYOLO)
+    model = DocLayoutYOLO.DocLayoutYOLOModel('weight', 'cpu')
+    images = [np.zeros((200, 150, 3), dtype=np.uint8) for _ in range(3)]
+
+    # a plain predict is not kept
+    model.predict(images[0])
+    assert model.model.predicted == 1 and not model._predicted
+
+    # the language detection predicts a sampled page
+    sampled = model.predict(images[1], remember=True)
+    assert model.model.predicted == 2
+    assert get_text_images([{'img': images[1]}], [sampled])[0].shape == (200, 150, 3)
+
+    # doc_analyze only runs the other pages, the remembered result is given out once
+    images_layout_res = model.batch_predict(images, 4)
+    assert model.model.predicted == 4
+    assert images_layout_res[1] == sampled and images_layout_res[1] is not sampled
+    model.batch_predict(images, 4)
+    assert model.model.predicted == 7
+
+    # the result of an image no longer alive is not reused
+    model.predict(np.zeros((10, 10, 3), dtype=np.uint8), remember=True)
+    model.batch_predict([np.ones((10, 10, 3), dtype=np.uint8)], 4)
+    assert model.model.predicted == 9
+    assert not model._predicted
+
+    # nor in a batch of images of different shapes, which is letterboxed differently
+    model.predict(images[2], remember=True)
+    model.batch_predict([images[2], np.zeros((100, 150, 3), dtype=np.uint8)], 4)
+    assert model.model.predicted == 12
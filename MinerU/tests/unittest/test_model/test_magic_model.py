@@ -1,6 +1,11 @@
+import copy
 import json
+import random
+
+import pytest
 
 from magic_pdf.data.read_api import read_local_pdfs
+from magic_pdf.libs.boxbase import calculate_iou
 from magic_pdf.model.magic_model import MagicModel
 
 
@@ -29,3 +34,61 @@ def test_magic_model_table_v2():
 
     tables = magic_model.get_tables_v2(8)
     print(tables)
+
+
+def _remove_high_iou_and_low_confidence_pairwise(layout_dets):
+    need_remove_list = []
+    for layout_det1 in layout_dets:
+        for layout_det2 in layout_dets:
+            if layout_det1 == layout_det2:
+                continue
+            if layout_det1['category_id'] in range(10) and layout_det2['category_id'] in range(10):
+                if calculate_iou(layout_det1['bbox'], layout_det2['bbox']) > 0.9:
+                    if layout_det1['score'] < layout_det2['score']:
+                        layout_det_need_remove = layout_det1
+                    else:
+                        layout_det_need_remove = layout_det2
+                    if layout_det_need_remove not in need_remove_list:
+                        need_remove_list.append(layout_det_need_remove)
+    for need_remove in need_remove_list:
+        layout_dets.remove(need_remove)
+    return layout_dets
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_magic_model_remove_high_iou_and_low_confidence(seed):
+    rng = random.Random(seed)
+    layout_dets = []
+    for _ in range(150):
+        x0, y0 = rng.randint(0, 50), rng.randint(0, 50)
+        layout_dets.append({
+            'category_id': rng.choice([0, 1, 3, 5, 13, 15]),
+            'bbox': [x0, y0, x0 + rng.randint(40, 44), y0 + rng.randint(40, 44)],
+            'score': rng.choice([0.3, 0.5, 0.9]),
+        })
+    # exact duplicates and boxes with the same score
+    layout_dets += copy.deepcopy(layout_dets[:10])
+    rng.shuffle(layout_dets)
+    expected = _remove_high_iou_and_low_confidence_pairwise(copy.deepcopy(layout_dets))
+
+    magic_model = MagicModel.__new__(MagicModel)
+    magic_model._MagicModel__model_list = [{'layout_dets': layout_dets}]
+    magic_model._MagicModel__fix_by_remove_high_iou_and_low_confidence()
+    assert layout_dets == expected
+    assert 0 < len(expected) < 160
+
+
+def test_magic_model_remove_duplicate_spans():
+    layout_dets = [
+        {'category_id': 15, 'bbox': [0, 0, 10, 10], 'score': 0.9, 'text': 'a'},
+        {'category_id': 15, 'bbox': [0, 0, 10, 10], 'score': 0.9, 'text': 'b'},
+        {'category_id': 15, 'bbox': [0, 0, 10, 10], 'score': 0.9, 'text': 'a'},
+        {'category_id': 13, 'bbox': [0, 0, 10, 10], 'score': 0.9, 'latex': 'a'},
+        {'category_id': 15, 'bbox': [0, 0, 10, 12], 'score': 0.9, 'text': 'a'},
+    ]
+    magic_model = MagicModel.__new__(MagicModel)
+    magic_model._MagicModel__model_list = [{'layout_dets': layout_dets}]
+    spans = magic_model.get_all_spans(0)
+    assert [(span['bbox'][3], span['content'], span['type']) for span in spans] == [
+        (10, 'a', 'text'), (10, 'b', 'text'), (10, 'a', 'inline_equation'), (12, 'a', 'text')
+    ]
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+
+from magic_pdf.model.sub_modules.mfr.mfr_cache import MFRCache
+from magic_pdf.model.sub_modules.mfr.unimernet.Unimernet import UnimernetModel
+
+
+def test_mfr_cache_memory_lru():
+    cache = MFRCache(max_items=2)
+    cache.put_many({'a': 'x', 'b': 'y'})
+    assert cache.get_many(['a']) == {'a': 'x'}
+    cache.put_many({'c': 'z'})
+    # b is the least recently used
+    assert cache.get_many(['a', 'b', 'c']) == {'a': 'x', 'c': 'z'}
+
+    assert MFRCache(max_items=0).get_many(['a']) == {}
+
+
+def test_mfr_cache_disk(tmp_path):
+    cache = MFRCache(namespace='m', max_items=10, disk_dir=str(tmp_path), disk_max_items=2)
+    key = cache.make_key(torch.ones(1, 4, 4))
+    assert key == MFRCache(namespace='m').make_key(torch.ones(1, 4, 4))
+    assert key != MFRCache(namespace='other').make_key(torch.ones(1, 4, 4))
+    assert key != cache.make_key(torch.zeros(1, 4, 4))
+
+    cache.put_many({key: 'x^2'})
+    cache.put_many({'k2': 'a'})
+    cache.put_many({'k3': 'b'})
+    # a new process only sees the disk cache, the oldest entry was evicted
+    cache = MFRCache(namespace='m', max_items=10, disk_dir=str(tmp_path), disk_max_items=2)
+    assert cache.get_many([key, 'k2', 'k3']) == {'k2': 'a', 'k3': 'b'}
+
+
+class FakeUnimernet:
+    dtype = torch.float32
+
+    def __init__(self):
+        self.decoded = 0
+
+    @staticmethod
+    def transform(img):
+        return torch.from_numpy(img[:, :, :1].transpose(2, 0, 1).astype(np.float32))
+
+    def generate(self, batch):
+        image = batch['image']
+        self.decoded += image.shape[0]
+        return {'fixed_str': [f'x_{{{int(img.sum())}}}' for img in image]}
+
+    def generate_continuous(self, num_images, load_fn, batch_size=64, on_finished=None):
+        fixed_str = []
+        for index in range(0, num_images, batch_size):
+            fixed_str += self.generate({'image': load_fn(list(range(index, min(index + batch_size, num_images))))})['fixed_str']
+        return {'fixed_str': fixed_str}
+
+
+def _mfd_res(boxes):
+    boxes = torch.tensor(boxes, dtype=torch.float32)
+    return SimpleNamespace(boxes=SimpleNamespace(
+        xyxy=boxes, conf=torch.ones(len(boxes)), cls=torch.zeros(len(boxes))
+    ))
+
+
+@pytest.mark.parametrize('continuous_decoding', [True, False])
+def test_unimernet_batch_predict_cache(continuous_decoding):
+    model = UnimernetModel.__new__(UnimernetModel)
+    model.model = FakeUnimernet()
+    model.device = 'cpu'
+    model.continuous_decoding = continuous_decoding
+    model.cache = MFRCache(namespace='fake', max_items=100)
+
+    image = np.zeros((40, 40, 3), dtype=np.uint8)
+    image[0:10, 0:10] = 1
+    image[20:30, 20:30] = 1
+    image[0:10, 20:30] = 2
+    # the first two crops are the same formula
+    mfd_res = _mfd_res([[0, 0, 10, 10], [20, 20, 30, 30], [20, 0, 30, 10]])
+
+    formula_list = model.batch_predict([mfd_res], [image], batch_size=2)[0]
+    assert [item['latex'] for item in formula_list] == ['x_{100}', 'x_{100}', 'x_{200}']
+    assert model.model.decoded == 2
+
+    formula_list = model.batch_predict([mfd_res, mfd_res], [image, image], batch_size=2)
+    assert [item['latex'] for item in formula_list[1]] == ['x_{100}', 'x_{100}', 'x_{200}']
+    assert model.model.decoded == 2
@@ -0,0 +1,86 @@
+import pytest
+import torch
+
+unimer_mbart = pytest.importorskip(
+    'magic_pdf.model.sub_modules.mfr.unimernet.unimernet_hf.unimer_mbart', exc_type=ImportError
+)
+
+
+def _decoder(attn_implementation):
+    torch.manual_seed(0)
+    config = unimer_mbart.UnimerMBartConfig(
+        vocab_size=13, max_position_embeddings=80, d_model=32, decoder_layers=2, decoder_ffn_dim=64,
+        decoder_attention_heads=4, qk_squeeze=2, dropout=0.0,
+    )
+    config._attn_implementation = attn_implementation
+    return unimer_mbart.UnimerMBartForCausalLM(config).eval()
+
+
+@torch.no_grad()
+def _greedy(decoder, encoder_hidden_states, eos_token_id, max_new_tokens):
+    """Decode one sequence without cache."""
+    tokens = [0]
+    while len(tokens) <= max_new_tokens:
+        logits = decoder(
+            input_ids=torch.tensor([tokens]), encoder_hidden_states=encoder_hidden_states[None], use_cache=False,
+        ).logits
+        tokens.append(int(logits[0, -1].argmax()))
+        if tokens[-1] == eos_token_id:
+            break
+    return tokens[1:]
+
+
+@pytest.mark.parametrize('attn_implementation', ['eager', 'sdpa'])
+def test_continuous_decoding_matches_greedy(attn_implementation):
+    decoder = _decoder(attn_implementation)
+    torch.manual_seed(1)
+    encoder_hidden_states = torch.randn(11, 6, 32) * 10
+
+    lengths = set()
+    for eos_token_id in range(1, 13):
+        expected = [_greedy(decoder, states, eos_token_id, 70) for states in encoder_hidden_states]
+        lengths.update(len(tokens) for tokens in expected)
+
+        encoded = []
+        continuous_decoder = unimer_mbart.UnimerMBartContinuousDecoder(
+            decoder, bos_token_id=0, eos_token_id=eos_token_id, max_new_tokens=70, max_batch_size=3,
+        )
+
+        def encode_fn(indices):
+            encoded.append(indices)
+            return encoder_hidden_states[indices]
+
+        assert continuous_decoder.decode(len(encoder_hidden_states), encode_fn) == expected
+        # every sequence is encoded once, in order
+        assert sum(encoded, []) == list(range(len(encoder_hidden_states)))
+        assert continuous_decoder.last_stats['tokens'] == sum(len(tokens) for tokens in expected)
+    # the slots were refilled with sequences of different lengths, some longer than the first cache capacity
+    assert len(lengths) > 5 and max(lengths) > 32
+
+
+def test_continuous_decoding_forced_eos():
+    decoder = _decoder('eager')
+    encoder_hidden_states = torch.randn(4, 6, 32)
+    continuous_decoder = unimer_mbart.UnimerMBartContinuousDecoder(
+        decoder, bos_token_id=0, eos_token_id=-1, max_new_tokens=5, max_batch_size=2, forced_eos_token_id=12,
+    )
+    finished = []
+    results = continuous_decoder.decode(4, lambda indices: encoder_hidden_states[indices], finished.append)
+    assert [len(tokens) for tokens in results] == [5] * 4
+    assert all(tokens[-1] == 12 for tokens in results)
+    assert sum(finished) == 4
+    assert continuous_decoder.decode(0, lambda indices: encoder_hidden_states[indices]) == []
+
+
+def test_continuous_decoding_needs_greedy_generation_config():
+    from transformers import GenerationConfig
+
+    modeling_unimernet = pytest.importorskip(
+        'magic_pdf.model.sub_modules.mfr.unimernet.unimernet_hf.modeling_unimernet', exc_type=ImportError
+    )
+    assert modeling_unimernet.is_greedy_generation_config(None)
+    assert modeling_unimernet.is_greedy_generation_config(GenerationConfig(forced_eos_token_id=2, max_length=50))
+    assert not modeling_unimernet.is_greedy_generation_config(GenerationConfig(num_beams=4))
+    assert not modeling_unimernet.is_greedy_generation_config(GenerationConfig(repetition_penalty=1.2))
+    assert not modeling_unimernet.is_greedy_generation_config(GenerationConfig(do_sample=True))
+    assert not modeling_unimernet.is_greedy_generation_config(GenerationConfig(no_repeat_ngram_size=3))
@@ -0,0 +1,67 @@
+import numpy as np
+import torch
+
+from magic_pdf.model.sub_modules.ocr.paddleocr2pytorch.pytorchocr.base_ocr_v20 import \
+    BaseOCRV20
+from magic_pdf.model.sub_modules.ocr.paddleocr2pytorch.tools.infer import \
+    pytorchocr_utility as utility
+from magic_pdf.model.sub_modules.ocr.paddleocr2pytorch.tools.infer.predict_det import \
+    TextDetector
+
+
+def _random_text_detector(tmp_path, **kwargs):
+    # the architecture is looked up by the file name of the weights
+    weights_path = str(tmp_path / 'ch_PP-OCRv3_det_infer.pth')
+    torch.manual_seed(0)
+    net = BaseOCRV20(utility.get_arch_config(weights_path)).net
+    torch.save(net.state_dict(), weights_path)
+    args = utility.init_args().parse_args([])
+    args.det_model_path = weights_path
+    args.device = 'cpu'
+    args.det_db_box_thresh = 0.0
+    for key, value in kwargs.items():
+        setattr(args, key, value)
+    return TextDetector(args)
+
+
+def _page_crop(height, width, seed):
+    rng = np.random.default_rng(seed)
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    for _ in range(5):
+        y, x = rng.integers(0, height - 12), rng.integers(0, width - 80)
+        img[y:y + 12, x:x + 80] = 0
+    return img
+
+
+def test_text_detector_batch_call(tmp_path):
+    detector = _random_text_detector(tmp_path)
+    imgs = [_page_crop(200, 300, seed) for seed in range(5)] + [_page_crop(420, 180, 5)]
+
+    dt_boxes_list, _ = detector.batch_call(imgs, batch_size=4)
+    assert len(dt_boxes_list) == len(imgs)
+    for img, dt_boxes in zip(imgs, dt_boxes_list):
+        expected, _ = detector(img)
+        assert np.array_equal(dt_boxes, expected)
+
+
+def test_text_detector_batch_call_mixed_sizes(tmp_path):
+    detector = _random_text_detector(tmp_path)
+    # resized to 192x288, 224x320 and 224x288, and a second 192x288 crop
+    imgs = [_page_crop(200, 300, 0), _page_crop(230, 310, 1), _page_crop(215, 290, 2), _page_crop(200, 300, 3)]
+
+    assert sorted(detector._group_by_size([(192, 288), (224, 320), (224, 288), (192, 288)], 4)) == [[0, 3], [1], [2]]
+    dt_boxes_list, _ = detector.batch_call(imgs, batch_size=4)
+    for img, dt_boxes in zip(imgs, dt_boxes_list):
+        expected, _ = detector(img)
+        assert np.array_equal(dt_boxes, expected)
+
+
+def test_text_detector_group_by_size(tmp_path):
+    # padding the crops of similar size into one batch is opt-in
+    detector = _random_text_detector(tmp_path, det_max_pad_ratio=0.2)
+    sizes = [(64, 320), (960, 960), (64, 288), (64, 320), (96, 320)]
+    batches = detector._group_by_size(sizes, batch_size=2)
+    assert sorted(i for batch in batches for i in batch) == list(range(len(sizes)))
+    assert all(len(batch) <= 2 for batch in batches)
+    # the large crop is never padded together with the small ones
+    assert [1] in batches
@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+import torch
+
+from magic_pdf.model.sub_modules.ocr.paddleocr2pytorch.pytorchocr.base_ocr_v20 import \
+    BaseOCRV20
+from magic_pdf.model.sub_modules.ocr.paddleocr2pytorch.tools.infer import \
+    pytorchocr_utility as utility
+from magic_pdf.model.sub_modules.ocr.paddleocr2pytorch.tools.infer.predict_rec import \
+    TextRecognizer
+
+dict_path = os.path.join(
+    os.path.dirname(utility.__file__), '..', '..', 'pytorchocr', 'utils', 'resources', 'dict', 'en_dict.txt'
+)
+
+
+def _random_text_recognizer(tmp_path, **kwargs):
+    # the architecture is looked up by the file name of the weights
+    weights_path = str(tmp_path / 'en_PP-OCRv4_rec_infer.pth')
+    if not os.path.exists(weights_path):
+        with open(dict_path, encoding='utf-8') as f:
+            # blank + the characters + space
+            out_channels = len(f.readlines()) + 2
+        torch.manual_seed(0)
+        net = BaseOCRV20(utility.get_arch_config(weights_path), out_channels=out_channels).net
+        torch.save(net.state_dict(), weights_path)
+    args = utility.init_args().parse_args([])
+    args.rec_model_path = weights_path
+    args.rec_char_dict_path = dict_path
+    args.device = 'cpu'
+    for key, value in kwargs.items():
+        setattr(args, key, value)
+    return TextRecognizer(args)
+
+
+def _line_crops(widths=(320, 1280, 384, 320, 640, 1280, 384, 896, 320), seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (48, width, 3), dtype=np.uint8) for width in widths]
+
+
+def _assert_same_as_alone(recognizer, crops):
+    rec_res, _ = recognizer(crops)
+    for crop, res in zip(crops, rec_res):
+        expected, _ = recognizer([crop])
+        assert res[0] == expected[0][0]
+        assert abs(res[1] - expected[0][1]) < 1e-4
+
+
+def test_text_recognizer_bucketed_batches(tmp_path):
+    recognizer = _random_text_recognizer(tmp_path, rec_batch_width_budget=1280)
+    crops = _line_crops()
+
+    batches = recognizer.get_bucketed_batches(crops)
+    assert sorted(i for batch, _ in batches for i in batch) == list(range(len(crops)))
+    for batch, padded_width in batches:
+        assert len(batch) == 1 or len(batch) * padded_width <= 1280
+        assert {recognizer.get_padded_width(crops[i].shape[1] / crops[i].shape[0]) for i in batch} == {padded_width}
+    # short lines are batched together
+    assert ([0, 3, 8], 320) in batches
+    _assert_same_as_alone(recognizer, crops)
+
+
+def test_text_recognizer_bucketed_batches_any_width(tmp_path):
+    recognizer = _random_text_recognizer(tmp_path, rec_batch_width_budget=1280)
+    # the widths are not multiples of 64, crops share a batch only with the same padded width
+    crops = _line_crops((300, 350, 417, 530, 700, 1000, 333, 290, 610, 350, 150), seed=1)
+
+    batches = recognizer.get_bucketed_batches(crops)
+    assert ([10, 7, 0], 320) in batches and ([1, 9], 350) in batches
+    _assert_same_as_alone(recognizer, crops)
+
+
+def test_text_recognizer_padded_buckets(tmp_path):
+    # a larger step pads the crops up to the bucket width, the results may differ slightly from each crop alone
+    recognizer = _random_text_recognizer(tmp_path, rec_width_bucket=64, rec_batch_width_budget=1280)
+    crops = _line_crops((300, 350, 417, 530, 700, 1000, 333, 290, 610, 350, 150), seed=1)
+
+    batches = recognizer.get_bucketed_batches(crops)
+    assert ([10, 7, 0], 320) in batches and ([6, 1, 9], 384) in batches
+    rec_res, _ = recognizer(crops)
+    assert len(rec_res) == len(crops)
+
+
+def test_text_recognizer_bucketing_disabled(tmp_path):
+    recognizer = _random_text_recognizer(tmp_path, rec_width_bucket=0)
+    crops = _line_crops()
+    batches = recognizer.get_sorted_batches(crops)
+    assert [len(batch) for batch, _ in batches] == [6, 3]
+    rec_res, _ = recognizer(crops)
+    assert len(rec_res) == len(crops)
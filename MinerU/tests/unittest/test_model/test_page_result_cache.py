@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+import magic_pdf.model.doc_analyze_by_custom_model as doc_analyze_module
+from magic_pdf.data.dataset import PymuDocDataset
+from magic_pdf.model.page_result_cache import PageResultCache
+
+
+@pytest.fixture(autouse=True)
+def _use_inside_model(monkeypatch):
+    import magic_pdf.model as model_config
+    monkeypatch.setattr(model_config, '__use_inside_model__', True)
+
+
+class FakeInfer:
+    def __init__(self):
+        self.inferred = 0
+
+    def __call__(self, images_with_extra_info):
+        self.inferred += len(images_with_extra_info)
+        return [[{'category_id': 1, 'score': float(image.sum())}] for image, _, _ in images_with_extra_info]
+
+
+def _page(value):
+    return np.full((4, 4, 3), value, dtype=np.uint8)
+
+
+def test_page_result_cache(tmp_path):
+    cache = PageResultCache(str(tmp_path), max_items=10)
+    infer = FakeInfer()
+    pages = [(_page(1), False, 'ch'), (_page(2), False, 'ch'), (_page(1), False, 'ch')]
+
+    # the same page twice in a batch is inferred once
+    results = cache.analyze(pages, infer)
+    assert infer.inferred == 2
+    assert results == infer(pages)
+    assert results[0] is not results[2]
+
+    infer.inferred = 0
+    assert cache.analyze(pages, infer) == results
+    assert infer.inferred == 0
+
+    # the ocr results are cached apart
+    cache.analyze([(_page(1), True, 'ch')], infer)
+    assert infer.inferred == 1
+
+    assert cache.submit(pages, lambda imgs: pytest.fail('all the pages are cached')).result() == results
+    assert not PageResultCache().enabled
+
+
+def test_page_result_cache_eviction(tmp_path):
+    cache = PageResultCache(str(tmp_path), max_items=2)
+    infer = FakeInfer()
+    cache.analyze([(_page(1), False, 'ch')], infer)
+    cache.analyze([(_page(2), False, 'ch'), (_page(3), False, 'ch')], infer)
+    infer.inferred = 0
+    cache.analyze([(_page(1), False, 'ch')], infer)
+    assert infer.inferred == 1
+
+
+def test_doc_analyze_skips_cached_pages(monkeypatch, tmp_path):
+    with open('tests/unittest/test_model/assets/test_01.pdf', 'rb') as f:
+        pdf_bytes = f.read()
+    infer = FakeInfer()
+    monkeypatch.setattr(doc_analyze_module, 'may_batch_image_analyze',
+                        lambda images_with_extra_info, *args: infer(images_with_extra_info))
+    monkeypatch.setenv('MINERU_PAGE_CACHE_DIR', str(tmp_path))
+
+    first = doc_analyze_module.doc_analyze(PymuDocDataset(pdf_bytes), ocr=False).get_infer_res()
+    assert infer.inferred > 0
+    infer.inferred = 0
+    second = doc_analyze_module.doc_analyze(PymuDocDataset(pdf_bytes), ocr=False).get_infer_res()
+    assert infer.inferred == 0
+    assert second == first
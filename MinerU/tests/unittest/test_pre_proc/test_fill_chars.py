@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from magic_pdf.pdf_parse_union_core_v2 import (LINE_START_FLAG, LINE_STOP_FLAG, assign_chars_to_spans,
+                                               calculate_char_in_span, chars_to_content, fill_char_in_spans)
+
+
+def _page(seed, num_spans=40, num_chars=3000):
+    rng = random.Random(seed)
+    spans = []
+    for _ in range(num_spans):
+        x0, y0 = rng.uniform(0, 500), rng.uniform(0, 700)
+        spans.append([x0, y0, x0 + rng.uniform(5, 200), y0 + rng.uniform(5, 20)])
+    texts = list('abc xyz') + list(LINE_STOP_FLAG) + list(LINE_START_FLAG)
+    chars = []
+    for _ in range(num_chars):
+        x0, y0 = rng.uniform(0, 700), rng.uniform(0, 720)
+        chars.append({'bbox': [x0, y0, x0 + rng.uniform(1, 8), y0 + rng.uniform(4, 12)], 'c': rng.choice(texts)})
+    return spans, chars
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_assign_chars_to_spans_matches_calculate_char_in_span(seed):
+    span_bboxes, chars = _page(seed)
+    expected = []
+    for char in chars:
+        expected.append(next(
+            (i for i, span_bbox in enumerate(span_bboxes) if calculate_char_in_span(char['bbox'], span_bbox, char['c'])),
+            -1,
+        ))
+    # small chunks split the chars into several passes
+    for chunk_size in [4 * 1024 * 1024, 100]:
+        result = assign_chars_to_spans(
+            [char['bbox'] for char in chars], [char['c'] for char in chars], span_bboxes, chunk_size=chunk_size
+        )
+        assert result.tolist() == expected
+    assert sum(span_idx >= 0 for span_idx in expected) > 100
+    assert assign_chars_to_spans([], [], span_bboxes).tolist() == []
+    assert assign_chars_to_spans([char['bbox'] for char in chars[:3]], ['a'] * 3, []).tolist() == [-1] * 3
+
+
+def test_chars_to_content():
+    def char(c, x0, x1):
+        return {'c': c, 'bbox': [x0, 0, x1, 10]}
+
+    span = {'chars': [char('b', 10, 20), char('a', 0, 10), char('c', 30, 40), char(' ', 40, 44), char('ﬁ', 44, 54)]}
+    chars_to_content(span)
+    # a space is inserted after b, the gap is wider than a quarter of the median width
+    assert span == {'content': 'ab c fi'}
+
+
+def test_fill_char_in_spans():
+    spans = [
+        {'bbox': [0, 0, 100, 10], 'content': '', 'chars': [], 'height': 10, 'width': 100},
+        {'bbox': [0, 20, 100, 30], 'content': '', 'chars': [], 'height': 10, 'width': 100},
+    ]
+    chars = [{'c': c, 'bbox': [i * 18, 21, i * 18 + 17, 29]} for i, c in enumerate('hello')]
+    # the center of the stop char is outside of the span
+    chars.append({'c': '.', 'bbox': [91, 21, 110, 29]})
+    need_ocr_spans = fill_char_in_spans(spans, chars)
+    assert spans[1]['content'] == 'hello.'
+    assert need_ocr_spans == [spans[0]]
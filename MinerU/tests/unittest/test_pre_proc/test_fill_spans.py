@@ -0,0 +1,65 @@
+import copy
+import random
+
+import pytest
+
+from magic_pdf.config.ocr_content_type import BlockType, ContentType
+from magic_pdf.libs.box_index import BboxIndex
+from magic_pdf.libs.boxbase import calculate_overlap_area_in_bbox1_area_ratio
+from magic_pdf.pre_proc.ocr_dict_merge import fill_spans_in_blocks, span_block_type_compatible
+
+
+def _random_bbox(rng, max_size):
+    x0, y0 = rng.uniform(0, 600), rng.uniform(0, 800)
+    return [x0, y0, x0 + rng.uniform(0, max_size), y0 + rng.uniform(0, max_size)]
+
+
+def _page(seed, num_blocks=60, num_spans=400):
+    rng = random.Random(seed)
+    block_types = [BlockType.Text, BlockType.Title, BlockType.ImageBody, BlockType.TableBody,
+                   BlockType.InterlineEquation, BlockType.Discarded]
+    blocks = [_random_bbox(rng, 200) + [None, None, None, rng.choice(block_types), None, None, None, i]
+              for i in range(num_blocks)]
+    span_types = [ContentType.Text, ContentType.InlineEquation, ContentType.InterlineEquation,
+                  ContentType.Image, ContentType.Table]
+    spans = [{'bbox': _random_bbox(rng, 40), 'type': rng.choice(span_types), 'id': i} for i in range(num_spans)]
+    return blocks, spans
+
+
+def _fill_spans_in_blocks_brute_force(blocks, spans, radio):
+    block_with_spans = []
+    for block in blocks:
+        block_spans = [span for span in spans
+                       if calculate_overlap_area_in_bbox1_area_ratio(span['bbox'], block[0:4]) > radio
+                       and span_block_type_compatible(span['type'], block[7])]
+        block_with_spans.append(block_spans)
+        for span in block_spans:
+            spans.remove(span)
+    return block_with_spans, spans
+
+
+def test_bbox_index_query():
+    blocks, spans = _page(0)
+    index = BboxIndex(blocks)
+    for span in spans:
+        bbox = span['bbox']
+        expected = [i for i, block in enumerate(blocks)
+                    if not (block[2] < bbox[0] or block[0] > bbox[2] or block[3] < bbox[1] or block[1] > bbox[3])]
+        assert index.query(bbox) == expected
+    assert index.query([-1e6, -1e6, 1e6, 1e6]) == list(range(len(blocks)))
+    assert BboxIndex([]).query([0, 0, 1, 1]) == []
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('shared_index', [True, False])
+def test_fill_spans_in_blocks_matches_brute_force(seed, shared_index):
+    blocks, spans = _page(seed)
+    expected_block_spans, expected_spans = _fill_spans_in_blocks_brute_force(blocks, copy.deepcopy(spans), 0.5)
+
+    # the index of the page may hold more blocks than the filled ones
+    block_index = BboxIndex([[0, 0, 1000, 1000]] + blocks) if shared_index else None
+    block_with_spans, remaining_spans = fill_spans_in_blocks(blocks, spans, 0.5, block_index)
+
+    assert [block['spans'] for block in block_with_spans] == expected_block_spans
+    assert remaining_spans == expected_spans
+    assert [block['bbox'] for block in block_with_spans] == [block[0:4] for block in blocks]
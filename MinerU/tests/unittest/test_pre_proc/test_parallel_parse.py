@@ -0,0 +1,62 @@
+import copy
+import json
+
+import pytest
+
+from magic_pdf.config.enums import SupportedPdfParseMethod
+from magic_pdf.data.data_reader_writer import FileBasedDataWriter
+from magic_pdf.data.read_api import read_local_pdfs
+from magic_pdf import pdf_parse_union_core_v2
+from magic_pdf.pdf_parse_union_core_v2 import merge_pdf_info_shards, pdf_parse_union
+
+
+@pytest.mark.parametrize('parse_mode', [SupportedPdfParseMethod.TXT, SupportedPdfParseMethod.OCR])
+def test_parallel_parse_matches_serial(parse_mode, layoutreader, monkeypatch, tmp_path):
+    dataset = read_local_pdfs('tests/unittest/test_model/assets/test_02.pdf')[0]
+    with open('tests/unittest/test_model/assets/test_02.model.json') as f:
+        model_list = json.load(f)
+
+    results = {}
+    for num_workers in [1, 3]:
+        monkeypatch.setenv('MINERU_PARSE_WORKER_NUM', str(num_workers))
+        image_dir = tmp_path / str(num_workers)
+        results[num_workers] = pdf_parse_union(
+            copy.deepcopy(model_list), dataset, FileBasedDataWriter(str(image_dir)), parse_mode,
+            start_page_id=1, end_page_id=11,
+        )
+        results[num_workers]['images'] = sorted(path.name for path in image_dir.iterdir())
+
+    assert results[3] == results[1]
+    assert len(results[1]['pdf_info']) == len(dataset)
+
+
+def test_merge_pdf_info_shards_matches_whole_document(layoutreader, monkeypatch, tmp_path):
+    dataset = read_local_pdfs('tests/unittest/test_model/assets/test_02.pdf')[0]
+    with open('tests/unittest/test_model/assets/test_02.model.json') as f:
+        model_list = json.load(f)
+    image_writer = FileBasedDataWriter(str(tmp_path))
+
+    expected = pdf_parse_union(copy.deepcopy(model_list), dataset, image_writer, SupportedPdfParseMethod.TXT,
+                               start_page_id=1, end_page_id=11)
+
+    # the shards are not finalized, the paragraphs are split once over all the pages, across the shard boundaries
+    split_pages = []
+    orig_para_split = pdf_parse_union_core_v2.para_split
+
+    def para_split(pdf_info_dict):
+        split_pages.append(list(pdf_info_dict))
+        return orig_para_split(pdf_info_dict)
+
+    monkeypatch.setattr(pdf_parse_union_core_v2, 'para_split', para_split)
+    shards = [
+        (start_page_id, end_page_id, pdf_parse_union(
+            copy.deepcopy(model_list), dataset, image_writer, SupportedPdfParseMethod.TXT,
+            start_page_id=start_page_id, end_page_id=end_page_id, finalize=False,
+        )['pdf_info'])
+        for start_page_id, end_page_id in [(1, 4), (5, 5), (6, 11)]
+    ]
+    assert not split_pages
+    assert all('para_blocks' not in page_info for _, _, pdf_info in shards for page_info in pdf_info)
+
+    assert merge_pdf_info_shards(shards) == expected
+    assert split_pages == [[f'page_{page_id}' for page_id in range(len(dataset))]]
@@ -0,0 +1,67 @@
+import random
+
+import torch
+
+from magic_pdf.pdf_parse_union_core_v2 import (LAYOUTREADER_MAX_LINES, do_predict, do_predict_batch,
+                                               predict_reading_orders, sort_page_lines, split_line_chunks)
+
+
+def _boxes(seed, num):
+    rng = random.Random(seed)
+    boxes = []
+    for _ in range(num):
+        x0, y0 = rng.randint(0, 900), rng.randint(0, 980)
+        boxes.append([x0, y0, x0 + rng.randint(1, 99), y0 + rng.randint(1, 19)])
+    return boxes
+
+
+def _two_columns(num_lines):
+    """Lines of a two column page, in reading order."""
+    per_column = num_lines // 2
+    line_spacing = 1000 / per_column
+    return [
+        [x0, round(i * line_spacing), x0 + 400, round(i * line_spacing + line_spacing * 0.7)]
+        for x0 in (50, 550) for i in range(per_column)
+    ]
+
+
+@torch.no_grad()
+def test_do_predict_batch_matches_do_predict(layoutreader):
+    boxes_list = [_boxes(seed, num) for seed, num in enumerate([5, 37, 1, 0, 200])]
+    assert do_predict_batch(boxes_list, layoutreader) == [do_predict(boxes, layoutreader) for boxes in boxes_list]
+
+
+def test_split_line_chunks():
+    boxes = _two_columns(600)
+    assert split_line_chunks(boxes[:LAYOUTREADER_MAX_LINES]) == [list(range(LAYOUTREADER_MAX_LINES))]
+
+    chunks = split_line_chunks(boxes)
+    assert len(chunks) == 3
+    assert all(len(chunk) <= LAYOUTREADER_MAX_LINES for chunk in chunks)
+    # the chunks follow the columns
+    assert sum(chunks, []) == list(range(600))
+
+    # boxes without width are lost by xycut, they are kept in the chunks
+    boxes[10][2] = boxes[10][0]
+    assert sorted(sum(split_line_chunks(boxes), [])) == list(range(600))
+
+
+def test_predict_reading_orders(layoutreader):
+    boxes_list = [_boxes(0, 30), [], _two_columns(500), _boxes(1, 120)]
+    page_orders = predict_reading_orders(boxes_list, batch_size=2)
+
+    assert [sorted(orders) for orders in page_orders] == [list(range(len(boxes))) for boxes in boxes_list]
+    with torch.no_grad():
+        assert page_orders[0] == do_predict(boxes_list[0], layoutreader)
+        # long pages are sorted chunk by chunk
+        chunks = split_line_chunks(boxes_list[2])
+        expected = []
+        for chunk in chunks:
+            expected += [chunk[i] for i in do_predict([boxes_list[2][i] for i in chunk], layoutreader)]
+        assert page_orders[2] == expected
+
+
+def test_sort_page_lines(layoutreader):
+    page_line_lists = [[[0, 0, 10, 5], [0, 10, 10, 15], [20, 0, 30, 5]], [[0, 0, 50, 10]], []]
+    sorted_lists = sort_page_lines(page_line_lists, [(100, 50), (50, 20), (100, 100)])
+    assert [sorted(lines) for lines in sorted_lists] == [sorted(lines) for lines in page_line_lists]
@@ -0,0 +1,66 @@
+import json
+import os
+
+import pytest
+
+from magic_pdf.config.make_content_config import MakeMode
+from magic_pdf.model.model_json_cache import ModelJsonCache
+from magic_pdf.operators.models import InferenceResult
+from magic_pdf.tools import common
+
+
+@pytest.fixture(autouse=True)
+def _use_inside_model(monkeypatch):
+    import magic_pdf.model as model_config
+    monkeypatch.setattr(model_config, '__use_inside_model__', True)
+
+
+def test_model_json_cache(tmp_path):
+    cache = ModelJsonCache(str(tmp_path), max_bytes=300)
+    key = ModelJsonCache.make_key(b'pdf', ocr=False)
+    assert key != ModelJsonCache.make_key(b'pdf', ocr=True)
+    assert key != ModelJsonCache.make_key(b'pdf', ocr=False, lang='en')
+    assert key != ModelJsonCache.make_key(b'other pdf', ocr=False)
+
+    assert cache.get(key) is None
+    model_list = [{'layout_dets': [{'category_id': 1, 'score': 0.9}], 'page_info': {'page_no': 0}}] * 2
+    cache.put(key, model_list)
+    assert cache.get(key) == model_list
+
+    # the least recently used entries are evicted above max_bytes
+    cache.put('other', model_list)
+    cache.put('last', model_list)
+    assert cache.get(key) is None and cache.get('last') == model_list
+
+    assert not ModelJsonCache().enabled
+    assert ModelJsonCache().get(key) is None
+
+
+def test_do_parse_reuses_model_json(layoutreader, monkeypatch, tmp_path):
+    with open('tests/unittest/test_model/assets/test_02.pdf', 'rb') as f:
+        pdf_bytes = f.read()
+    with open('tests/unittest/test_model/assets/test_02.model.json') as f:
+        model_list = json.load(f)
+
+    inferred = []
+
+    def fake_doc_analyze(dataset, ocr=False, **kwargs):
+        inferred.append(ocr)
+        return InferenceResult(json.loads(json.dumps(model_list)), dataset)
+
+    monkeypatch.setattr(common, 'doc_analyze', fake_doc_analyze)
+    monkeypatch.setenv('MINERU_MODEL_JSON_CACHE_DIR', str(tmp_path / 'cache'))
+
+    def parse(output_dir, f_make_md_mode):
+        common._do_parse(str(tmp_path / output_dir), 'fake', pdf_bytes, [], 'txt', f_draw_span_bbox=False,
+                         f_draw_layout_bbox=False, f_make_md_mode=f_make_md_mode)
+        with open(tmp_path / output_dir / 'fake' / 'txt' / 'fake_model.json') as f:
+            return json.load(f)
+
+    assert parse('first', MakeMode.MM_MD) == model_list
+    assert inferred == [False]
+
+    # only the post-processing changed, the inference is skipped
+    assert parse('second', MakeMode.NLP_MD) == model_list
+    assert inferred == [False]
+    assert os.path.exists(tmp_path / 'second' / 'fake' / 'txt' / 'fake.md')
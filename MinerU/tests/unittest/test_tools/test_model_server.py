@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+from magic_pdf.data.read_api import read_local_pdfs
+from magic_pdf.tools import model_server
+from magic_pdf.tools.model_server import (MemoryDataWriter, ModelServer, ModelServerClient, ModelServerError,
+                                          get_model_server_client)
+
+
+def _fake_analyze(pdf_bytes, ocr, lang=None, layout_model=None, formula_enable=None, table_enable=None,
+                  start_page_id=0, end_page_id=None):
+    if lang == 'fail':
+        raise ValueError('bad lang')
+    model_list = [{'layout_dets': [], 'page_info': {'page_no': 0, 'width': 10, 'height': 20}}]
+    pipe_res = {'pdf_info': [], '_parse_type': 'ocr' if ocr else 'txt', 'size': len(pdf_bytes)}
+    images = {'a.jpg': b'\xff\xd8' + bytes(range(256)) * 100, 'b.jpg': b'', 'c.jpg': b'c'}
+    return model_list, pipe_res, images
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    socket_path = str(tmp_path / 'server.sock')
+    monkeypatch.setenv('MINERU_MODEL_SERVER_SOCKET', socket_path)
+    server = ModelServer(analyze_fn=_fake_analyze)
+    server.start()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join(timeout=10)
+
+
+def test_model_server_analyze(server):
+    dataset = read_local_pdfs('tests/unittest/test_model/assets/test_01.pdf')[0]
+    client = get_model_server_client()
+    assert client is not None and client.ping()['jobs'] == 0
+
+    image_writer = MemoryDataWriter()
+    infer_result, pipe_result = client.analyze(dataset, image_writer, ocr=True)
+    assert infer_result.get_infer_res()[0]['page_info'] == {'page_no': 0, 'width': 10, 'height': 20}
+    assert pipe_result._pipe_res == {'pdf_info': [], '_parse_type': 'ocr', 'size': len(dataset.data_bits())}
+    assert image_writer.files == _fake_analyze(b'', True)[2]
+    assert client.ping()['jobs'] == 1
+
+    # the errors of the jobs are raised by the client, the server keeps running
+    with pytest.raises(ModelServerError, match='bad lang'):
+        client.analyze(dataset, image_writer, ocr=False, lang='fail')
+    assert client.ping() is not None
+
+    # only one server per socket
+    with pytest.raises(ModelServerError):
+        ModelServer(server.socket_path).start()
+
+
+def test_model_server_stop(server):
+    ModelServerClient().shutdown()
+    for _ in range(100):
+        if get_model_server_client() is None:
+            break
+        threading.Event().wait(0.05)
+    assert get_model_server_client() is None
+
+
+def test_no_model_server(tmp_path, monkeypatch):
+    socket_path = tmp_path / 'missing.sock'
+    monkeypatch.setenv('MINERU_MODEL_SERVER_SOCKET', str(socket_path))
+    assert model_server.get_model_server_socket() == str(socket_path)
+    assert get_model_server_client() is None
+    # a stale socket file left by a dead server
+    socket_path.touch()
+    assert get_model_server_client() is None
@@ -10,6 +10,7 @@ from magic_pdf.libs.boxbase import (__is_overlaps_y_exceeds_threshold,
                                     _is_vertical_full_overlap, _left_intersect,
                                     _right_intersect, bbox_distance,
                                     bbox_relative_pos, calculate_iou,
+                                    calculate_iou_matrix,
                                     calculate_overlap_area_2_minbox_area_ratio,
                                     calculate_overlap_area_in_bbox1_area_ratio,
                                     find_bottom_nearest_text_bbox,
@@ -287,6 +288,19 @@ def test_calculate_iou(box1: tuple, box2: tuple, target_num: float) -> None:
     assert target_num == calculate_iou(box1, box2)
 
 
+def test_calculate_iou_matrix() -> None:
+    boxes = [(88, 81, 222, 173), (60, 221, 123, 358), (109, 68, 182, 196), (175, 138, 277, 213),
+             (109, 126, 204, 245), (110, 127, 232, 206), (76, 140, 154, 277), (121, 277, 192, 384),
+             (10, 10, 10, 20), (10.5, 11.2, 80.3, 90.7)]
+    iou = calculate_iou_matrix(boxes)
+    assert iou.shape == (len(boxes), len(boxes))
+    for i, box1 in enumerate(boxes):
+        for j, box2 in enumerate(boxes):
+            assert iou[i, j] == calculate_iou(box1, box2)
+    assert calculate_iou_matrix(boxes[:2], boxes[2:5]).tolist() == iou[:2, 2:5].tolist()
+    assert calculate_iou_matrix([]).shape == (0, 0)
+
+
 # 计算box1和box2的重叠面积占最小面积的box的比例
 @pytest.mark.parametrize('box1, box2, target_num', [
     # (None, None, "Error"),  # Error